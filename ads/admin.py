@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Ad, ExchangeProposal
+from .models import Ad, Category, Condition, ExchangeProposal
 
 admin.site.register(Ad)
 admin.site.register(ExchangeProposal)
+admin.site.register(Category)
+admin.site.register(Condition)
@@ -0,0 +1,71 @@
+"""Read API объявлений: JSON-страницы по курсору и потоковая NDJSON-выгрузка.
+
+Строки читаются через values()/values_list(), без создания экземпляров Ad,
+а выгрузка идет через QuerySet.iterator(chunk_size), поэтому память не
+зависит от числа объявлений.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Имя поля в ответе -> путь в ORM.
+API_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'image_url': 'image_url',
+    'category': 'category',
+    'condition': 'condition',
+    'user': 'user__username',
+    'created_at': 'created_at',
+    'exchanged_at': 'exchanged_at',
+}
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_fields(value):
+    """Список полей из параметра ?fields=a,b; ValueError для неизвестных."""
+    if not value:
+        return list(API_FIELDS)
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(API_FIELDS)}.')
+    return fields
+
+
+def parse_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return API_PAGE_SIZE
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+def project(queryset, fields):
+    """values() только с нужными столбцами плюс поля сортировки для курсора."""
+    ordering = [name.lstrip('-') for name in queryset.query.order_by] + ['id']
+    return queryset.values(*dict.fromkeys([API_FIELDS[name] for name in fields] + ordering))
+
+
+def serialize_row(row, fields):
+    return {name: row[API_FIELDS[name]] for name in fields}
+
+
+def dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def stream_ndjson(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор NDJSON: одна строка на объявление, отдается блоками по chunk_size строк."""
+    paths = [API_FIELDS[name] for name in fields]
+    lines = []
+    for row in queryset.values_list(*paths).iterator(chunk_size=chunk_size):
+        lines.append(dumps(dict(zip(fields, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,132 @@
+"""Перенос закрытых предложений и давно обмененных объявлений в архив.
+
+Списки читают и сортируют горячие таблицы ads_exchangeproposal и ads_ad,
+поэтому закрытые предложения и обмененные объявления старше срока хранения
+переносятся в ArchivedProposal и ArchivedAd. Пачка id переносится одним
+INSERT ... SELECT и одним DELETE в своей транзакции, между пачками делается
+пауза, как в ads.purge. Объявление уходит в архив вместе со всеми своими
+предложениями и только если ожидающих среди них нет.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import changelog
+from .models import Ad, ArchivedAd, ArchivedProposal, ExchangeProposal
+from .signals import ads_deleted
+
+PROPOSAL_COLUMNS = (
+    'id, ad_sender_id, ad_receiver_id, sender_user_id, receiver_user_id, sender_title, receiver_title, '
+    'comment, status, created_at, updated_at, archived_at'
+)
+AD_COLUMNS = (
+    'id, user_id, title, description, image_url, category, condition, external_id, '
+    'created_at, updated_at, exchanged_at, archived_at'
+)
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return {
+        'proposal': quote(ExchangeProposal._meta.db_table),
+        'ad': quote(Ad._meta.db_table),
+        'archived_proposal': quote(ArchivedProposal._meta.db_table),
+        'archived_ad': quote(ArchivedAd._meta.db_table),
+    }
+
+
+def _pause(pause):
+    if pause:
+        time.sleep(pause)
+
+
+def _move_proposals(condition, params, chunk_size, pause, stats):
+    """Переносит закрытые предложения, подходящие под condition, пачками по chunk_size."""
+    tables = _tables()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM {tables["proposal"]} proposal '
+                f"WHERE NOT (status = 'pending') AND {condition} LIMIT %s",
+                [*params, chunk_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f'INSERT INTO {tables["archived_proposal"]} ({PROPOSAL_COLUMNS}) '
+                f'SELECT proposal.id, proposal.ad_sender_id, proposal.ad_receiver_id, sender.user_id, receiver.user_id, '
+                f'sender.title, receiver.title, proposal.comment, proposal.status, proposal.created_at, '
+                f'proposal.updated_at, %s FROM {tables["proposal"]} proposal '
+                f'JOIN {tables["ad"]} sender ON sender.id = proposal.ad_sender_id '
+                f'JOIN {tables["ad"]} receiver ON receiver.id = proposal.ad_receiver_id '
+                f'WHERE proposal.id IN ({placeholders})',
+                [now, *ids],
+            )
+            cursor.execute(f'DELETE FROM {tables["proposal"]} WHERE id IN ({placeholders})', ids)
+            changelog.record(ExchangeProposal, ids, 'delete')
+            stats['proposals'] += len(ids)
+        stats['transactions'] += 1
+        _pause(pause)
+
+
+def archive_proposals(cutoff, chunk_size=1000, pause=0.0, stats=None):
+    """Переносит предложения, закрытые (по updated_at) раньше cutoff."""
+    stats = Counter() if stats is None else stats
+    _move_proposals(
+        'updated_at < %s', [connection.ops.adapt_datetimefield_value(cutoff)], chunk_size, pause, stats
+    )
+    return stats
+
+
+def stale_ads(cutoff):
+    """Объявления, обмененные раньше cutoff, без ожидающих предложений."""
+    pending = ExchangeProposal.objects.filter(status='pending')
+    return Ad.objects.filter(
+        ~Exists(pending.filter(ad_sender=OuterRef('pk'))),
+        ~Exists(pending.filter(ad_receiver=OuterRef('pk'))),
+        exchanged_at__lt=cutoff,
+    ).order_by('exchanged_at', 'id')
+
+
+def archive_ads(cutoff, chunk_size=1000, pause=0.0, stats=None):
+    """Переносит объявления из stale_ads(cutoff) вместе с их предложениями."""
+    stats = Counter() if stats is None else stats
+    tables = _tables()
+    while True:
+        ads = list(stale_ads(cutoff).only('id', 'category_ref_id', 'condition_ref_id')[:chunk_size])
+        if not ads:
+            return stats
+        ad_ids = [ad.pk for ad in ads]
+        placeholders = ', '.join(['%s'] * len(ad_ids))
+        for column in ('ad_sender_id', 'ad_receiver_id'):
+            _move_proposals(f'{column} IN ({placeholders})', ad_ids, chunk_size, pause, stats)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Индексы поиска и похожих, счетчики справочников и кэш списка — как при удалении.
+            ads_deleted.send(sender=Ad, ads=ads)
+            cursor.execute(
+                f'INSERT INTO {tables["archived_ad"]} ({AD_COLUMNS}) '
+                f'SELECT id, user_id, title, description, image_url, category, condition, external_id, '
+                f'created_at, updated_at, exchanged_at, %s FROM {tables["ad"]} WHERE id IN ({placeholders})',
+                [now, *ad_ids],
+            )
+            cursor.execute(f'DELETE FROM {tables["ad"]} WHERE id IN ({placeholders})', ad_ids)
+            stats['ads'] += len(ad_ids)
+        stats['transactions'] += 1
+        _pause(pause)
+
+
+def archive(older_than, chunk_size=1000, pause=0.0):
+    """Переносит в архив все, что старше older_than секунд; Counter: proposals, ads, transactions."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    stats = Counter()
+    archive_proposals(cutoff, chunk_size, pause, stats)
+    archive_ads(cutoff, chunk_size, pause, stats)
+    return stats
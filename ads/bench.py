@@ -0,0 +1,198 @@
+"""Общие помощники для бенчмарков (management-команды bench_*).
+
+Бенчмарки запускаются на отдельной тестовой базе, которая создается
+и удаляется так же, как при `manage.py test`.
+"""
+import contextlib
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.test.utils import setup_databases, teardown_databases
+
+from .models import Ad, Category, Condition, ExchangeProposal, catalogue_key, make_excerpt
+from .search import get_backend
+from .signals import ads_created_in_bulk, proposals_created_in_bulk
+
+SYLLABLES = [
+    'ка', 'ро', 'ми', 'на', 'те', 'ло', 'ви', 'са', 'пу', 'зе',
+    'шо', 'ры', 'до', 'га', 'би', 'ле', 'мо', 'ту', 'кре', 'сто',
+]
+CATEGORIES = [
+    'Электроника', 'Мебель', 'Книги', 'Одежда', 'Игры',
+    'Инструменты', 'Спорт', 'Детские товары', 'Техника', 'Музыка',
+]
+CONDITIONS = ['Новое', 'Отличное', 'Хорошее', 'Б/У', 'Требует ремонта']
+# Доли категорий и состояний: несколько популярных и длинный хвост.
+CATEGORY_WEIGHTS = [1 / rank for rank in range(1, len(CATEGORIES) + 1)]
+CONDITION_WEIGHTS = [10, 25, 35, 25, 5]
+
+
+@contextlib.contextmanager
+def benchmark_databases(aliases=None):
+    old_config = setup_databases(verbosity=0, interactive=False, aliases=aliases)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+class TextGenerator:
+    """Генератор текста с распределением слов, близким к закону Ципфа."""
+
+    def __init__(self, rng, vocabulary_size=5000):
+        self.rng = rng
+        self.vocabulary = make_vocabulary(vocabulary_size, rng)
+        self.weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+
+    def words(self, count):
+        return self.rng.choices(self.vocabulary, weights=self.weights, k=count)
+
+    def sentence(self, min_words, max_words):
+        return ' '.join(self.words(self.rng.randint(min_words, max_words))).capitalize()
+
+
+def seed_users(count, prefix='bench', password=None):
+    # Хеш считается один раз: PBKDF2 на каждого пользователя занял бы минуты.
+    password = make_password(password)
+    users = User.objects.bulk_create(
+        [User(username=f'{prefix}{i}', password=password) for i in range(count)], batch_size=1000
+    )
+    # pk заполняет RETURNING (SQLite 3.35+, PostgreSQL); выборка по префиксу
+    # захватила бы и других пользователей: 'benchmark' начинается с 'bench'.
+    return [user.pk for user in users]
+
+
+def seed_ads(count, user_ids, rng=None, text=None, batch_size=5000, reindex=True, signals=False):
+    """Создает объявления пачками с заполненными ссылками на справочники.
+
+    С signals=True после каждой пачки отправляется ads_created_in_bulk
+    (поисковый индекс, счетчики справочников, индекс похожих), иначе
+    поисковый индекс при reindex перестраивается в конце.
+    """
+    rng = rng or random.Random(0)
+    text = text or TextGenerator(rng)
+    categories = Category.for_names(CATEGORIES)
+    conditions = Condition.for_names(CONDITIONS)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        ads = []
+        for _ in range(size):
+            category = rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0]
+            condition = rng.choices(CONDITIONS, CONDITION_WEIGHTS)[0]
+            title, description = text.sentence(2, 6), text.sentence(20, 60)
+            ads.append(Ad(
+                user_id=rng.choice(user_ids),
+                title=title,
+                description=description,
+                excerpt=make_excerpt(description),
+                category=category,
+                condition=condition,
+                category_ref=categories[catalogue_key(category)],
+                condition_ref=conditions[catalogue_key(condition)],
+            ))
+        Ad.objects.bulk_create(ads)
+        if signals:
+            ads_created_in_bulk.send(sender=Ad, ads=ads)
+        created += size
+    if reindex and not signals:
+        get_backend().rebuild()
+    return text
+
+
+def seed_proposals(count, rng=None, skew=1.1, pending_share=0.8, batch_size=5000):
+    """Создает предложения с популярностью получателей по закону Ципфа.
+
+    Объявление ранга r получает предложения с весом 1 / r ** skew,
+    отправитель выбирается равномерно среди объявлений других пользователей.
+    """
+    rng = rng or random.Random(0)
+    ads = list(Ad.objects.values_list('pk', 'user_id'))
+    receivers = ads[:]
+    rng.shuffle(receivers)
+    cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(receivers) + 1)))
+    created = 0
+    while created < count:
+        batch = []
+        while len(batch) < min(batch_size, count - created):
+            receiver = rng.choices(receivers, cum_weights=cum_weights)[0]
+            sender = rng.choice(ads)
+            if sender[1] == receiver[1]:
+                continue
+            batch.append(ExchangeProposal(
+                ad_sender_id=sender[0],
+                ad_receiver_id=receiver[0],
+                status='pending' if rng.random() < pending_share else 'rejected',
+            ))
+        ExchangeProposal.objects.bulk_create(batch)
+        proposals_created_in_bulk.send(sender=ExchangeProposal, proposals=batch)
+        created += len(batch)
+
+
+def seed_barter(users, ads, proposals, rng=None, skew=1.1, password=None, prefix='user'):
+    """Полный набор данных: пользователи, объявления и предложения со всеми индексами."""
+    rng = rng or random.Random(0)
+    user_ids = seed_users(users, prefix=prefix, password=password)
+    seed_ads(ads, user_ids, rng=rng, signals=True)
+    seed_proposals(proposals, rng=rng, skew=skew)
+    return user_ids
+
+
+def measure(func, repeat=20, warmup=2):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        'min': min(timings),
+        'p50': percentile(timings, 0.50),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+        'mean': statistics.fmean(timings),
+    }
+
+
+def find_regressions(baseline, results, tolerance=0.25):
+    """Список (маршрут, описание) ухудшений results относительно baseline.
+
+    Регрессия — p95 выше базового больше чем на tolerance или больше
+    SQL-запросов на запрос.
+    """
+    regressions = []
+    for route, current in sorted(results.items()):
+        base = baseline.get(route)
+        if base is None:
+            continue
+        if current['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append((route, f'p95 {base["p95"]:.2f} -> {current["p95"]:.2f} мс'))
+        if current['queries'] > base['queries']:
+            regressions.append((route, f'запросов {base["queries"]} -> {current["queries"]}'))
+    return regressions
+
+
+def format_timing(stats):
+    return 'p50 {p50:8.2f} мс  p95 {p95:8.2f} мс  min {min:8.2f} мс'.format(**stats)
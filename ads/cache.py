@@ -0,0 +1,140 @@
+"""Кэш публичного списка объявлений.
+
+Все ключи содержат номер поколения объявлений (ads:generation), который
+увеличивается при любом сохранении или удалении Ad, поэтому старые записи
+не удаляются явно, а просто перестают читаться и истекают по таймауту.
+Работает с любым бэкендом Django: locmem/file в тестах, Redis/memcached в проде.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import catalogue_key
+
+GENERATION_KEY = 'ads:generation'
+HITS_KEY = 'ads:cache:hits'
+MISSES_KEY = 'ads:cache:misses'
+LIST_PARAMS = ('q', 'category', 'condition', 'cursor')
+
+
+def get_cache():
+    return caches[getattr(settings, 'ADS_CACHE_ALIAS', 'default')]
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Время в миллисекундах: после вытеснения ключа поколение не повторится.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def aget_generation():
+    cache = get_cache()
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def _bump():
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+
+def bump_generation():
+    # Сразу — чтобы текущий запрос не прочитал устаревшую страницу, и после
+    # коммита — чтобы страница, отрисованная другим запросом до коммита,
+    # не осталась в кэше под новым поколением.
+    _bump()
+    transaction.on_commit(_bump)
+
+
+async def _acount(key):
+    cache = get_cache()
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def normalize_list_params(params):
+    """Параметры списка, от которых зависит страница, без лишних пробелов.
+
+    Категория и состояние приводятся к ключу справочника (catalogue_key).
+    Страница строится только из этих значений, поэтому запросы с другим
+    порядком параметров или посторонними параметрами получают один ключ.
+    """
+    normalized = {}
+    for name in LIST_PARAMS:
+        value = ' '.join(params.get(name, '').split())
+        if name in ('category', 'condition'):
+            value = catalogue_key(value)
+        if value:
+            normalized[name] = value
+    return normalized
+
+
+def _params_digest(params):
+    normalized = '&'.join(f'{name}={value}' for name, value in params.items())
+    return hashlib.md5(normalized.encode()).hexdigest()
+
+
+def ad_list_cache_key(params):
+    return f'ads:list:{get_generation()}:{_params_digest(params)}'
+
+
+async def aad_list_cache_key(params):
+    return f'ads:list:{await aget_generation()}:{_params_digest(params)}'
+
+
+def get_page(key):
+    content = get_cache().get(key)
+    _count(MISSES_KEY if content is None else HITS_KEY)
+    return content
+
+
+async def aget_page(key):
+    content = await get_cache().aget(key)
+    await _acount(MISSES_KEY if content is None else HITS_KEY)
+    return content
+
+
+def set_page(key, content):
+    get_cache().set(key, content, getattr(settings, 'ADS_LIST_CACHE_TIMEOUT', 300))
+
+
+async def aset_page(key, content):
+    await get_cache().aset(key, content, getattr(settings, 'ADS_LIST_CACHE_TIMEOUT', 300))
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'generation': get_generation(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
@@ -0,0 +1,219 @@
+"""Журнал изменений объявлений и предложений для внешних потребителей.
+
+Каждое сохранение, удаление и изменение через сырой UPDATE (статусы,
+обмен, пометка удаленным) добавляет в ChangeLogEntry строку (модель, id,
+действие) в той же транзакции, что и само изменение. Потребитель читает
+журнал по курсору (created_at, id) и получает текущее состояние
+изменившихся строк, поэтому синхронизация стоит O(изменений), а не
+O(таблицы). Начальная синхронизация по-прежнему делается полной выгрузкой.
+
+Строка, которой уже нет или которая скрыта (помеченное удаленным
+объявление и его предложения), выдается как удаление. Поэтому старые
+записи, после которых есть более новые по тому же объекту, ничего не
+добавляют и удаляются уплотнением (compact).
+"""
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import api
+from .models import Ad, ChangeLogEntry, ExchangeProposal
+from .pagination import decode_cursor, encode_cursor
+
+CHANGES_PAGE_SIZE = 1000
+CHANGES_MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 500
+
+
+def _table():
+    return connection.ops.quote_name(ChangeLogEntry._meta.db_table)
+
+
+def _now():
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def record(model, object_ids, action='upsert'):
+    """Записывает изменение объектов model с id из object_ids."""
+    now = _now()
+    rows = [(model._meta.model_name, object_id, action, now) for object_id in dict.fromkeys(object_ids)]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {_table()} (model, object_id, action, created_at) VALUES (%s, %s, %s, %s)', rows
+        )
+
+
+def record_ad_proposals(ad_ids, action='delete'):
+    """Записывает изменение всех предложений с участием ad_ids одним INSERT ... SELECT."""
+    ad_ids = list(ad_ids)
+    if not ad_ids:
+        return
+    proposal_table = connection.ops.quote_name(ExchangeProposal._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ad_ids))
+    model, now = ExchangeProposal._meta.model_name, _now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table()} (model, object_id, action, created_at) '
+            f'SELECT %s, id, %s, %s FROM {proposal_table} WHERE ad_sender_id IN ({placeholders}) '
+            f'UNION '
+            f'SELECT %s, id, %s, %s FROM {proposal_table} WHERE ad_receiver_id IN ({placeholders})',
+            [model, action, now, *ad_ids, model, action, now, *ad_ids],
+        )
+
+
+def _sources():
+    """Модель журнала -> (видимые строки, столбцы в выдаче)."""
+    return {
+        Ad._meta.model_name: (
+            Ad.objects.all(),
+            ('id', 'user_id', 'title', 'description', 'image_url', 'category', 'condition',
+             'created_at', 'updated_at', 'exchanged_at'),
+        ),
+        ExchangeProposal._meta.model_name: (
+            ExchangeProposal.objects.filter(ad_sender__deleted_at__isnull=True, ad_receiver__deleted_at__isnull=True),
+            ('id', 'ad_sender_id', 'ad_receiver_id', 'comment', 'status', 'created_at', 'updated_at'),
+        ),
+    }
+
+
+def parse_cursor(token):
+    """(created_at, seq) из курсора; None для пустого; ValueError для битого."""
+    if not token:
+        return None
+    decoded = decode_cursor(token)
+    if decoded is None or len(decoded[0]) != 2 or not isinstance(decoded[0][0], datetime) \
+            or not isinstance(decoded[0][1], int):
+        raise ValueError('Неверный курсор.')
+    return tuple(decoded[0])
+
+
+def make_cursor(entry):
+    return encode_cursor([entry[1], entry[0]])
+
+
+def parse_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return CHANGES_PAGE_SIZE
+    return max(1, min(size, CHANGES_MAX_PAGE_SIZE))
+
+
+def cursor_expired(position):
+    """Удаления старше срока хранения уже могли быть уплотнены: такой курсор не продолжить."""
+    retention = timedelta(seconds=settings.ADS_CHANGELOG_TOMBSTONE_RETENTION)
+    return position is not None and position[0] < timezone.now() - retention
+
+
+def entries_since(position, limit=CHANGES_PAGE_SIZE):
+    """До limit записей после курсора position: [(seq, created_at, model, object_id, action)].
+
+    Записи моложе ADS_CHANGELOG_SETTLE секунд не выдаются: транзакция,
+    начатая раньше, еще может закоммитить запись с меньшим created_at.
+
+    Это окно — единственная защита: created_at ставится при записи, а не при
+    коммите, и запись транзакции, которая после нее оставалась открытой
+    дольше ADS_CHANGELOG_SETTLE, окажется позади курсоров, уже прочитавших
+    более новые записи, и эти потребители ее пропустят. В SQLite пишущие
+    транзакции (BEGIN IMMEDIATE) идут по одной и чужие записи за это время не
+    коммитятся; в базах с параллельными писателями окно должно быть больше
+    самой долгой пишущей транзакции.
+    """
+    entries = ChangeLogEntry.objects.filter(
+        created_at__lte=timezone.now() - timedelta(seconds=settings.ADS_CHANGELOG_SETTLE)
+    )
+    if position is not None:
+        created_at, seq = position
+        entries = entries.filter(Q(created_at__gte=created_at), ~Q(created_at=created_at, id__lte=seq))
+    return list(
+        entries.order_by('created_at', 'id').values_list('id', 'created_at', 'model', 'object_id', 'action')[:limit]
+    )
+
+
+def current_states(entries):
+    """{(модель, id): словарь столбцов} для записей entries; один запрос на модель."""
+    ids = {}
+    for _, _, model, object_id, action in entries:
+        if action == 'upsert':
+            ids.setdefault(model, set()).add(object_id)
+    sources = _sources()
+    states = {}
+    for model, object_ids in ids.items():
+        queryset, columns = sources[model]
+        for row in queryset.filter(pk__in=object_ids).values(*columns):
+            states[model, row['id']] = row
+    return states
+
+
+def change_line(entry, states):
+    seq, created_at, model, object_id, action = entry
+    data = states.get((model, object_id)) if action == 'upsert' else None
+    return api.dumps({
+        'seq': seq,
+        'ts': created_at,
+        'model': model,
+        'id': object_id,
+        'action': 'upsert' if data is not None else 'delete',
+        'data': data,
+    })
+
+
+def stream_ndjson(entries, chunk_size=STREAM_CHUNK_SIZE):
+    """Генератор NDJSON: одна строка на запись журнала, отдается блоками по chunk_size строк.
+
+    Состояние строк читается одним запросом на модель для всей страницы,
+    поэтому число запросов не зависит от ее размера.
+    """
+    states = current_states(entries)
+    for start in range(0, len(entries), chunk_size):
+        yield '\n'.join(change_line(entry, states) for entry in entries[start:start + chunk_size]) + '\n'
+
+
+def _delete_chunks(condition, params, batch_size, pause):
+    table = _table()
+    deleted = statements = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} entry WHERE {condition} LIMIT %s)',
+                [*params, batch_size],
+            )
+            count = cursor.rowcount
+        deleted += count
+        statements += 1
+        if pause:
+            time.sleep(pause)
+        if count < batch_size:
+            return deleted, statements
+
+
+def compact(older_than, tombstones_older_than, batch_size=1000, pause=0.0):
+    """Уплотняет журнал пачками по batch_size строк в коротких транзакциях.
+
+    Удаляются записи старше older_than секунд, после которых есть запись
+    о том же объекте, и удаления старше tombstones_older_than секунд.
+    Возвращает Counter: superseded, tombstones, statements.
+    """
+    table = _table()
+    now = timezone.now()
+    adapt = connection.ops.adapt_datetimefield_value
+    stats = Counter()
+    stats['superseded'], statements = _delete_chunks(
+        f'entry.created_at < %s AND EXISTS (SELECT 1 FROM {table} newer '
+        f'WHERE newer.model = entry.model AND newer.object_id = entry.object_id AND newer.id > entry.id)',
+        [adapt(now - timedelta(seconds=older_than))], batch_size, pause,
+    )
+    stats['statements'] += statements
+    stats['tombstones'], statements = _delete_chunks(
+        "entry.created_at < %s AND entry.action = 'delete'",
+        [adapt(now - timedelta(seconds=tombstones_older_than))], batch_size, pause,
+    )
+    stats['statements'] += statements
+    return stats
@@ -0,0 +1,122 @@
+"""Маршрутизация чтения на реплику и настройка соединений SQLite.
+
+Чтение уходит на ADS_READ_DATABASE только внутри представлений с
+@replica_reads; все остальное, включая запись, идет в default. После
+изменяющего запроса ReplicaStickinessMiddleware ставит cookie, и пока она
+жива, запросы пользователя читают из default: так он видит свои изменения,
+даже если реплика отстает.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+STICKY_COOKIE = 'ads_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_APPS = ('auth', 'sessions')
+
+read_database = ContextVar('ads_read_database', default=None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        # Сессия только что вошедшего пользователя может еще не дойти до реплики:
+        # он оказался бы анонимным.
+        if model._meta.app_label in PRIMARY_APPS:
+            return None
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        # Экземпляры, прочитанные с реплики, сохраняются в основную базу.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы.
+        return True
+
+
+def read_alias(request):
+    """Алиас для чтения в этом запросе или None, если читать из default."""
+    alias = settings.ADS_READ_DATABASE
+    if not alias or request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES:
+        return None
+    return alias
+
+
+def replica_reads(view_func):
+    """Направляет чтение представления на реплику (см. read_alias)."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            token = read_database.set(read_alias(request))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                read_database.reset(token)
+    else:
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            token = read_database.set(read_alias(request))
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                read_database.reset(token)
+    return wrapper
+
+
+def read_from_primary():
+    """До конца текущего представления с @replica_reads читать из default.
+
+    Значение сбрасывает сам replica_reads после ответа.
+    """
+    read_database.set(None)
+
+
+def reading_from_replica():
+    """Читает ли текущее представление с реплики."""
+    return read_database.get() is not None
+
+
+class ReplicaStickinessMiddleware:
+    """Ставит cookie STICKY_COOKIE в ответ на изменяющий запрос."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def stick(self, request, response):
+        if settings.ADS_READ_DATABASE and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.ADS_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.stick(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.stick(request, await self.get_response(request))
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Выполняет PRAGMA из ADS_SQLITE_PRAGMAS на каждом новом соединении с default.
+
+    Реплику ведет внешний процесс: journal_mode и прочее задает он.
+    """
+    if connection.vendor != 'sqlite' or connection.alias != DEFAULT_DB_ALIAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.ADS_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
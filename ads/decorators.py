@@ -0,0 +1,10 @@
+def query_budget(max_queries):
+    """Объявляет верхнюю границу числа SQL-запросов представления.
+
+    Граница проверяется тестами (см. ads.testing.assert_max_queries) для
+    каждого маршрута из ads/urls.py и не зависит от объема данных.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
@@ -0,0 +1,107 @@
+"""Валидаторы ETag для списков: condition() отвечает 304, не выполняя основной
+запрос и не отрисовывая шаблон.
+
+Валидатор — дешевая сводка всего, от чего зависит страница. Для списка
+объявлений это поколение из ads.cache (меняется при любом изменении Ad),
+параметры фильтра, пользователь и его счетчики из ads.inbox — все из кэша.
+Для списка предложений — число предложений пользователя и наибольший
+updated_at предложений и их объявлений: два агрегата, отправленные и
+полученные, в одном запросе через UNION ALL (OR по двум соединениям не
+использует индексы).
+В сводку страниц с формами входит и секрет CSRF: после повторного входа он
+меняется, и страница со старым токеном не должна остаться в кэше браузера.
+Last-Modified не используется: удаление строки не сдвигает максимум времени,
+а число строк в ETag это учитывает.
+Асинхронные представления оборачиваются в async_condition: валидаторы
+синхронные и ходят в базу.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.messages import get_messages
+from django.db import connections, router
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from . import cache as ads_cache
+from . import inbox
+from .database import reading_from_replica
+from .models import Ad, ExchangeProposal
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _csrf_secret(request):
+    # get_token() маскирует секрет заново при каждом вызове; сам секрет — в META.
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+
+def ad_list_etag(request):
+    filters = ads_cache.normalize_list_params(request.GET)
+    if request.user.is_authenticated:
+        # Поколение отражает записи в default; страница, прочитанная с отстающей
+        # реплики, не должна получить его ETag. Анонимные страницы читаются из default.
+        if reading_from_replica():
+            return None
+        counters = inbox.get_counters(request.user)
+        # Форма сохранения поиска есть только у вошедших.
+        viewer = [request.user.pk, _csrf_secret(request), *(counters[field] for field in inbox.FIELDS)]
+    else:
+        viewer = ['anon']
+    return _digest(ads_cache.get_generation(), *filters.items(), *viewer)
+
+
+def proposal_list_etag(request):
+    # Сообщения показываются один раз; страница с ними не должна совпасть с кэшированной.
+    if len(get_messages(request)):
+        return None
+    connection = connections[router.db_for_read(ExchangeProposal)]
+    quote = connection.ops.quote_name
+    proposal_table, ad_table = quote(ExchangeProposal._meta.db_table), quote(Ad._meta.db_table)
+
+    def summary_query(side, owner):
+        return (
+            f"SELECT '{side}' AS side, COUNT(*), MAX(proposal.updated_at), MAX(sender.updated_at), "
+            f'MAX(receiver.updated_at) '
+            f'FROM {proposal_table} proposal '
+            f'JOIN {ad_table} sender ON sender.id = proposal.ad_sender_id '
+            f'JOIN {ad_table} receiver ON receiver.id = proposal.ad_receiver_id '
+            f'WHERE {owner}.user_id = %s AND sender.deleted_at IS NULL AND receiver.deleted_at IS NULL'
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{summary_query('s', 'sender')} UNION ALL {summary_query('r', 'receiver')}",
+            [request.user.pk, request.user.pk],
+        )
+        # Порядок строк UNION ALL не гарантирован: сторона берется из первого столбца.
+        summary = {side: values for side, *values in cursor.fetchall()}
+    # Архив меняется только переносом строк из горячих таблиц, а это меняет сводку.
+    params = [
+        request.GET.get(name, '')
+        for name in ('sent_cursor', 'received_cursor', 'archived', 'archived_sent_cursor', 'archived_received_cursor')
+    ]
+    return _digest(request.user.pk, _csrf_secret(request), *params, *summary['s'], *summary['r'])
+
+
+def async_condition(etag_func):
+    """condition() для асинхронного представления: etag_func выполняется в sync_to_async.
+
+    Django вызывает etag_func прямо в цикле событий, и запрос к базе там
+    падает с SynchronousOnlyOperation.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            # Валидатор читает request.user; без этого ленивый user загрузился бы второй раз.
+            request.user = await request.auser()
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            conditional = condition(etag_func=lambda *args, **kwargs: etag)(view_func)
+            return await conditional(request, *args, **kwargs)
+        return wrapper
+    return decorator
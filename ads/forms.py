@@ -1,6 +1,37 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import Ad, ExchangeProposal
 
+AUTOCOMPLETE_PAGE_SIZE = 20
+
+def offerable_ads(user):
+    """Необмененные объявления пользователя, новые первыми (индекс ads_ad_user_created_idx)."""
+    return Ad.objects.filter(user=user, exchanged_at__isnull=True).order_by('-created_at', '-id')
+
+class AdAutocompleteSelect(forms.Select):
+    """<select> только с первой страницей объявлений и выбранным значением.
+
+    Остальные объявления подгружаются со страницы data-autocomplete-url,
+    поэтому размер формы не зависит от числа объявлений пользователя.
+    """
+
+    def __init__(self, attrs=None, preview=()):
+        super().__init__(attrs)
+        self.preview = preview
+
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        ads = list(self.preview)
+        shown = {str(ad.pk) for ad in ads}
+        missing = [pk for pk in value if pk and pk.isdigit() and pk not in shown]
+        if missing:
+            ads = list(iterator.queryset.filter(pk__in=missing)) + ads
+        self.choices = [('', iterator.field.empty_label)] + [iterator.choice(ad) for ad in ads]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
+
 class AdForm(forms.ModelForm):
     class Meta:
         model = Ad
@@ -11,11 +42,16 @@ class ExchangeProposalForm(forms.ModelForm):
         model = ExchangeProposal
         fields = ['ad_sender', 'comment']
         widgets = {
+            'ad_sender': AdAutocompleteSelect(attrs={'data-autocomplete-url': reverse_lazy('ads:ad_autocomplete')}),
             'comment': forms.Textarea(attrs={'rows': 3}),
         }
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        self.preview_ads = []
         if user:
-            self.fields['ad_sender'].queryset = Ad.objects.filter(user=user)
\ No newline at end of file
+            # Выбор проверяется одним get() по pk внутри этого queryset, без загрузки всех вариантов.
+            self.fields['ad_sender'].queryset = offerable_ads(user)
+            self.preview_ads = offerable_ads(user)[:AUTOCOMPLETE_PAGE_SIZE]
+            self.fields['ad_sender'].widget.preview = self.preview_ads
@@ -0,0 +1,261 @@
+"""Потоковый импорт объявлений и предложений из JSONL/CSV.
+
+Файл читается построчно, строки проверяются и записываются пачками через
+bulk_create, каждая пачка в своей транзакции, поэтому память ограничена
+размером пачки. После каждой пачки номер последней строки сохраняется в
+файл контрольной точки, и повторный запуск продолжает с нее.
+"""
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .forms import AdForm
+from .models import Ad, Category, Condition, ExchangeProposal, catalogue_key, make_excerpt
+from .signals import ads_created_in_bulk, proposals_created_in_bulk
+
+class RowError(Exception):
+    pass
+
+
+def external_key(value):
+    """Внешний id строкой: в JSONL он бывает числом, а столбцы external_id текстовые."""
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def read_rows(path, fmt=None):
+    """Генератор пар (номер строки, словарь или RowError)."""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(source), start=1):
+                yield number, row
+            return
+        for number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, RowError(f'некорректный JSON: {exc}')
+                continue
+            if not isinstance(row, dict):
+                row = RowError('ожидается JSON-объект')
+            yield number, row
+
+
+class Checkpoint:
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding='utf-8') as source:
+            return json.load(source)['last_row']
+
+    def save(self, last_row):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as target:
+            json.dump({'last_row': last_row}, target)
+        os.replace(tmp_path, self.path)
+
+
+class ImportStats:
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.processed = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = 0
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'обработано {self.processed}, создано {self.created}, пропущено {self.skipped}, '
+            f'ошибок {self.errors}, {self.rate:.0f} строк/с'
+        )
+
+
+class BaseImporter:
+    model = None
+
+    def __init__(self, batch_size=1000, dry_run=False, checkpoint=None,
+                 on_progress=None, on_error=None, progress_every=5.0):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.checkpoint = Checkpoint(None if dry_run else checkpoint)
+        self.on_progress = on_progress or (lambda stats: None)
+        self.on_error = on_error or (lambda number, message: None)
+        self.progress_every = progress_every
+        self.stats = ImportStats()
+        self._last_report = time.monotonic()
+
+    def run(self, rows):
+        resume_after = self.checkpoint.load()
+        self.prepare()
+        batch = []
+        for number, row in rows:
+            if number <= resume_after:
+                continue
+            batch.append((number, row))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        self.on_progress(self.stats)
+        return self.stats
+
+    def error(self, number, message):
+        self.stats.errors += 1
+        self.on_error(number, message)
+
+    def flush(self, batch):
+        rows = []
+        for number, row in batch:
+            if isinstance(row, RowError):
+                self.error(number, str(row))
+            else:
+                rows.append((number, {**row, 'external_id': external_key(row.get('external_id'))}))
+        existing = self.existing_external_ids(
+            [row['external_id'] for _, row in rows if row['external_id']]
+        )
+        fresh = []
+        for number, row in rows:
+            external_id = row['external_id']
+            if external_id in existing:
+                self.stats.skipped += 1
+                continue
+            if external_id:
+                existing.add(external_id)
+            fresh.append((number, row))
+
+        objects = self.build(fresh)
+        if objects and not self.dry_run:
+            with transaction.atomic():
+                self.write(objects)
+            self.stats.created += len(objects)
+        self.stats.processed += len(batch)
+        self.checkpoint.save(batch[-1][0])
+        if time.monotonic() - self._last_report >= self.progress_every:
+            self._last_report = time.monotonic()
+            self.on_progress(self.stats)
+
+    def existing_external_ids(self, external_ids):
+        if not external_ids:
+            return set()
+        return set(
+            # С удаленными, но еще не стертыми объявлениями: external_id у них занят.
+            self.model._base_manager.filter(external_id__in=external_ids).values_list('external_id', flat=True)
+        )
+
+    def prepare(self):
+        pass
+
+    def build(self, rows):
+        raise NotImplementedError
+
+    def write(self, objects):
+        raise NotImplementedError
+
+
+class AdImporter(BaseImporter):
+    """Строки: external_id, username, title, description, image_url, category, condition."""
+    model = Ad
+
+    def build(self, rows):
+        usernames = {row.get('username') for _, row in rows}
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        ads = []
+        for number, row in rows:
+            form = AdForm(data=row)
+            if not form.is_valid():
+                self.error(number, '; '.join(
+                    f'{field}: {" ".join(messages)}' for field, messages in form.errors.items()
+                ))
+                continue
+            user_id = user_ids.get(row.get('username'))
+            if user_id is None:
+                self.error(number, f'пользователь {row.get("username")!r} не найден')
+                continue
+            ad = form.instance
+            ad.user_id = user_id
+            ad.external_id = row['external_id']
+            ads.append(ad)
+        return ads
+
+    @staticmethod
+    def resolve_catalogue_refs(ads):
+        categories = Category.for_names({ad.category for ad in ads})
+        conditions = Condition.for_names({ad.condition for ad in ads})
+        for ad in ads:
+            ad.category_ref = categories[catalogue_key(ad.category)]
+            ad.condition_ref = conditions[catalogue_key(ad.condition)]
+
+    def write(self, ads):
+        self.resolve_catalogue_refs(ads)
+        for ad in ads:
+            ad.excerpt = make_excerpt(ad.description)
+        Ad.objects.bulk_create(ads)
+        ads_created_in_bulk.send(sender=Ad, ads=ads)
+
+
+class ProposalImporter(BaseImporter):
+    """Строки: external_id, ad_sender, ad_receiver (внешние id объявлений), comment, status."""
+    model = ExchangeProposal
+
+    def prepare(self):
+        # Один проход по объявлениям с внешним id: external_id -> (pk, user_id).
+        self.ads = {
+            external_id: (pk, user_id)
+            for external_id, pk, user_id in Ad.objects.filter(external_id__isnull=False)
+            .values_list('external_id', 'pk', 'user_id').iterator(chunk_size=10000)
+        }
+
+    def build(self, rows):
+        proposals = []
+        for number, row in rows:
+            sender = self.ads.get(external_key(row.get('ad_sender')))
+            receiver = self.ads.get(external_key(row.get('ad_receiver')))
+            if sender is None or receiver is None:
+                missing = row.get('ad_sender') if sender is None else row.get('ad_receiver')
+                self.error(number, f'объявление {missing!r} не найдено')
+                continue
+            if sender[1] == receiver[1]:
+                self.error(number, 'объявления принадлежат одному пользователю')
+                continue
+            proposal = ExchangeProposal(
+                ad_sender_id=sender[0],
+                ad_receiver_id=receiver[0],
+                comment=row.get('comment') or None,
+                status=row.get('status') or 'pending',
+                external_id=row['external_id'],
+            )
+            try:
+                proposal.full_clean(exclude=['ad_sender', 'ad_receiver'], validate_unique=False)
+            except ValidationError as exc:
+                self.error(number, '; '.join(
+                    f'{field}: {" ".join(messages)}' for field, messages in exc.message_dict.items()
+                ))
+                continue
+            proposals.append(proposal)
+        return proposals
+
+    def write(self, proposals):
+        ExchangeProposal.objects.bulk_create(proposals)
+        proposals_created_in_bulk.send(sender=ExchangeProposal, proposals=proposals)
@@ -0,0 +1,153 @@
+"""Счетчики предложений пользователя (InboxCounter) и их кэш.
+
+Дельты применяются одним INSERT ... ON CONFLICT на пачку пользователей,
+поэтому строка счетчика появляется при первом предложении. Закрытые
+предложения вычитаются запросом с группировкой по пользователям в SQL, как
+ребра в ads.matching. Значок читает счетчик из кэша; запись счетчиков
+удаляет кэш затронутых пользователей.
+"""
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Count, Q
+
+from .cache import get_cache
+from .models import Ad, ExchangeProposal, InboxCounter
+
+FIELDS = ('pending_received', 'pending_sent', 'unseen')
+UPSERT_BATCH_SIZE = 500
+CACHE_TIMEOUT = 300
+
+
+def cache_key(user_id):
+    return f'ads:inbox:{user_id}'
+
+
+def _invalidate(user_ids):
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if keys:
+        get_cache().delete_many(keys)
+        # Значок, прочитанный другим запросом до коммита, не должен пережить коммит.
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def _upsert(source, params):
+    """INSERT ... ON CONFLICT с прибавлением дельт и сброс кэша затронутых пользователей."""
+    table = connection.ops.quote_name(InboxCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, pending_received, pending_sent, unseen) {source} '
+            f'ON CONFLICT (user_id) DO UPDATE SET '
+            f'pending_received = {table}.pending_received + excluded.pending_received, '
+            f'pending_sent = {table}.pending_sent + excluded.pending_sent, '
+            f'unseen = CASE WHEN {table}.unseen + excluded.unseen < {table}.pending_received + excluded.pending_received '
+            f'THEN {table}.unseen + excluded.unseen ELSE {table}.pending_received + excluded.pending_received END '
+            f'RETURNING user_id',
+            params,
+        )
+        user_ids = [row[0] for row in cursor.fetchall()]
+    _invalidate(user_ids)
+
+
+def shift_counters(deltas):
+    """Применяет {user_id: Counter(pending_received=..., pending_sent=..., unseen=...)}."""
+    items = [(user_id, delta) for user_id, delta in deltas.items() if any(delta.values())]
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        batch = items[start:start + UPSERT_BATCH_SIZE]
+        _upsert(
+            f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(batch))}',
+            [value for user_id, delta in batch for value in (user_id, *(delta[field] for field in FIELDS))],
+        )
+
+
+def proposal_deltas(user_pairs, sign=1):
+    """Дельты для пар (отправитель, получатель) ожидающих предложений."""
+    deltas = {}
+    for sender, receiver in user_pairs:
+        deltas.setdefault(sender, Counter())['pending_sent'] += sign
+        received = deltas.setdefault(receiver, Counter())
+        received['pending_received'] += sign
+        if sign > 0:
+            received['unseen'] += 1
+    return deltas
+
+
+def release_proposals(proposal_ids):
+    """Вычитает предложения proposal_ids из счетчиков отправителей и получателей одним запросом."""
+    proposal_ids = [int(pk) for pk in proposal_ids]
+    if not proposal_ids:
+        return
+    quote = connection.ops.quote_name
+    proposal_table, ad_table = quote(ExchangeProposal._meta.db_table), quote(Ad._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(proposal_ids))
+    _upsert(
+        f'SELECT user_id, SUM(received), SUM(sent), 0 FROM ('
+        f'SELECT ad.user_id AS user_id, -1 AS received, 0 AS sent FROM {proposal_table} proposal '
+        f'JOIN {ad_table} ad ON ad.id = proposal.ad_receiver_id WHERE proposal.id IN ({placeholders}) '
+        f'UNION ALL '
+        f'SELECT ad.user_id, 0, -1 FROM {proposal_table} proposal '
+        f'JOIN {ad_table} ad ON ad.id = proposal.ad_sender_id WHERE proposal.id IN ({placeholders})'
+        f') AS changes GROUP BY user_id',
+        proposal_ids * 2,
+    )
+
+
+def mark_seen(user):
+    """Обнуляет unseen при открытии списка предложений; один UPDATE."""
+    if InboxCounter.objects.filter(user=user, unseen__gt=0).update(unseen=0):
+        _invalidate([user.pk])
+
+
+async def amark_seen(user):
+    if await InboxCounter.objects.filter(user=user, unseen__gt=0).aupdate(unseen=0):
+        await get_cache().adelete(cache_key(user.pk))
+
+
+def get_counters(user):
+    """Словарь счетчиков пользователя из кэша или из одной строки InboxCounter.
+
+    Промах читается из default и в представлениях с @replica_reads: значение
+    с отстающей реплики осталось бы в кэше на CACHE_TIMEOUT и после сброса
+    кэша при коммите.
+    """
+    cache = get_cache()
+    counters = cache.get(cache_key(user.pk))
+    if counters is None:
+        row = InboxCounter.objects.using(DEFAULT_DB_ALIAS).filter(user=user).values(*FIELDS).first()
+        counters = row or dict.fromkeys(FIELDS, 0)
+        cache.set(cache_key(user.pk), counters, CACHE_TIMEOUT)
+    return counters
+
+
+async def aget_counters(user):
+    cache = get_cache()
+    counters = await cache.aget(cache_key(user.pk))
+    if counters is None:
+        row = await InboxCounter.objects.using(DEFAULT_DB_ALIAS).filter(user=user).values(*FIELDS).afirst()
+        counters = row or dict.fromkeys(FIELDS, 0)
+        await cache.aset(cache_key(user.pk), counters, CACHE_TIMEOUT)
+    return counters
+
+
+def rebuild():
+    """Пересчитывает все счетчики из ожидающих предложений. unseen становится 0."""
+    pending = Q(status='pending')
+    received = (
+        ExchangeProposal.objects.filter(pending).order_by()
+        .values_list('ad_receiver__user_id').annotate(total=Count('id'))
+    )
+    sent = (
+        ExchangeProposal.objects.filter(pending).order_by()
+        .values_list('ad_sender__user_id').annotate(total=Count('id'))
+    )
+    counters = {}
+    for user_id, total in received:
+        counters.setdefault(user_id, InboxCounter(user_id=user_id)).pending_received = total
+    for user_id, total in sent:
+        counters.setdefault(user_id, InboxCounter(user_id=user_id)).pending_sent = total
+    stale = set(InboxCounter.objects.values_list('user_id', flat=True))
+    InboxCounter.objects.all().delete()
+    InboxCounter.objects.bulk_create(counters.values(), batch_size=1000)
+    get_cache().delete_many([cache_key(user_id) for user_id in stale | set(counters)])
+    return len(counters)
+
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ads.archive import archive
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые предложения и давно обмененные объявления в архивные таблицы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=settings.ADS_ARCHIVE_AFTER,
+            help='Срок хранения в горячих таблицах, с.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=settings.ADS_ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.ADS_ARCHIVE_PAUSE, help='Пауза между пачками, с.')
+
+    def handle(self, *args, **options):
+        stats = archive(options['older_than'], chunk_size=options['chunk_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'В архиве: предложений {stats["proposals"]}, объявлений {stats["ads"]}; '
+            f'транзакций {stats["transactions"]}.'
+        ))
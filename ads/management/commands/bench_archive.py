@@ -0,0 +1,115 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ads.archive import archive
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_proposals, seed_users
+from ads.models import Ad, ArchivedAd, ArchivedProposal, ExchangeProposal
+
+DAY = 24 * 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Размер горячих таблиц и задержка списков до и после переноса старых '
+        'предложений и объявлений в архив на сгенерированных данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--ads', type=int, default=20_000)
+        parser.add_argument('--proposals', type=int, default=100_000)
+        parser.add_argument('--pending-share', type=float, default=0.2)
+        parser.add_argument('--exchanged-share', type=float, default=0.3, help='Доля объявлений без ожидающих предложений.')
+        parser.add_argument('--days', type=int, default=730, help='Глубина истории, дней.')
+        parser.add_argument('--older-than-days', type=int, default=180)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def age_rows(self, options, rng):
+        """Разносит даты по options['days'] дням и помечает часть свободных объявлений обмененными."""
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in (Ad, ExchangeProposal):
+                table = quote(model._meta.db_table)
+                cursor.execute(
+                    f"UPDATE {table} SET created_at = datetime('now', '-' || (abs(random()) %% %s) || ' seconds')",
+                    [options['days'] * DAY],
+                )
+                cursor.execute(f'UPDATE {table} SET updated_at = created_at')
+        pending = ExchangeProposal.objects.filter(status='pending')
+        busy = set(pending.values_list('ad_sender_id', flat=True)) | set(pending.values_list('ad_receiver_id', flat=True))
+        idle = [pk for pk in Ad.objects.values_list('pk', flat=True) if pk not in busy]
+        exchanged = rng.sample(idle, int(len(idle) * options['exchanged_share']))
+        table = quote(Ad._meta.db_table)
+        with connection.cursor() as cursor:
+            for start in range(0, len(exchanged), 500):
+                batch = exchanged[start:start + 500]
+                cursor.execute(
+                    f"UPDATE {table} SET exchanged_at = MIN(datetime(created_at, '+30 days'), datetime('now')) "
+                    f"WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                    batch,
+                )
+                cursor.execute(
+                    f"UPDATE {table} SET updated_at = exchanged_at WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                    batch,
+                )
+
+    def table_size(self, model):
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            rows = cursor.fetchone()[0]
+            try:
+                # dbstat есть не во всех сборках SQLite.
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                size = cursor.fetchone()[0] or 0
+            except OperationalError:
+                size = None
+        return rows, size
+
+    def report(self, label, requests, repeat):
+        self.stdout.write(label)
+        for model in (Ad, ExchangeProposal, ArchivedAd, ArchivedProposal):
+            rows, size = self.table_size(model)
+            size = '' if size is None else f', {size / 2 ** 20:.1f} МБ'
+            self.stdout.write(f'  {model._meta.db_table:<26} строк {rows:>8}{size}')
+        for name, (client, url, data) in requests.items():
+            self.stdout.write(f'  {name:<26} {format_timing(measure(lambda: client.get(url, data), repeat))}')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_databases(aliases={'default'}), \
+                override_settings(ALLOWED_HOSTS=['testserver'], ADS_LIST_CACHE_TIMEOUT=0):
+            user_ids = seed_users(options['users'])
+            seed_ads(options['ads'], user_ids, rng=rng, signals=True)
+            seed_proposals(options['proposals'], rng=rng, pending_share=options['pending_share'])
+            self.age_rows(options, rng)
+
+            busiest = (
+                ExchangeProposal.objects.values('ad_receiver__user').annotate(total=Count('id'))
+                .order_by('-total').first()['ad_receiver__user']
+            )
+            client = Client()
+            client.force_login(User.objects.get(pk=busiest))
+            requests = {
+                'список предложений': (client, reverse('ads:exchange_proposal_list'), {}),
+                'список объявлений': (Client(), reverse('ads:ad_list'), {}),
+                'список с фильтром': (Client(), reverse('ads:ad_list'), {'category': 'книги'}),
+            }
+            self.report('До переноса', requests, options['repeat'])
+
+            started = time.perf_counter()
+            stats = archive(options['older_than_days'] * DAY)
+            self.stdout.write(
+                f'Перенесено за {time.perf_counter() - started:.1f} с: предложений {stats["proposals"]}, '
+                f'объявлений {stats["ads"]}, транзакций {stats["transactions"]}'
+            )
+            requests['архив предложений'] = (client, reverse('ads:exchange_proposal_list'), {'archived': '1'})
+            self.report('После переноса', requests, options['repeat'])
@@ -0,0 +1,80 @@
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.bench import summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенные WSGI- и ASGI-серверы и сравнивает пропускную способность и задержки. '
+        'Пример: gunicorn base.wsgi -w 4 -b 127.0.0.1:8001 и '
+        'uvicorn base.asgi:application --workers 4 --port 8002, затем '
+        'manage.py bench_asgi --wsgi http://127.0.0.1:8001/ --asgi http://127.0.0.1:8002/async/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', help='URL синхронного представления на WSGI-сервере.')
+        parser.add_argument('--asgi', help='URL асинхронного представления на ASGI-сервере.')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        targets = [(label, options[label]) for label in ('wsgi', 'asgi') if options[label]]
+        if not targets:
+            raise CommandError('Укажите хотя бы один из --wsgi и --asgi.')
+        for label, url in targets:
+            result = self.load(url, options['concurrency'], options['requests'])
+            self.stdout.write(
+                f'{label}: {result["rps"]:.0f} запросов/с, ошибок {result["errors"]}, '
+                'p50 {p50:.1f} мс  p95 {p95:.1f} мс  p99 {p99:.1f} мс'.format(**result['latency'])
+            )
+
+    @staticmethod
+    def load(url, concurrency, total):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        remaining = iter(range(total))
+
+        def worker():
+            connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    response.read()
+                    failed = response.status >= 400
+                except OSError:
+                    connection.close()
+                    failed = True
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    (errors if failed else latencies).append(elapsed)
+            connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - started
+        if not latencies:
+            raise CommandError(f'Нет успешных ответов от {url}.')
+        return {
+            'rps': len(latencies) / duration,
+            'errors': len(errors),
+            'latency': summarize(latencies),
+        }
@@ -0,0 +1,93 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from ads import api, changelog
+from ads.bench import benchmark_databases, seed_barter
+from ads.models import Ad, ChangeLogEntry, ExchangeProposal
+from ads.services import transition_proposals
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полную пересинхронизацию объявлений и предложений с чтением журнала '
+        'изменений после курсора и измеряет уплотнение журнала.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--ads', type=int, default=100_000)
+        parser.add_argument('--proposals', type=int, default=200_000)
+        parser.add_argument('--changes', type=int, default=2000, help='Изменений после курсора.')
+        parser.add_argument('--batch-size', type=int, default=changelog.CHANGES_PAGE_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def full_resync(self):
+        lines = 0
+        for chunk in api.stream_ndjson(Ad.objects.order_by('id'), list(api.API_FIELDS)):
+            lines += chunk.count('\n')
+        for row in ExchangeProposal.objects.order_by('id').values_list(
+            'id', 'ad_sender_id', 'ad_receiver_id', 'comment', 'status', 'created_at', 'updated_at'
+        ).iterator(chunk_size=2000):
+            api.dumps(row)
+            lines += 1
+        return lines
+
+    def incremental(self, position, batch_size):
+        lines = 0
+        while True:
+            entries = changelog.entries_since(position, batch_size)
+            for chunk in changelog.stream_ndjson(entries):
+                lines += chunk.count('\n')
+            if len(entries) < batch_size:
+                return lines
+            position = (entries[-1][1], entries[-1][0])
+
+    def timed(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f'{label}: {(time.perf_counter() - started) * 1000:.1f} мс, строк {result}')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_databases(aliases={'default'}), override_settings(ADS_CHANGELOG_SETTLE=0):
+            seed_barter(options['users'], options['ads'], options['proposals'], rng=rng)
+            self.stdout.write(f'записей журнала после заполнения: {ChangeLogEntry.objects.count()}')
+            last = ChangeLogEntry.objects.order_by('-created_at', '-id').values_list('created_at', 'id').first()
+
+            # Изменения: отклонение ожидающих предложений их получателями и правка объявлений.
+            pending = list(
+                ExchangeProposal.objects.filter(status='pending')
+                .values_list('pk', 'ad_receiver__user_id')[:options['changes'] // 2]
+            )
+            users = User.objects.in_bulk({user_id for _, user_id in pending})
+            for pk, user_id in pending:
+                transition_proposals(users[user_id], [pk], 'rejected')
+            ad_ids = list(Ad.objects.values_list('pk', flat=True))
+            edits = min(len(ad_ids), max(0, options['changes'] - len(pending)))
+            for ad in Ad.objects.filter(pk__in=rng.sample(ad_ids, edits)):
+                ad.title += ' (обновлено)'
+                ad.save()
+            changes = ChangeLogEntry.objects.filter(created_at__gte=last[0]).exclude(id__lte=last[1]).count()
+            self.stdout.write(f'изменений после курсора: {changes}')
+
+            self.timed('полная пересинхронизация', self.full_resync)
+            self.timed(
+                f'журнал после курсора, страницы по {options["batch_size"]}',
+                lambda: self.incremental(last, options['batch_size']),
+            )
+
+            ChangeLogEntry.objects.update(created_at=timezone.now() - timedelta(days=1))
+            before = ChangeLogEntry.objects.count()
+            started = time.perf_counter()
+            stats = changelog.compact(0, 3600, batch_size=1000)
+            self.stdout.write(
+                f'уплотнение: {(time.perf_counter() - started) * 1000:.1f} мс, записей {before} -> '
+                f'{ChangeLogEntry.objects.count()} (перекрытых {stats["superseded"]}), '
+                f'операторов DELETE {stats["statements"]}'
+            )
@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ads.bench import benchmark_databases, seed_ads, seed_users
+from ads.models import Ad, ExchangeProposal
+from ads.purge import purge_deleted_ads
+from ads.services import soft_delete_ad
+from ads.signals import proposals_created_in_bulk
+
+
+class StatementTimer:
+    """execute_wrapper: число операторов и самый долгий из них (CaptureQueriesContext хранит только 9000)."""
+
+    def __init__(self):
+        self.count = 0
+        self.longest = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.longest = max(self.longest, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление объявления с большим числом предложений: Model.delete() против '
+        'пометки deleted_at и последующей пакетной очистки purge_deleted_ads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proposals', type=int, default=50_000, help='Предложений на удаляемое объявление.')
+        parser.add_argument('--ads', type=int, default=2_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def popular_ad(self, options, user_ids, senders, rng):
+        """Объявление первого пользователя с options['proposals'] предложениями, 80% ожидают."""
+        ad = Ad.objects.create(
+            user_id=user_ids[0], title='Популярное объявление', description='Все хотят его.',
+            category='Электроника', condition='Новое',
+        )
+        for start in range(0, options['proposals'], 5000):
+            batch = [
+                ExchangeProposal(
+                    ad_sender_id=rng.choice(senders), ad_receiver=ad,
+                    status='pending' if rng.random() < 0.8 else 'rejected',
+                )
+                for _ in range(min(5000, options['proposals'] - start))
+            ]
+            ExchangeProposal.objects.bulk_create(batch)
+            proposals_created_in_bulk.send(sender=ExchangeProposal, proposals=batch)
+        return ad
+
+    def run(self, label, func):
+        timer = StatementTimer()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:<22} {elapsed * 1000:10.1f} мс, запросов {timer.count:6}, '
+            f'самый долгий {timer.longest * 1000:8.1f} мс'
+        )
+        return result
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_databases(aliases={'default'}):
+            user_ids = seed_users(200)
+            seed_ads(options['ads'], user_ids[1:], rng=rng, signals=True)
+            senders = list(Ad.objects.values_list('pk', flat=True))
+            hard = self.popular_ad(options, user_ids, senders, rng)
+            soft = self.popular_ad(options, user_ids, senders, rng)
+            self.stdout.write(f'Предложений на объявление: {options["proposals"]}')
+
+            # Collector держит одну транзакцию на все время удаления.
+            self.run('Model.delete()', hard.delete)
+            self.run('soft_delete_ad()', lambda: soft_delete_ad(soft.user, soft))
+            stats = self.run('purge_deleted_ads()', lambda: purge_deleted_ads(
+                0, batch_size=options['batch_size'], pause=options['pause']
+            ))
+            self.stdout.write(
+                f'  операторов DELETE {stats["statements"]}, удалено предложений {stats["exchangeproposal"]}, '
+                f'осталось {ExchangeProposal.objects.count()}'
+            )
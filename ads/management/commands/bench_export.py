@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from ads.bench import benchmark_databases, seed_ads, seed_users
+from ads.models import Ad
+from ads.views import ad_export_view
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость и пиковую память NDJSON-выгрузки объявлений в сравнении с чтением моделей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=1_000_000)
+        parser.add_argument('--fields', default='id,title,category,condition,created_at')
+        parser.add_argument(
+            '--materialize', action='store_true',
+            help='Добавить вариант list(queryset) со всеми моделями в памяти.',
+        )
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+
+        def export(params):
+            def run():
+                response = ad_export_view(factory.get('/api/ads/export.ndjson', params))
+                return sum(len(chunk) for chunk in response.streaming_content)
+            return run
+
+        cases = [
+            ('модели, iterator()', lambda: sum(1 for _ in Ad.objects.order_by('-created_at', '-id').iterator(2000))),
+            ('ndjson, все поля', export({})),
+            ('ndjson, --fields', export({'fields': options['fields']})),
+        ]
+        if options['materialize']:
+            cases.insert(0, ('модели, list(queryset)', lambda: len(list(Ad.objects.order_by('-created_at', '-id')))))
+
+        with benchmark_databases(aliases={'default'}):
+            seed_ads(options['ads'], seed_users(100), reindex=False)
+            self.stdout.write(f'объявлений: {options["ads"]}')
+            for label, func in cases:
+                started = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - started
+                # Память измеряется отдельным проходом: tracemalloc заметно замедляет код.
+                tracemalloc.start()
+                func()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'  {label:<45} {options["ads"] / elapsed:10.0f} строк/с  '
+                    f'{elapsed:7.2f} с  пик памяти {peak / 2**20:8.1f} МБ'
+                )
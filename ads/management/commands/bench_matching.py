@@ -0,0 +1,74 @@
+import random
+import time
+from collections import Counter
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.matching import WantsGraph, rebuild_edges
+from ads.models import Ad, ExchangeProposal, WantEdge
+from ads.signals import proposals_created_in_bulk
+
+
+class Command(BaseCommand):
+    help = 'Измеряет поиск цепочек обмена и инкрементальное обновление графа на больших объемах предложений.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20_000)
+        parser.add_argument('--proposals', type=int, default=100_000)
+        parser.add_argument('--max-length', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def timed(self, label, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(f'{label:<40} {time.perf_counter() - started:8.2f} с')
+        return result
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        max_length = options['max_length']
+        with benchmark_databases(aliases={'default'}):
+            user_ids = seed_users(options['users'])
+            seed_ads(options['users'] * 2, user_ids, rng=rng, reindex=False)
+            ads = list(Ad.objects.values_list('pk', 'user_id'))
+
+            def create_proposals():
+                created = 0
+                while created < options['proposals']:
+                    batch = []
+                    while len(batch) < min(5000, options['proposals'] - created):
+                        sender, receiver = rng.choice(ads), rng.choice(ads)
+                        if sender[1] != receiver[1]:
+                            batch.append(ExchangeProposal(ad_sender_id=sender[0], ad_receiver_id=receiver[0]))
+                    ExchangeProposal.objects.bulk_create(batch)
+                    proposals_created_in_bulk.send(sender=ExchangeProposal, proposals=batch)
+                    created += len(batch)
+
+            self.timed(f'вставка {options["proposals"]} предложений + ребра', create_proposals)
+            self.stdout.write(f'ребер в графе: {WantEdge.objects.count()}')
+            self.timed('полная перестройка ребер', rebuild_edges)
+            graph = self.timed('загрузка графа', WantsGraph.load)
+            lengths = self.timed(
+                f'все циклы длиной до {max_length}',
+                lambda: Counter(len(cycle) for cycle in graph.cycles(max_length)),
+            )
+            self.stdout.write(f'  найдено: {dict(sorted(lengths.items()))}')
+
+            users = iter(rng.choices(user_ids, k=options['repeat'] + 2))
+
+            def user_cycles():
+                user = next(users)
+                return list(islice(WantsGraph.load_around(user, max_length).cycles_from(user, max_length), 20))
+
+            self.stdout.write('циклы пользователя (загрузка окрестности + поиск)')
+            self.stdout.write('  ' + format_timing(measure(user_cycles, repeat=options['repeat'])))
+
+            pairs = iter(rng.choices(ads, k=2 * (options['repeat'] + 2)))
+            self.stdout.write('новое предложение (save + ребро)')
+            self.stdout.write('  ' + format_timing(measure(
+                lambda: ExchangeProposal.objects.create(ad_sender_id=next(pairs)[0], ad_receiver_id=next(pairs)[0]),
+                repeat=options['repeat'],
+            )))
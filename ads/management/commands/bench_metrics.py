@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+
+MIDDLEWARE_PATH = 'ads.middleware.PerformanceMiddleware'
+
+
+class Command(BaseCommand):
+    help = 'Измеряет накладные расходы PerformanceMiddleware при разной доле выборки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=10_000)
+        parser.add_argument('--rates', nargs='+', type=float, default=[0.0, 0.1, 1.0])
+        parser.add_argument('--repeat', type=int, default=300)
+        parser.add_argument('--path', default='/?q=ка')
+
+    def handle(self, *args, **options):
+        without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE_PATH]
+        cases = [('без middleware', {'MIDDLEWARE': without})] + [
+            (f'выборка {rate:g}', {'MIDDLEWARE': [MIDDLEWARE_PATH] + without, 'ADS_METRICS_SAMPLE_RATE': rate})
+            for rate in options['rates']
+        ]
+        with benchmark_databases(aliases={'default'}):
+            seed_ads(options['ads'], seed_users(100))
+            # Страница без кеша: каждый запрос доходит до SQL и шаблона.
+            with override_settings(ADS_LIST_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['testserver']):
+                for label, overrides in cases:
+                    with override_settings(**overrides):
+                        client = Client()
+                        stats = measure(lambda: client.get(options['path']), repeat=options['repeat'])
+                    self.stdout.write(f'{label:<16} {format_timing(stats)}')
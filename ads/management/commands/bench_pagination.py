@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.models import Ad
+from ads.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стоимость страницы OFFSET-пагинации и курсорной пагинации на разной глубине.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=100_000)
+        parser.add_argument('--per-page', type=int, default=5)
+        parser.add_argument('--pages', nargs='+', type=int, default=[1, 100, 1000, 10_000])
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        with benchmark_databases(aliases={'default'}):
+            seed_ads(options['ads'], seed_users(100), reindex=False)
+            queryset = Ad.objects.order_by('-created_at', '-id')
+            paginator = CursorPaginator(queryset, per_page)
+            for number in options['pages']:
+                offset = (number - 1) * per_page
+                if offset >= options['ads']:
+                    continue
+                cursor = None
+                if offset:
+                    cursor = paginator.cursor_for(queryset[offset - 1])
+                offset_stats = measure(
+                    lambda: list(Paginator(queryset, per_page).page(number)), repeat=options['repeat']
+                )
+                cursor_stats = measure(
+                    lambda: list(CursorPaginator(queryset, per_page).get_page(cursor)),
+                    repeat=options['repeat'],
+                )
+                self.stdout.write(f'страница {number}')
+                self.stdout.write(f'  offset  {format_timing(offset_stats)}')
+                self.stdout.write(f'  cursor  {format_timing(cursor_stats)}')
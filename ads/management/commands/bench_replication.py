@@ -0,0 +1,119 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test import Client, override_settings
+
+from ads.bench import CATEGORIES, CONDITIONS, benchmark_databases, seed_ads, seed_users, summarize
+from ads.models import Ad
+from ads.testing import copy_database, sqlite_alias
+
+ROLLBACK_JOURNAL = {'journal_mode': 'delete', 'synchronous': 'full'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает файловую SQLite параллельными чтениями списка и записью объявлений: '
+        'журнал отката, WAL с PRAGMA из настроек и WAL с чтением с реплики.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=20_000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Длительность каждого прогона.')
+
+    def run_load(self, options, user_ids):
+        deadline = time.perf_counter() + options['seconds']
+        reads, writes, errors = [], [], []
+        lock = threading.Lock()
+
+        def reader():
+            client = Client()
+            timings = []
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        client.get('/', {'category': random.choice(CATEGORIES).casefold()})
+                    except OperationalError:
+                        errors.append('read')
+                        continue
+                    timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                reads.extend(timings)
+
+        def writer():
+            rng = random.Random()
+            timings = []
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        Ad.objects.create(
+                            user_id=rng.choice(user_ids), title='Нагрузочное объявление',
+                            description='Запись во время чтения.',
+                            category=rng.choice(CATEGORIES), condition=rng.choice(CONDITIONS),
+                        )
+                    except OperationalError:
+                        errors.append('write')
+                        continue
+                    timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                writes.extend(timings)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return reads, writes, errors
+
+    def report(self, label, seconds, reads, writes, errors):
+        self.stdout.write(label)
+        for name, timings in (('чтение', reads), ('запись', writes)):
+            if timings:
+                stats = summarize(timings)
+                self.stdout.write(
+                    f'  {name}: {len(timings) / seconds:8.1f} в с, '
+                    f'p50 {stats["p50"]:7.2f} мс, p95 {stats["p95"]:7.2f} мс, p99 {stats["p99"]:7.2f} мс'
+                )
+            else:
+                self.stdout.write(f'  {name}: нет успешных операций')
+        if errors:
+            self.stdout.write(f'  ошибок "database is locked": {len(errors)}')
+
+    def handle(self, *args, **options):
+        directory = tempfile.TemporaryDirectory()
+        # WAL работает только с файлом, поэтому тестовая база не в памяти.
+        connections['default'].settings_dict['TEST']['NAME'] = os.path.join(directory.name, 'primary.sqlite3')
+        replica_path = os.path.join(directory.name, 'replica.sqlite3')
+        with directory, benchmark_databases(aliases={'default'}), \
+                override_settings(ALLOWED_HOSTS=['testserver'], ADS_LIST_CACHE_TIMEOUT=0):
+            user_ids = seed_users(100)
+            seed_ads(options['ads'], user_ids)
+            cases = [
+                ('журнал отката, synchronous=FULL', {'ADS_SQLITE_PRAGMAS': ROLLBACK_JOURNAL}, False),
+                ('WAL + ADS_SQLITE_PRAGMAS', {}, False),
+                ('WAL + чтение с реплики', {'ADS_READ_DATABASE': 'replica'}, True),
+            ]
+            for label, overrides, with_replica in cases:
+                # PRAGMA применяются к новым соединениям.
+                connections.close_all()
+                with override_settings(**overrides):
+                    if with_replica:
+                        copy_database(replica_path)
+                        with sqlite_alias('replica', replica_path):
+                            result = self.run_load(options, user_ids)
+                    else:
+                        result = self.run_load(options, user_ids)
+                self.report(label, options['seconds'], *result)
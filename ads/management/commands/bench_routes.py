@@ -0,0 +1,182 @@
+import contextlib
+import itertools
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ads import urls as ads_urls
+from ads.bench import benchmark_databases, find_regressions, seed_barter, summarize
+from ads.models import Ad, ExchangeProposal, SavedSearch
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет каждый маршрут ads/urls.py через тестовый клиент и выводит '
+        'p50/p95/p99, число SQL-запросов и пропускную способность; сохраняет '
+        'базовую линию в JSON и сравнивает с ней.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--ads', type=int, default=10_000)
+        parser.add_argument('--proposals', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--save-baseline', metavar='PATH', help='Записать результаты в JSON.')
+        parser.add_argument('--compare', metavar='PATH', help='Сравнить с сохраненной базовой линией.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25, help='Допустимый рост p95 относительно базовой линии.'
+        )
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help='Не создавать тестовую базу, а мерить на текущей (данные нужны заранее: seed_barter).',
+        )
+
+    def scenarios(self, user, staff):
+        """Имя маршрута -> (пользователь, функция, возвращающая (method, url, data))."""
+        own_ad = Ad.objects.filter(user=user).order_by('pk').first()
+        other_ad = Ad.objects.exclude(user=user).order_by('pk').first()
+        if own_ad is None or other_ad is None:
+            raise CommandError('Нужны объявления у нескольких пользователей.')
+        # Каждый POST обрабатывает новое ожидающее предложение, иначе мерился бы холостой UPDATE.
+        pending = iter(list(
+            ExchangeProposal.objects.filter(ad_receiver__user=user, status='pending')
+            .order_by('pk').values_list('pk', flat=True)
+        ))
+
+        def url(name, **kwargs):
+            return reverse(f'{ads_urls.app_name}:{name}', kwargs=kwargs)
+
+        def get(name, data=None, **kwargs):
+            return lambda: ('get', url(name, **kwargs), data or {})
+
+        def update_status():
+            return 'post', url(
+                'exchange_proposal_update_status', proposal_pk=next(pending, 0), new_status='rejected'
+            ), {}
+
+        def bulk_update_status():
+            ids = [pk for pk in (next(pending, None) for _ in range(10)) if pk]
+            return 'post', url('exchange_proposal_bulk_update_status'), {'status': 'rejected', 'proposal_ids': ids}
+
+        numbers = itertools.count()
+
+        def delete_search():
+            # Поиск создается до замера: каждый POST удаляет существующую строку.
+            search = SavedSearch.objects.create(user=user, query=f'бенч {next(numbers)}', anchor='бенч')
+            return 'post', url('saved_search_delete', pk=search.pk), {}
+
+        return {
+            'ad_list': (user, get('ad_list', {'q': 'ка'})),
+            'ad_create': (user, get('ad_create')),
+            'ad_update': (user, get('ad_update', pk=own_ad.pk)),
+            'ad_delete': (user, get('ad_delete', pk=own_ad.pk)),
+            'exchange_proposal_create': (user, get('exchange_proposal_create', ad_receiver_pk=other_ad.pk)),
+            'ad_autocomplete': (user, get('ad_autocomplete', {'q': 'ка'})),
+            'exchange_proposal_list': (user, get('exchange_proposal_list')),
+            'ad_list_async': (user, get('ad_list_async', {'q': 'ка'})),
+            'exchange_proposal_list_async': (user, get('exchange_proposal_list_async')),
+            'exchange_proposal_update_status': (user, update_status),
+            'exchange_proposal_bulk_update_status': (user, bulk_update_status),
+            'cache_stats': (staff, get('cache_stats')),
+            'inbox_counter': (user, get('inbox_counter')),
+            'ad_api_list': (user, get('ad_api_list')),
+            'ad_export': (user, get('ad_export', {'category': 'книги'})),
+            'barter_cycles': (user, get('barter_cycles')),
+            'saved_search_create': (user, lambda: ('post', url('saved_search_create'), {'q': 'ка', 'category': 'книги'})),
+            'saved_search_delete': (user, delete_search),
+            'feed': (user, get('feed')),
+            'changes': (staff, get('changes')),
+        }
+
+    def measure_route(self, client, request, repeat):
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            method, url, data = request()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f'{method.upper()} {url}: {response.status_code}')
+            queries += len(captured)
+        stats = summarize(timings)
+        return {
+            'p50': stats['p50'], 'p95': stats['p95'], 'p99': stats['p99'],
+            'queries': round(queries / repeat, 2),
+            'rps': round(repeat * 1000 / sum(timings), 1),
+        }
+
+    def run(self, options):
+        # Самый популярный получатель: у него длиннее всего списки предложений.
+        busiest = (
+            ExchangeProposal.objects.filter(status='pending').values('ad_receiver__user')
+            .annotate(total=Count('id')).order_by('-total').values_list('ad_receiver__user', flat=True).first()
+        )
+        user = User.objects.filter(pk=busiest).first() if busiest else User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        staff, _ = User.objects.get_or_create(username='bench_routes_staff', defaults={'is_staff': True})
+        scenarios = self.scenarios(user, staff)
+        missing = [pattern.name for pattern in ads_urls.urlpatterns if pattern.name not in scenarios]
+        if missing:
+            raise CommandError(f'Для маршрутов не описан сценарий: {", ".join(missing)}.')
+
+        results = {}
+        for pattern in ads_urls.urlpatterns:
+            login_as, request = scenarios[pattern.name]
+            client = Client()
+            client.force_login(login_as)
+            # Прогрев: шаблоны, соединение, первый кеш.
+            self.measure_route(client, request, 2)
+            results[pattern.name] = self.measure_route(client, request, options['repeat'])
+        return results
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Не удалось прочитать базовую линию: {exc}')
+
+        databases = contextlib.nullcontext() if options['current_db'] else benchmark_databases(aliases={'default'})
+        with databases, override_settings(ALLOWED_HOSTS=['testserver']):
+            if not options['current_db']:
+                seed_barter(
+                    options['users'], options['ads'], options['proposals'],
+                    rng=random.Random(options['seed']),
+                )
+            results = self.run(options)
+
+        regressions = find_regressions(baseline or {}, results, options['tolerance'])
+        flagged = {route for route, _ in regressions}
+        self.stdout.write(f'{"маршрут":<38} {"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8} {"SQL":>6} {"rps":>8}')
+        for route, stats in results.items():
+            line = (
+                f'{route:<38} {stats["p50"]:8.2f} {stats["p95"]:8.2f} {stats["p99"]:8.2f} '
+                f'{stats["queries"]:6g} {stats["rps"]:8.1f}'
+            )
+            self.stdout.write(self.style.ERROR(line + '  РЕГРЕССИЯ') if route in flagged else line)
+        for route, description in regressions:
+            self.stdout.write(self.style.ERROR(f'{route}: {description}'))
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2, sort_keys=True)
+            self.stdout.write(f'Базовая линия записана в {options["save_baseline"]}.')
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'Регрессий: {len(regressions)}.')
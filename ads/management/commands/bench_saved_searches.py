@@ -0,0 +1,140 @@
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ads import saved_searches
+from ads.bench import (
+    CATEGORIES, CATEGORY_WEIGHTS, CONDITIONS, CONDITION_WEIGHTS, benchmark_databases, format_timing, measure,
+    seed_ads, seed_users, summarize,
+)
+from ads.models import Ad, Category, Condition, FeedItem, SavedSearch, catalogue_key, make_excerpt
+from ads.pagination import CursorPaginator
+from ads.views import filtered_ads
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет сопоставление новых объявлений с сохраненными поисками через индекс якорей '
+        '(по одному и пачками) и сравнивает с перезапуском каждого поиска; '
+        'выводит задержку чтения ленты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--searches', type=int, default=100_000)
+        parser.add_argument('--ads', type=int, default=10_000, help='Объявлений до замера.')
+        parser.add_argument('--new-ads', type=int, default=1000, help='Новых объявлений для сопоставления.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки при импорте.')
+        parser.add_argument('--naive-sample', type=int, default=200, help='Поисков для оценки перезапуска.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed_searches(self, count, user_ids, text, rng):
+        """Поиски по конкретным словам (часть — основы слов), иногда с категорией или только по справочникам.
+
+        Слова запросов выбираются равномерно из словаря: ищут конкретные
+        вещи, а не самые частые слова описаний.
+        """
+        searches = []
+        while len(searches) < count:
+            kind = rng.random()
+            words = [rng.choice(text.vocabulary) for _ in range(2 if 0.55 <= kind < 0.75 else 1)]
+            words = [word[:max(4, len(word) - rng.randint(1, 2))] if rng.random() < 0.3 else word for word in words]
+            query = ' '.join(words) if kind < 0.95 else ''
+            category = catalogue_key(rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0]) if kind >= 0.75 else ''
+            condition = catalogue_key(rng.choices(CONDITIONS, CONDITION_WEIGHTS)[0]) if kind >= 0.95 else ''
+            searches.append(SavedSearch(
+                user_id=rng.choice(user_ids), query=query, category=category, condition=condition,
+                anchor=saved_searches.search_anchor(query, category, condition),
+            ))
+        SavedSearch.objects.bulk_create(searches, batch_size=5000, ignore_conflicts=True)
+
+    def new_ads(self, count, user_ids, text, rng):
+        categories = Category.for_names(CATEGORIES)
+        conditions = Condition.for_names(CONDITIONS)
+        ads = []
+        for _ in range(count):
+            category = rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0]
+            condition = rng.choices(CONDITIONS, CONDITION_WEIGHTS)[0]
+            title, description = text.sentence(2, 6), text.sentence(20, 60)
+            ads.append(Ad(
+                user_id=rng.choice(user_ids), title=title, description=description,
+                excerpt=make_excerpt(description),
+                category=category, condition=condition,
+                category_ref=categories[catalogue_key(category)], condition_ref=conditions[catalogue_key(condition)],
+            ))
+        # Без ads_created_in_bulk: сопоставление меряется отдельно.
+        return Ad.objects.bulk_create(ads)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_databases(aliases={'default'}):
+            user_ids = seed_users(options['users'])
+            text = seed_ads(options['ads'], user_ids, rng=rng)
+            self.seed_searches(options['searches'], user_ids, text, rng)
+            searches = SavedSearch.objects.count()
+            groups = SavedSearch.objects.values('anchor').annotate(total=Count('id')).order_by('-total')
+            largest = groups.first()
+            self.stdout.write(
+                f'сохраненных поисков {searches}, якорей {groups.count()}, '
+                f'самый частый якорь "{largest["anchor"]}" у {largest["total"]} поисков'
+            )
+
+            ads = self.new_ads(options['new_ads'], user_ids, text, rng)
+            half = len(ads) // 2
+            single, bulk = ads[:half], ads[half:]
+
+            found = Counter()
+            timings = []
+            for ad in single:
+                terms = saved_searches.ad_terms(ad)
+                found['candidates'] += sum(
+                    len(rows) for rows in saved_searches.candidates(saved_searches.ad_anchors(terms)).values()
+                )
+                started = time.perf_counter()
+                found['items'] += saved_searches.match_ads([ad])
+                timings.append((time.perf_counter() - started) * 1000)
+            stats = summarize(timings)
+            self.stdout.write(
+                f'по одному объявлению ({len(single)} шт.): кандидатов на объявление '
+                f'{found["candidates"] / len(single):.1f} из {searches}, записей в ленты '
+                f'{found["items"] / len(single):.1f}'
+            )
+            self.stdout.write(f'  {format_timing(stats)}  {len(single) * 1000 / sum(timings):.0f} объявлений/с')
+
+            size = options['batch_size']
+            started = time.perf_counter()
+            items = sum(saved_searches.match_ads(bulk[start:start + size]) for start in range(0, len(bulk), size))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'пачками по {size} ({len(bulk)} шт.): {elapsed * 1000 / len(bulk):.2f} мс на объявление, '
+                f'{len(bulk) / elapsed:.0f} объявлений/с, записей в ленты {items}'
+            )
+
+            # Без индекса каждый поиск пришлось бы выполнить для каждого объявления.
+            sample = list(SavedSearch.objects.order_by('?')[:options['naive_sample']])
+            ad = single[0]
+            checks = iter(sample * 2)
+
+            def run_search():
+                search = next(checks)
+                filters = {'q': search.query, 'category': search.category, 'condition': search.condition}
+                filtered_ads({name: value for name, value in filters.items() if value}).filter(pk=ad.pk).exists()
+
+            stats = measure(run_search, repeat=len(sample) - 2)
+            self.stdout.write(
+                f'перезапуск одного поиска для объявления: {format_timing(stats)}; '
+                f'все {searches} поисков ≈ {stats["mean"] * searches / 1000:.1f} с на объявление'
+            )
+
+            reader = (
+                FeedItem.objects.values('user').annotate(total=Count('id')).order_by('-total')
+                .values_list('user', 'total').first()
+            )
+            if reader:
+                self.stdout.write(f'чтение ленты пользователя с {reader[1]} записями, страница из 10')
+                self.stdout.write('  ' + format_timing(measure(
+                    lambda: list(CursorPaginator(saved_searches.feed_items(reader[0]), 10).get_page(None))
+                )))
@@ -0,0 +1,41 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.models import Ad
+from ads.search import IcontainsSearchBackend, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск через icontains и полнотекстовый индекс на разных объемах данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_databases(aliases={'default'}):
+            user_ids = seed_users(100)
+            text = None
+            seeded = 0
+            for size in sorted(options['sizes']):
+                text = seed_ads(size - seeded, user_ids, rng=rng, text=text)
+                seeded = size
+                # Частое, среднее и редкое слово словаря.
+                words = [text.vocabulary[0], text.vocabulary[50], text.vocabulary[2000]]
+                self.stdout.write(f'\n{size} объявлений')
+                for label, backend in (('icontains', IcontainsSearchBackend()), ('fts', get_backend())):
+                    for word in words:
+                        stats = measure(
+                            lambda: self.first_page(backend, word), repeat=options['repeat'], warmup=1
+                        )
+                        self.stdout.write(f'  {label:<10} {word:<14} {format_timing(stats)}')
+
+    @staticmethod
+    def first_page(backend, word):
+        page = Paginator(backend.search(Ad.objects.all(), word), 5).get_page(1)
+        return list(page)
@@ -0,0 +1,87 @@
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ads import similarity
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.models import Ad, AdTerm, SimilarityTerm
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержку поиска похожих объявлений и полноту top-N относительно точного '
+        'TF-IDF по всем терминам, а также поиск через icontains для сравнения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=50_000)
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--query-terms', nargs='+', type=int, default=[similarity.QUERY_TERMS])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def exact_top(self, ad_id, postings, documents, df, limit):
+        query = postings[ad_id]
+        scores = defaultdict(float)
+        for term_id, weight in query.items():
+            factor = similarity.idf(df[term_id], documents) ** 2 * weight
+            for other_id, other_weight in self.inverted[term_id]:
+                if other_id != ad_id:
+                    scores[other_id] += factor * other_weight
+        return {pk for pk, _ in sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]}
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        limit = options['limit']
+        with benchmark_databases(aliases={'default'}):
+            seed_ads(options['ads'], seed_users(100), rng=rng, reindex=False)
+            started = time.perf_counter()
+            similarity.rebuild()
+            self.stdout.write(
+                f'перестройка индекса: {time.perf_counter() - started:.2f} с, '
+                f'постингов {AdTerm.objects.count()}'
+            )
+
+            documents_term = SimilarityTerm.objects.get(text=similarity.DOCUMENTS_TERM)
+            df = dict(SimilarityTerm.objects.values_list('pk', 'df'))
+            postings = defaultdict(dict)
+            self.inverted = defaultdict(list)
+            for ad_id, term_id, weight in AdTerm.objects.exclude(term=documents_term).values_list(
+                'ad_id', 'term_id', 'weight'
+            ).iterator(chunk_size=10000):
+                postings[ad_id][term_id] = weight
+                self.inverted[term_id].append((ad_id, weight))
+
+            sample = Ad.objects.filter(pk__in=rng.sample(list(postings), options['queries']))
+            sample = list(sample)
+            for max_terms in options['query_terms']:
+                queries = iter(sample * 2)
+                recall = []
+                for ad in sample:
+                    expected = self.exact_top(ad.pk, postings, documents_term.df, df, limit)
+                    found = {found_ad.pk for found_ad in similarity.similar_ads(ad, limit, max_terms=max_terms)}
+                    recall.append(len(expected & found) / len(expected) if expected else 1.0)
+                self.stdout.write(
+                    f'похожие объявления, top-{limit}, терминов запроса {max_terms}, '
+                    f'полнота относительно точного TF-IDF {sum(recall) / len(recall):.3f}'
+                )
+                self.stdout.write('  ' + format_timing(measure(
+                    lambda: list(similarity.similar_ads(next(queries), limit, max_terms=max_terms)),
+                    repeat=len(sample) - 2,
+                )))
+
+            def icontains(ad):
+                words = sorted(set(ad.title.casefold().split()), key=len, reverse=True)[:3]
+                condition = Q()
+                for word in words:
+                    condition |= Q(title__icontains=word) | Q(description__icontains=word)
+                return list(Ad.objects.filter(condition).exclude(pk=ad.pk)[:limit])
+
+            queries = iter(sample * 2)
+            self.stdout.write(f'icontains по словам заголовка, {limit} шт.')
+            self.stdout.write('  ' + format_timing(measure(
+                lambda: icontains(next(queries)), repeat=len(sample) - 2,
+            )))
@@ -0,0 +1,70 @@
+import os
+import random
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ads.bench import CATEGORIES, CONDITIONS, benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.models import Ad, Task
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку создания и редактирования объявления при выполнении '
+        'побочных эффектов в запросе (ADS_TASKS_EAGER) и через очередь, и скорость воркера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=20_000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        directory = tempfile.TemporaryDirectory()
+        # Файловая база: воркеры в потоках ждут блокировку по busy timeout, как в рабочей.
+        connections['default'].settings_dict['TEST']['NAME'] = os.path.join(directory.name, 'tasks.sqlite3')
+        with directory, benchmark_databases(aliases={'default'}), override_settings(ALLOWED_HOSTS=['testserver']):
+            user_ids = seed_users(20)
+            # С сигналами: индекс похожих заполнен, как в рабочей базе.
+            text = seed_ads(options['ads'], user_ids, rng=rng, signals=True)
+            user = User.objects.get(pk=user_ids[0])
+            client = Client()
+            client.force_login(user)
+
+            def data():
+                return {
+                    'title': text.sentence(2, 6), 'description': text.sentence(20, 60),
+                    'category': rng.choice(CATEGORIES), 'condition': rng.choice(CONDITIONS),
+                }
+
+            with override_settings(ADS_TASKS_EAGER=True):
+                own_ad = Ad.objects.create(user=user, **data())
+
+            for label, eager in (('в запросе', True), ('через очередь', False)):
+                with override_settings(ADS_TASKS_EAGER=eager):
+                    create = measure(lambda: client.post(reverse('ads:ad_create'), data()), options['repeat'])
+                    update = measure(
+                        lambda: client.post(reverse('ads:ad_update', kwargs={'pk': own_ad.pk}), data()),
+                        options['repeat'],
+                    )
+                self.stdout.write(f'{label}')
+                self.stdout.write(f'  создание       {format_timing(create)}')
+                self.stdout.write(f'  редактирование {format_timing(update)}')
+
+            queued = Task.objects.count()
+            started = time.perf_counter()
+            call_command('run_tasks', '--once', '--workers', str(options['workers']), stdout=StringIO())
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'воркер: {queued} задач за {elapsed:.2f} с ({queued / elapsed:.0f} в с), '
+                f'осталось {Task.objects.count()}'
+            )
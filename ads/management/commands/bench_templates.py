@@ -0,0 +1,114 @@
+import copy
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils.text import Truncator
+
+from ads.bench import benchmark_databases, format_timing, measure, seed_ads, seed_users
+from ads.models import EXCERPT_WORDS, Ad, Category, Condition, ExchangeProposal
+from ads.pagination import CursorPaginator
+from ads.views import ad_list_context, filtered_ads, user_proposals
+
+FILE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def template_settings(cached):
+    templates = copy.deepcopy(settings.TEMPLATES)
+    for backend in templates:
+        backend['OPTIONS']['loaders'] = (
+            [('django.template.loaders.cached.Loader', FILE_LOADERS)] if cached else FILE_LOADERS
+        )
+    return templates
+
+
+def fragment_cache_settings(enabled):
+    backend = 'locmem.LocMemCache' if enabled else 'dummy.DummyCache'
+    return {
+        **settings.CACHES,
+        'template_fragments': {
+            'BACKEND': f'django.core.cache.backends.{backend}',
+            'LOCATION': 'bench-templates',
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет отрисовку списка объявлений и списка предложений на странице из --page-size '
+        'элементов: без кэшей, с кэшем скомпилированных шаблонов и с кэшем фрагментов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed(self, page_size, rng):
+        """Два пользователя; у первого page_size отправленных и page_size полученных предложений."""
+        user_ids = seed_users(2, prefix='render')
+        seed_ads(page_size * 2, user_ids, rng=rng, signals=True)
+        own, other = (
+            list(Ad.objects.filter(user_id=user_id).values_list('pk', flat=True)) for user_id in user_ids
+        )
+        ExchangeProposal.objects.bulk_create(
+            [ExchangeProposal(ad_sender_id=rng.choice(own), ad_receiver_id=rng.choice(other))
+             for _ in range(page_size)]
+            + [ExchangeProposal(ad_sender_id=rng.choice(other), ad_receiver_id=rng.choice(own))
+               for _ in range(page_size)]
+        )
+        return User.objects.get(pk=user_ids[0])
+
+    def pages(self, user, page_size):
+        """Контексты шаблонов, как их собирают представления; данные читаются один раз."""
+        ads = CursorPaginator(filtered_ads({}).defer('description'), page_size).get_page(None)
+        sent, received = user_proposals(user)
+        return {
+            'ads/ad_list.html': ad_list_context(
+                {}, ads, list(Category.objects.filter(ad_count__gt=0)),
+                list(Condition.objects.filter(ad_count__gt=0)),
+            ),
+            'ads/exchange_proposal_list.html': {
+                'sent_proposals': CursorPaginator(sent, page_size).get_page(None),
+                'received_proposals': CursorPaginator(received, page_size).get_page(None),
+            },
+        }
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        page_size = options['page_size']
+        with benchmark_databases(aliases={'default'}):
+            user = self.seed(page_size, rng)
+            request = RequestFactory().get('/')
+            request.user = user
+            pages = self.pages(user, page_size)
+
+            descriptions = list(Ad.objects.values_list('description', flat=True)[:page_size])
+            stats = measure(
+                lambda: [Truncator(text).words(EXCERPT_WORDS, truncate=' …') for text in descriptions],
+                repeat=options['repeat'],
+            )
+            self.stdout.write(f'truncatewords:{EXCERPT_WORDS} на {len(descriptions)} описаний: {format_timing(stats)}')
+
+            modes = (
+                ('без кэшей', False, False),
+                ('кэш шаблонов', True, False),
+                ('кэш шаблонов и фрагментов', True, True),
+            )
+            for template_name, context in pages.items():
+                self.stdout.write(f'{template_name}, страница из {page_size}')
+                for label, cached, fragments in modes:
+                    with override_settings(
+                        TEMPLATES=template_settings(cached), CACHES=fragment_cache_settings(fragments),
+                    ):
+                        # Первые прогоны measure заполняют кэш фрагментов.
+                        stats = measure(
+                            lambda: render_to_string(template_name, context, request), repeat=options['repeat']
+                        )
+                    self.stdout.write(f'  {label:<27} {format_timing(stats)}')
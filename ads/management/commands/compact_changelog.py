@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ads.changelog import compact
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из журнала изменений перекрытые более новыми записи и старые удаления пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=settings.ADS_CHANGELOG_COMPACT_AFTER,
+            help='Уплотнять записи старше стольких секунд.',
+        )
+        parser.add_argument(
+            '--tombstones-older-than', type=float, default=settings.ADS_CHANGELOG_TOMBSTONE_RETENTION,
+            help='Удалять записи об удалении старше стольких секунд.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05, help='Пауза между DELETE, с.')
+
+    def handle(self, *args, **options):
+        stats = compact(
+            options['older_than'], options['tombstones_older_than'],
+            batch_size=options['batch_size'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей журнала: перекрытых {stats["superseded"]}, удалений {stats["tombstones"]}; '
+            f'операторов DELETE: {stats["statements"]}.'
+        ))
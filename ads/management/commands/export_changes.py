@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ads import changelog
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит в stdout журнал изменений объявлений и предложений после курсора в NDJSON, '
+        'страницами по --batch-size; следующий курсор пишется в stderr.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cursor', default='', help='Курсор предыдущей выгрузки; пусто — с начала журнала.')
+        parser.add_argument('--batch-size', type=int, default=changelog.CHANGES_PAGE_SIZE)
+        parser.add_argument('--max-batches', type=int, help='Не больше стольких страниц за запуск.')
+
+    def handle(self, *args, **options):
+        try:
+            position = changelog.parse_cursor(options['cursor'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if changelog.cursor_expired(position):
+            raise CommandError('Курсор старше срока хранения журнала, нужна полная синхронизация.')
+        cursor, batches, total = options['cursor'], 0, 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            entries = changelog.entries_since(position, options['batch_size'])
+            for chunk in changelog.stream_ndjson(entries):
+                self.stdout.write(chunk, ending='')
+            batches += 1
+            total += len(entries)
+            if entries:
+                position = (entries[-1][1], entries[-1][0])
+                cursor = changelog.make_cursor(entries[-1])
+            if len(entries) < options['batch_size']:
+                break
+        self.stderr.write(f'Изменений: {total}, страниц: {batches}. Следующий курсор: {cursor}')
@@ -0,0 +1,55 @@
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.matching import DEFAULT_CYCLE_LENGTH, MIN_CYCLE_LENGTH, WantsGraph, rebuild_edges
+
+
+class Command(BaseCommand):
+    help = 'Ищет цепочки обмена (циклы в графе ожидающих предложений).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=DEFAULT_CYCLE_LENGTH)
+        parser.add_argument('--min-length', type=int, default=MIN_CYCLE_LENGTH)
+        parser.add_argument('--user', help='Только цепочки с участием пользователя (username).')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько цепочек вывести.')
+        parser.add_argument(
+            '--rebuild', action='store_true', help='Пересчитать граф из предложений перед поиском.'
+        )
+
+    def handle(self, *args, **options):
+        max_length = options['max_length']
+        if max_length < options['min_length'] or options['min_length'] < 2:
+            raise CommandError('Нужно 2 <= --min-length <= --max-length.')
+        if options['rebuild']:
+            self.stdout.write(f'Ребер в графе: {rebuild_edges()}')
+
+        started = time.perf_counter()
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {options["user"]!r} не найден.')
+            graph = WantsGraph.load_around(user.pk, max_length)
+            cycles = graph.cycles_from(user.pk, max_length, options['min_length'])
+        else:
+            graph = WantsGraph.load()
+            cycles = graph.cycles(max_length, options['min_length'])
+        shown = list(islice(cycles, options['limit']))
+        lengths = Counter(len(cycle) for cycle in shown)
+        lengths.update(len(cycle) for cycle in cycles)
+        elapsed = time.perf_counter() - started
+
+        usernames = dict(
+            User.objects.filter(pk__in={pk for cycle in shown for pk in cycle}).values_list('pk', 'username')
+        )
+        for cycle in shown:
+            self.stdout.write(' -> '.join(usernames[pk] for pk in cycle + cycle[:1]))
+        self.stdout.write(self.style.SUCCESS(
+            f'Найдено цепочек: {sum(lengths.values())} '
+            f'({", ".join(f"длина {length}: {total}" for length, total in sorted(lengths.items())) or "нет"}), '
+            f'ребер: {len(graph)}, {elapsed:.2f} с.'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ads.importing import AdImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Импортирует объявления из JSONL или CSV пачками через bulk_create.'
+    importer_class = AdImporter
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='По умолчанию по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='Файл контрольной точки для продолжения импорта.')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить строки, ничего не записывая.')
+        parser.add_argument('--progress-every', type=float, default=5.0, help='Интервал отчета в секундах.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        importer = self.importer_class(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+            checkpoint=options['checkpoint'],
+            on_progress=lambda stats: self.stdout.write(str(stats)),
+            on_error=lambda number, message: self.stderr.write(f'строка {number}: {message}'),
+            progress_every=options['progress_every'],
+        )
+        try:
+            rows = read_rows(options['path'], options['format'])
+            stats = importer.run(rows)
+        except OSError as exc:
+            raise CommandError(exc)
+        prefix = 'Проверка завершена' if options['dry_run'] else 'Импорт завершен'
+        self.stdout.write(self.style.SUCCESS(f'{prefix}: {stats}'))
@@ -0,0 +1,8 @@
+from ads.importing import ProposalImporter
+
+from .import_ads import Command as ImportAdsCommand
+
+
+class Command(ImportAdsCommand):
+    help = 'Импортирует предложения обмена из JSONL или CSV; объявления ищутся по внешнему id.'
+    importer_class = ProposalImporter
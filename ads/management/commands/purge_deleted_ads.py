@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ads.purge import purge_deleted_ads
+
+
+class Command(BaseCommand):
+    help = 'Окончательно удаляет помеченные удаленными объявления и их предложения пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=settings.ADS_PURGE_DELETED_AFTER,
+            help='Удалять объявления, помеченные раньше стольких секунд назад.',
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.ADS_PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.ADS_PURGE_PAUSE, help='Пауза между DELETE, с.')
+        parser.add_argument('--max-ads', type=int, help='Не больше стольких объявлений за запуск.')
+
+    def handle(self, *args, **options):
+        stats = purge_deleted_ads(
+            options['older_than'], batch_size=options['batch_size'],
+            pause=options['pause'], max_ads=options['max_ads'],
+        )
+        rows = ', '.join(f'{name} {count}' for name, count in sorted(stats.items()) if name != 'statements')
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено: {rows or "ничего"}; операторов DELETE: {stats["statements"]}.'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from ads import inbox
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики предложений пользователей из ожидающих предложений.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны: пользователей {inbox.rebuild()}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ads import similarity
+from ads.models import AdTerm, SimilarityTerm
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс похожих объявлений.'
+
+    def handle(self, *args, **options):
+        similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен: терминов {SimilarityTerm.objects.count()}, постингов {AdTerm.objects.count()}.'
+        ))
@@ -0,0 +1,74 @@
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from ads import queue
+
+
+def init_process():
+    # Нужен при запуске процессов через spawn; при fork setup() ничего не делает.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди (ads.queue) в пуле потоков или процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Размер пула; 1 — без пула, в этом процессе.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--batch', type=int, help='Сколько задач забирать за раз (по умолчанию 2 * workers).')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, с.')
+        parser.add_argument('--once', action='store_true', help='Выйти, когда готовых задач не останется.')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        workers = max(1, options['workers'])
+        batch = options['batch'] or 2 * workers
+        executor = None
+        if workers > 1 and options['pool'] == 'process':
+            # Соединения не должны наследоваться дочерними процессами.
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers, initializer=init_process)
+        elif workers > 1:
+            executor = ThreadPoolExecutor(workers)
+
+        done = failed = 0
+        try:
+            while not self.stopping:
+                close_old_connections()
+                claimed = queue.claim(batch)
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for (pk, name, kwargs, attempts, max_attempts), error in self.run_batch(executor, claimed):
+                    # Задачу с истекшей арендой уже забрал другой воркер: она не считается.
+                    if error is None:
+                        done += queue.complete(pk, attempts)
+                    else:
+                        failed += queue.fail(pk, attempts, max_attempts, error)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}, с ошибкой: {failed}.'))
+
+    def run_batch(self, executor, claimed):
+        if executor is None:
+            for row in claimed:
+                yield row, queue.execute(row[1], row[2])
+            return
+        futures = {executor.submit(queue.execute, row[1], row[2]): row for row in claimed}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def stop(self, signum, frame):
+        # Текущая пачка дорабатывается, новые задачи не забираются.
+        self.stopping = True
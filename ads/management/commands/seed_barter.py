@@ -0,0 +1,43 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ads.bench import seed_barter
+from ads.models import Ad, ExchangeProposal
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет текущую базу синтетическими данными: пользователи, объявления '
+        'с реалистичными категориями и текстом, предложения с перекосом популярности.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ads', type=int, default=20_000)
+        parser.add_argument('--proposals', type=int, default=50_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности объявлений-получателей.',
+        )
+        parser.add_argument('--password', help='Пароль пользователей (по умолчанию вход по паролю запрещен).')
+        parser.add_argument('--prefix', default='user', help='Префикс имен пользователей.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 and options['proposals']:
+            raise CommandError('Для предложений нужно хотя бы два пользователя.')
+        started = time.perf_counter()
+        with transaction.atomic():
+            seed_barter(
+                options['users'], options['ads'], options['proposals'],
+                rng=random.Random(options['seed']), skew=options['skew'],
+                password=options['password'], prefix=options['prefix'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {options["users"]}, объявлений {options["ads"]}, '
+            f'предложений {options["proposals"]} за {time.perf_counter() - started:.1f} с. '
+            f'Всего в базе: объявлений {Ad.objects.count()}, предложений {ExchangeProposal.objects.count()}.'
+        ))
@@ -0,0 +1,220 @@
+"""Поиск многосторонних обменов в графе желаний пользователей.
+
+Ребро u -> v означает, что у пользователя u есть ожидающее предложение на
+объявление пользователя v; цикл u1 -> u2 -> ... -> u1 — обмен, в котором
+каждый участник получает желаемое. Ребра хранятся агрегированно в
+WantEdge и обновляются сигналами при создании и закрытии предложений,
+поэтому поиск не перестраивает граф из ExchangeProposal.
+
+Циклы ищутся ограниченным по длине поиском в глубину: при полном переборе
+каждый цикл начинается с наименьшего id (обход идет только по большим id),
+а ветви отсекаются по расстоянию до стартовой вершины, посчитанному
+обратным обходом в ширину.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Ad, ExchangeProposal, WantEdge
+
+MIN_CYCLE_LENGTH = 3
+DEFAULT_CYCLE_LENGTH = 4
+MAX_CYCLE_LENGTH = 5
+UPSERT_BATCH_SIZE = 500
+
+
+def _upsert_edges(source, params):
+    """INSERT ... ON CONFLICT с прибавлением счетчика; возвращает пользователей с обнулившимися ребрами."""
+    table = connection.ops.quote_name(WantEdge._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (from_user_id, to_user_id, proposal_count) {source} '
+            f'ON CONFLICT (from_user_id, to_user_id) '
+            f'DO UPDATE SET proposal_count = {table}.proposal_count + excluded.proposal_count '
+            f'RETURNING from_user_id, proposal_count',
+            params,
+        )
+        return {from_user for from_user, count in cursor.fetchall() if count <= 0}
+
+
+def _delete_empty_edges(from_users):
+    if from_users:
+        WantEdge.objects.filter(from_user__in=from_users, proposal_count__lte=0).delete()
+
+
+def shift_edges(deltas):
+    """Применяет Counter {(from_user_id, to_user_id): дельта} к WantEdge одним запросом на пачку."""
+    items = [(pair, delta) for pair, delta in deltas.items() if delta and pair[0] != pair[1]]
+    released = set()
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        batch = items[start:start + UPSERT_BATCH_SIZE]
+        released |= _upsert_edges(
+            f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))}',
+            [value for (from_user, to_user), delta in batch for value in (from_user, to_user, delta)],
+        )
+    _delete_empty_edges(released)
+
+
+def release_proposals(proposal_ids):
+    """Вычитает предложения proposal_ids из ребер, группируя их по парам пользователей в SQL."""
+    proposal_ids = [int(pk) for pk in proposal_ids]
+    if not proposal_ids:
+        return
+    quote = connection.ops.quote_name
+    proposal_table, ad_table = quote(ExchangeProposal._meta.db_table), quote(Ad._meta.db_table)
+    _delete_empty_edges(_upsert_edges(
+        f'SELECT sender.user_id, receiver.user_id, -COUNT(*) FROM {proposal_table} proposal '
+        f'JOIN {ad_table} sender ON sender.id = proposal.ad_sender_id '
+        f'JOIN {ad_table} receiver ON receiver.id = proposal.ad_receiver_id '
+        f'WHERE proposal.id IN ({", ".join(["%s"] * len(proposal_ids))}) '
+        f'AND sender.user_id <> receiver.user_id '
+        f'GROUP BY sender.user_id, receiver.user_id',
+        proposal_ids,
+    ))
+
+
+def user_pairs(ad_pairs):
+    """Counter пар пользователей для пар (ad_sender_id, ad_receiver_id)."""
+    ad_pairs = list(ad_pairs)
+    owners = dict(
+        Ad.objects.filter(pk__in={ad_id for pair in ad_pairs for ad_id in pair}).values_list('pk', 'user_id')
+    )
+    return Counter(
+        (owners[sender], owners[receiver]) for sender, receiver in ad_pairs
+        if sender in owners and receiver in owners
+    )
+
+
+def rebuild_edges():
+    """Пересчитывает WantEdge из ожидающих предложений. Возвращает число ребер."""
+    pairs = (
+        ExchangeProposal.objects.filter(status='pending').order_by()
+        .values_list('ad_sender__user_id', 'ad_receiver__user_id').annotate(total=Count('id'))
+    )
+    WantEdge.objects.all().delete()
+    edges = WantEdge.objects.bulk_create([
+        WantEdge(from_user_id=from_user, to_user_id=to_user, proposal_count=total)
+        for from_user, to_user, total in pairs.iterator()
+        if from_user != to_user
+    ], batch_size=1000)
+    return len(edges)
+
+
+class WantsGraph:
+
+    def __init__(self, edges=()):
+        self.successors = defaultdict(set)
+        self.predecessors = defaultdict(set)
+        for from_user, to_user in edges:
+            self.add_edge(from_user, to_user)
+
+    def __len__(self):
+        return sum(len(targets) for targets in self.successors.values())
+
+    def add_edge(self, from_user, to_user):
+        self.successors[from_user].add(to_user)
+        self.predecessors[to_user].add(from_user)
+
+    def remove_edge(self, from_user, to_user):
+        self.successors[from_user].discard(to_user)
+        self.predecessors[to_user].discard(from_user)
+
+    @staticmethod
+    def _edges():
+        return WantEdge.objects.filter(proposal_count__gt=0).values_list('from_user_id', 'to_user_id')
+
+    @classmethod
+    def load(cls):
+        return cls(cls._edges().iterator(chunk_size=10000))
+
+    @classmethod
+    def load_around(cls, user_id, max_length):
+        """Подграф, содержащий все циклы через user_id длиной до max_length.
+
+        Исходящие ребра загружаются на max_length // 2 шагов вперед, входящие —
+        на оставшиеся шаги назад: любое ребро такого цикла попадает в одну из
+        половин. Всего max_length запросов, каждый по фронту обхода.
+        """
+        graph = cls()
+        forward = max_length // 2
+        for lookup, next_index, steps in (
+            ('from_user__in', 1, forward),
+            ('to_user__in', 0, max_length - forward),
+        ):
+            frontier = seen = {user_id}
+            for _ in range(steps):
+                edges = list(cls._edges().filter(**{lookup: frontier}))
+                for edge in edges:
+                    graph.add_edge(*edge)
+                frontier = {edge[next_index] for edge in edges} - seen
+                seen = seen | frontier
+                if not frontier:
+                    break
+        return graph
+
+    def _distances_to(self, target, limit, allowed):
+        distances = {target: 0}
+        frontier = [target]
+        for distance in range(1, limit + 1):
+            next_frontier = []
+            for node in frontier:
+                for source in self.predecessors.get(node, ()):
+                    if source not in distances and allowed(source):
+                        distances[source] = distance
+                        next_frontier.append(source)
+            frontier = next_frontier
+        return distances
+
+    def cycles_from(self, start, max_length, min_length=MIN_CYCLE_LENGTH, allowed=None):
+        """Простые циклы start -> ... -> start длиной от min_length до max_length.
+
+        allowed ограничивает промежуточные вершины; с allowed=None каждый цикл
+        через start выдается ровно один раз.
+        """
+        allowed = allowed or (lambda node: True)
+        distances = self._distances_to(start, max_length - 1, allowed)
+        path = [start]
+        on_path = {start}
+
+        def extend(node):
+            for target in self.successors.get(node, ()):
+                if target == start:
+                    if len(path) >= min_length:
+                        yield tuple(path)
+                elif target not in on_path and len(path) + distances.get(target, max_length) <= max_length:
+                    path.append(target)
+                    on_path.add(target)
+                    yield from extend(target)
+                    on_path.discard(path.pop())
+
+        yield from extend(start)
+
+    def cycles(self, max_length, min_length=MIN_CYCLE_LENGTH):
+        """Все простые циклы графа; каждый начинается с наименьшего id участника."""
+        for start in sorted(self.successors):
+            yield from self.cycles_from(start, max_length, min_length, allowed=lambda node, start=start: node > start)
+
+
+def cycle_proposals(cycles):
+    """Для каждого цикла пользователей — список ожидающих предложений по его ребрам.
+
+    Одним запросом выбирается самое новое предложение для каждой пары.
+    """
+    pairs = {(cycle[i], cycle[(i + 1) % len(cycle)]) for cycle in cycles for i in range(len(cycle))}
+    if not pairs:
+        return []
+    condition = Q()
+    for from_user, to_user in pairs:
+        condition |= Q(ad_sender__user_id=from_user, ad_receiver__user_id=to_user)
+    by_pair = {}
+    proposals = (
+        ExchangeProposal.objects.filter(condition, status='pending')
+        .select_related('ad_sender__user', 'ad_receiver__user').order_by('-created_at', '-id')
+    )
+    for proposal in proposals:
+        by_pair.setdefault((proposal.ad_sender.user_id, proposal.ad_receiver.user_id), proposal)
+    return [
+        [by_pair.get((cycle[i], cycle[(i + 1) % len(cycle)])) for i in range(len(cycle))]
+        for cycle in cycles
+    ]
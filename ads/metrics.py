@@ -0,0 +1,204 @@
+"""Метрики производительности запросов в формате Prometheus.
+
+Для каждого имени маршрута (ads:ad_list, ...) копятся гистограммы
+длительности запроса и числа SQL-запросов, суммарное время SQL и рендера
+шаблонов. Длительность меряется у всех запросов, а SQL и шаблоны — только
+у выбранных с вероятностью ADS_METRICS_SAMPLE_RATE: обертка execute_wrapper
+стоит на каждом соединении постоянно, но без активной выборки только
+передает вызов дальше.
+
+Метрики хранятся в памяти процесса; при нескольких воркерах каждый отдает
+свои, и Prometheus различает их по instance.
+"""
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('ads.performance')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+UNRESOLVED_ROUTE = '<unresolved>'
+
+current_sample = ContextVar('ads_metrics_sample', default=None)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """SQL без литералов и с одним "(...)" вместо списков параметров IN/VALUES."""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_LIST_RE.sub('(...)', sql.replace('%s', '?'))
+    sql = re.sub(r'(\(\.\.\.\)\s*,\s*)+\(\.\.\.\)', '(...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class Sample:
+    """Счетчики одного выбранного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slow_queries = 0
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+
+class RouteStats:
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slow_queries = 0
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def record(self, route, duration, sample=None):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = RouteStats()
+            stats.duration.observe(duration)
+            if sample is not None:
+                stats.queries.observe(sample.queries)
+                stats.sql_time += sample.sql_time
+                stats.template_time += sample.template_time
+                stats.slow_queries += sample.slow_queries
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4."""
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = []
+
+            def histogram(name, help_text, attribute):
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} histogram'])
+                for route, stats in routes:
+                    hist = getattr(stats, attribute)
+                    if not hist.count:
+                        continue
+                    label = f'route="{escape_label(route)}"'
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {hist.count}')
+                    lines.append(f'{name}_sum{{{label}}} {hist.total}')
+                    lines.append(f'{name}_count{{{label}}} {hist.count}')
+
+            def counter(name, help_text, attribute):
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} counter'])
+                for route, stats in routes:
+                    lines.append(f'{name}{{route="{escape_label(route)}"}} {getattr(stats, attribute)}')
+
+            histogram('ads_request_duration_seconds', 'Длительность запроса.', 'duration')
+            histogram('ads_request_queries', 'Число SQL-запросов на запрос (выборка).', 'queries')
+            counter('ads_request_sql_seconds_total', 'Время SQL (выборка).', 'sql_time')
+            counter('ads_request_template_seconds_total', 'Время рендера шаблонов (выборка).', 'template_time')
+            counter('ads_slow_queries_total', 'SQL-запросы дольше ADS_SLOW_QUERY_MS (выборка).', 'slow_queries')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED_ROUTE
+
+
+def sql_timer(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        sample.queries += 1
+        sample.sql_time += elapsed
+        if elapsed * 1000 >= settings.ADS_SLOW_QUERY_MS:
+            sample.slow_queries += 1
+            logger.warning(
+                'Медленный запрос %.1f мс (%s): %s',
+                elapsed * 1000, context['connection'].alias, normalize_sql(sql),
+            )
+
+
+def install_sql_timer(connection):
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    install_sql_timer(connection)
+
+
+class InstrumentedTemplate:
+    """Обертка шаблона бэкенда, добавляющая время render() к текущей выборке."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        sample = current_sample.get()
+        if sample is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            sample.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
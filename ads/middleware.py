@@ -0,0 +1,52 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .metrics import Sample, current_sample, install_sql_timer, registry, route_name
+
+
+class PerformanceMiddleware:
+    """Записывает метрики запроса в ads.metrics.registry.
+
+    Ставится первым в MIDDLEWARE, чтобы учитывать время остальных
+    middleware. Работает и в синхронном, и в асинхронном режиме, поэтому
+    не добавляет переходов между потоками для async-представлений.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self):
+        sample = None
+        if random.random() < settings.ADS_METRICS_SAMPLE_RATE:
+            sample = Sample()
+            for connection in connections.all(initialized_only=True):
+                install_sql_timer(connection)
+        return sample, current_sample.set(sample), time.perf_counter()
+
+    def finish(self, request, sample, token, started):
+        current_sample.reset(token)
+        registry.record(route_name(request), time.perf_counter() - started, sample)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample, token, started = self.start()
+        try:
+            return self.get_response(request)
+        finally:
+            self.finish(request, sample, token, started)
+
+    async def __acall__(self, request):
+        sample, token, started = self.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finish(request, sample, token, started)
@@ -0,0 +1,53 @@
+import ads.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS ads_ad_fts USING fts5(title, description)'
+        )
+        schema_editor.execute(
+            'INSERT INTO ads_ad_fts (rowid, title, description) '
+            'SELECT id, title, description FROM ads_ad'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS ads_ad_search_idx ON ads_ad USING GIN '
+            "(to_tsvector('simple', title || ' ' || description))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS ads_ad_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS ads_ad_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdSearchEntry',
+            fields=[
+                ('ad', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='ads.ad')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('document', ads.search.FTSDocumentField(db_column='ads_ad_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'ads_ad_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
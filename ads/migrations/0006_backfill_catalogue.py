@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def catalogue_key(name):
+    return ' '.join((name or '').split()).casefold()
+
+
+def backfill(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    for text_field, model_name in (('category', 'Category'), ('condition', 'Condition')):
+        model = apps.get_model('ads', model_name)
+        ref_field = f'{text_field}_ref'
+        names = Ad.objects.order_by().values_list(text_field, flat=True).distinct()
+        entries = {}
+        for name in names:
+            key = catalogue_key(name)
+            if key not in entries:
+                entries[key] = model.objects.get_or_create(
+                    key=key, defaults={'name': ' '.join(name.split())}
+                )[0]
+            Ad.objects.filter(**{text_field: name}).update(**{ref_field: entries[key]})
+        counts = Ad.objects.order_by().values(ref_field).annotate(total=Count('id'))
+        for row in counts:
+            model.objects.filter(pk=row[ref_field]).update(ad_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0005_category_condition_catalogue'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
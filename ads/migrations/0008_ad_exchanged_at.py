@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_external_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='exchanged_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['ad_sender'], name='ads_prop_pending_sender_idx'),
+        ),
+    ]
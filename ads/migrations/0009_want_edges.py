@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    WantEdge = apps.get_model('ads', 'WantEdge')
+    pairs = (
+        ExchangeProposal.objects.filter(status='pending').order_by()
+        .values('ad_sender__user_id', 'ad_receiver__user_id').annotate(total=Count('id'))
+    )
+    WantEdge.objects.bulk_create([
+        WantEdge(
+            from_user_id=row['ad_sender__user_id'],
+            to_user_id=row['ad_receiver__user_id'],
+            proposal_count=row['total'],
+        )
+        for row in pairs.iterator()
+        if row['ad_sender__user_id'] != row['ad_receiver__user_id']
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_ad_exchanged_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WantEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proposal_count', models.IntegerField(default=0)),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('to_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['to_user', 'from_user'], name='ads_wantedge_to_idx')],
+                'constraints': [models.UniqueConstraint(fields=('from_user', 'to_user'), name='ads_wantedge_pair_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
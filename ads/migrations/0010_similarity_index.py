@@ -0,0 +1,104 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:41
+
+import math
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Замороженная копия ads.similarity на момент миграции: миграция не должна
+# зависеть от текущего кода модуля и моделей.
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+DOCUMENTS_TERM = '#documents'
+TITLE_WEIGHT = 2
+CATEGORY_WEIGHT = 3
+MAX_TERM_LENGTH = 100
+BATCH_SIZE = 2000
+LOOKUP_BATCH_SIZE = 500
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').casefold())
+
+
+def document_vector(title, description, category):
+    counts = Counter(tokenize(description))
+    for token in tokenize(title):
+        counts[token] += TITLE_WEIGHT
+    if category:
+        counts[f'category:{" ".join(category.split()).casefold()}'] += CATEGORY_WEIGHT
+    counts = Counter({term[:MAX_TERM_LENGTH]: tf for term, tf in counts.items()})
+    norm = math.sqrt(len(counts)) or 1.0
+    vector = {term: (1 + math.log(tf)) / norm for term, tf in counts.items()}
+    vector[DOCUMENTS_TERM] = 0.0
+    return vector
+
+
+def build_index(apps, schema_editor):
+    Ad = apps.get_model('ads', 'Ad')
+    SimilarityTerm = apps.get_model('ads', 'SimilarityTerm')
+    AdTerm = apps.get_model('ads', 'AdTerm')
+    db = schema_editor.connection.alias
+    term_ids = {}
+    df = Counter()
+    last_pk = 0
+    while True:
+        ads = list(
+            Ad.objects.using(db).filter(pk__gt=last_pk).order_by('pk')
+            .only('title', 'description', 'category')[:BATCH_SIZE]
+        )
+        if not ads:
+            break
+        last_pk = ads[-1].pk
+        vectors = {ad.pk: document_vector(ad.title, ad.description, ad.category) for ad in ads}
+        new_terms = sorted({term for vector in vectors.values() for term in vector} - term_ids.keys())
+        SimilarityTerm.objects.using(db).bulk_create([SimilarityTerm(text=text) for text in new_terms])
+        for start in range(0, len(new_terms), LOOKUP_BATCH_SIZE):
+            term_ids.update(
+                SimilarityTerm.objects.using(db)
+                .filter(text__in=new_terms[start:start + LOOKUP_BATCH_SIZE]).values_list('text', 'pk')
+            )
+        AdTerm.objects.using(db).bulk_create(
+            [
+                AdTerm(ad_id=ad_id, term_id=term_ids[term], weight=weight)
+                for ad_id, vector in vectors.items()
+                for term, weight in vector.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        df.update(term_ids[term] for vector in vectors.values() for term in vector)
+    SimilarityTerm.objects.using(db).bulk_update(
+        [SimilarityTerm(pk=term_id, df=count) for term_id, count in df.items()], ['df'], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0009_want_edges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=100, unique=True)),
+                ('df', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='ads.ad')),
+                ('term', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='ads.similarityterm')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'ad'), name='ads_adterm_term_ad_uniq')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
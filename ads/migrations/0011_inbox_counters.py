@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    InboxCounter = apps.get_model('ads', 'InboxCounter')
+    pending = ExchangeProposal.objects.filter(status='pending').order_by()
+    counters = {}
+    for field, path in (('pending_received', 'ad_receiver__user_id'), ('pending_sent', 'ad_sender__user_id')):
+        for user_id, total in pending.values_list(path).annotate(total=Count('id')).iterator():
+            setattr(counters.setdefault(user_id, InboxCounter(user_id=user_id)), field, total)
+    InboxCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0010_similarity_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inbox_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_received', models.IntegerField(default=0)),
+                ('pending_sent', models.IntegerField(default=0)),
+                ('unseen', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
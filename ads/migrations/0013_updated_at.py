@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill(apps, schema_editor):
+    # Без истории изменений лучшее приближение — время создания или обмена.
+    Ad = apps.get_model('ads', 'Ad')
+    ExchangeProposal = apps.get_model('ads', 'ExchangeProposal')
+    Ad.objects.update(updated_at=F('created_at'))
+    Ad.objects.filter(exchanged_at__isnull=False).update(updated_at=F('exchanged_at'))
+    ExchangeProposal.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0012_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
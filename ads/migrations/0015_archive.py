@@ -0,0 +1,82 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0014_soft_delete'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAd',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('image_url', models.URLField(blank=True, null=True)),
+                ('category', models.CharField(max_length=100)),
+                ('condition', models.CharField(max_length=50)),
+                ('external_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('exchanged_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedProposal',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('ad_sender_id', models.BigIntegerField()),
+                ('ad_receiver_id', models.BigIntegerField()),
+                ('sender_title', models.CharField(max_length=200)),
+                ('receiver_title', models.CharField(max_length=200)),
+                ('comment', models.TextField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('accepted', 'Принята'), ('rejected', 'Отклонена')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(condition=models.Q(('exchanged_at__isnull', False)), fields=['exchanged_at'], name='ads_ad_exchanged_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'pending'), _negated=True), fields=['updated_at', 'id'], name='ads_prop_resolved_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedad',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedproposal',
+            name='receiver_user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedproposal',
+            name='sender_user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedad',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='ads_archivedad_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedproposal',
+            index=models.Index(fields=['sender_user', '-created_at', '-id'], name='ads_archprop_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedproposal',
+            index=models.Index(fields=['receiver_user', '-created_at', '-id'], name='ads_archprop_receiver_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:08
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    # Та же формула, что ads.models.make_excerpt на момент миграции.
+    Ad = apps.get_model('ads', 'Ad')
+    last_pk = 0
+    while True:
+        ads = list(Ad.objects.filter(pk__gt=last_pk).order_by('pk').only('description')[:BATCH_SIZE])
+        if not ads:
+            return
+        for ad in ads:
+            ad.excerpt = Truncator(ad.description or '').words(30, truncate=' …')
+        Ad.objects.bulk_update(ads, ['excerpt'])
+        last_pk = ads[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0017_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,157 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.text import Truncator
+from .search import FTSDocumentField
+
+EXCERPT_WORDS = 30
+
+def catalogue_key(name):
+    return ' '.join((name or '').split()).casefold()
+
+def make_excerpt(text):
+    """Начало описания для списков; совпадает с фильтром truncatewords:30."""
+    return Truncator(text or '').words(EXCERPT_WORDS, truncate=' …')
+
+
+class CatalogueEntry(models.Model):
+    """Значение справочника с числом активных объявлений.
+
+    ad_count обновляется инкрементально сигналами Ad, поэтому боковая
+    панель фильтров строится чтением справочника без GROUP BY по ads_ad.
+    """
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True)
+    ad_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def for_name(cls, name):
+        entry, _ = cls.objects.get_or_create(
+            key=catalogue_key(name), defaults={'name': ' '.join(name.split())}
+        )
+        return entry
+
+    @classmethod
+    def for_names(cls, names):
+        """Словарь ключ -> запись для набора имен за один запрос плюс вставку новых."""
+        names_by_key = {catalogue_key(name): ' '.join(name.split()) for name in names}
+        entries = {entry.key: entry for entry in cls.objects.filter(key__in=names_by_key)}
+        missing = [key for key in names_by_key if key not in entries]
+        if missing:
+            cls.objects.bulk_create(
+                [cls(key=key, name=names_by_key[key]) for key in missing], ignore_conflicts=True
+            )
+            entries.update((entry.key, entry) for entry in cls.objects.filter(key__in=missing))
+        return entries
+
+
+class Category(CatalogueEntry):
+
+    class Meta(CatalogueEntry.Meta):
+        indexes = [models.Index(fields=['name'], name='ads_category_name_idx')]
+
+
+class Condition(CatalogueEntry):
+
+    class Meta(CatalogueEntry.Meta):
+        indexes = [models.Index(fields=['name'], name='ads_condition_name_idx')]
+
+
+class ActiveAdManager(models.Manager):
+    """Объявления без пометки об удалении (см. ads.services.soft_delete_ad)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 class Ad(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     description = models.TextField()
+    # make_excerpt(description): ставится в save(), при bulk_create — явно.
+    excerpt = models.TextField(blank=True, default='', editable=False)
     image_url = models.URLField(max_length=200, blank=True, null=True)
     category = models.CharField(max_length=100) 
     condition = models.CharField(max_length=50)
+    category_ref = models.ForeignKey(
+        Category, related_name='ads', on_delete=models.PROTECT, null=True, blank=True, editable=False
+    )
+    condition_ref = models.ForeignKey(
+        Condition, related_name='ads', on_delete=models.PROTECT, null=True, blank=True, editable=False
+    )
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+    exchanged_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # auto_now не срабатывает в QuerySet.update() и сыром SQL — там поле ставится явно.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Удаленные скрыты менеджером objects; строки удаляет команда purge_deleted_ads.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveAdManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='ads_ad_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='ads_ad_user_created_idx'),
+            models.Index(fields=['category_ref', '-created_at', '-id'], name='ads_ad_category_created_idx'),
+            models.Index(fields=['condition_ref', '-created_at', '-id'], name='ads_ad_condition_created_idx'),
+            models.Index(
+                fields=['deleted_at'], name='ads_ad_deleted_idx', condition=models.Q(deleted_at__isnull=False)
+            ),
+            models.Index(
+                fields=['exchanged_at'], name='ads_ad_exchanged_idx', condition=models.Q(exchanged_at__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_catalogue_refs()
+        return instance
+
+    def remember_catalogue_refs(self):
+        self._saved_refs = (
+            self.__dict__.get('category_ref_id'),
+            self.__dict__.get('condition_ref_id'),
+        )
+
+    def resolve_catalogue_refs(self):
+        if self.category_ref_id is None or self.category_ref.key != catalogue_key(self.category):
+            self.category_ref = Category.for_name(self.category)
+        if self.condition_ref_id is None or self.condition_ref.key != catalogue_key(self.condition):
+            self.condition_ref = Condition.for_name(self.condition)
+
+    def save(self, *args, **kwargs):
+        self.resolve_catalogue_refs()
+        self.excerpt = make_excerpt(self.description)
+        super().save(*args, **kwargs)
+
+class AdSearchEntry(models.Model):
+    """Строка полнотекстового индекса ads_ad_fts (SQLite FTS5), rowid = Ad.id."""
+    ad = models.OneToOneField(
+        Ad, primary_key=True, db_column='rowid', related_name='search_entry',
+        on_delete=models.DO_NOTHING,
+    )
+    title = models.TextField()
+    description = models.TextField()
+    document = FTSDocumentField(db_column='ads_ad_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'ads_ad_fts'
+
 class ExchangeProposal(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Ожидает'),
@@ -23,7 +162,254 @@ class ExchangeProposal(models.Model):
     ad_receiver = models.ForeignKey(Ad, related_name='received_proposals', on_delete=models.CASCADE)
     comment = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ad_sender', '-created_at', '-id'], name='ads_prop_sender_created_idx'),
+            models.Index(fields=['ad_receiver', '-created_at', '-id'], name='ads_prop_receiver_created_idx'),
+            models.Index(
+                fields=['ad_receiver', 'ad_sender'],
+                name='ads_prop_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['ad_sender'],
+                name='ads_prop_pending_sender_idx',
+                condition=models.Q(status='pending'),
+            ),
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='ads_prop_resolved_idx',
+                condition=~models.Q(status='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"от {self.ad_sender.user.username} для {self.ad_receiver.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_status()
+        return instance
+
+    def remember_status(self):
+        self._saved_status = self.__dict__.get('status')
+
+
+class ArchivedAd(models.Model):
+    """Копия давно обмененного объявления, перенесенного из ads_ad (см. ads.archive)."""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    image_url = models.URLField(max_length=200, blank=True, null=True)
+    category = models.CharField(max_length=100)
+    condition = models.CharField(max_length=50)
+    external_id = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    exchanged_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-created_at', '-id'], name='ads_archivedad_user_idx')]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedProposal(models.Model):
+    """Копия закрытого предложения, перенесенного из ads_exchangeproposal.
+
+    Не ссылается на объявления: они могут быть уже в архиве. Для истории
+    хранятся пользователи и заголовки объявлений на момент переноса.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    ad_sender_id = models.BigIntegerField()
+    ad_receiver_id = models.BigIntegerField()
+    sender_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    receiver_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    sender_title = models.CharField(max_length=200)
+    receiver_title = models.CharField(max_length=200)
+    comment = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=ExchangeProposal.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender_user', '-created_at', '-id'], name='ads_archprop_sender_idx'),
+            models.Index(fields=['receiver_user', '-created_at', '-id'], name='ads_archprop_receiver_idx'),
+        ]
+
+    def __str__(self):
+        return f"от {self.sender_title} для {self.receiver_title}"
+
+
+class SimilarityTerm(models.Model):
+    """Термин индекса похожих объявлений с документной частотой (см. ads.similarity)."""
+    text = models.CharField(max_length=100, unique=True)
+    df = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.text
+
+
+class AdTerm(models.Model):
+    ad = models.ForeignKey(Ad, related_name='terms', on_delete=models.CASCADE)
+    term = models.ForeignKey(SimilarityTerm, related_name='postings', on_delete=models.CASCADE, db_index=False)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'ad'], name='ads_adterm_term_ad_uniq'),
+        ]
+
+
+class WantEdge(models.Model):
+    """Ребро графа желаний: у from_user есть ожидающие предложения на объявления to_user.
+
+    proposal_count поддерживается сигналами при создании и закрытии
+    предложений (см. ads.matching). Поле знаковое: отрицательная дельта
+    для отсутствующего ребра вставляется и сразу удаляется очисткой.
+    """
+    from_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    to_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    proposal_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['from_user', 'to_user'], name='ads_wantedge_pair_uniq'),
+        ]
+        indexes = [models.Index(fields=['to_user', 'from_user'], name='ads_wantedge_to_idx')]
+
+    def __str__(self):
+        return f'{self.from_user_id} -> {self.to_user_id} ({self.proposal_count})'
+
+
+class InboxCounter(models.Model):
+    """Счетчики предложений пользователя для значка "новые предложения".
+
+    Поддерживаются сигналами при создании и закрытии предложений (см.
+    ads.inbox), поэтому значок читает одну строку вместо списков.
+    unseen — полученные ожидающие предложения после последнего открытия
+    списка, не больше pending_received.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='inbox_counter', on_delete=models.CASCADE)
+    pending_received = models.IntegerField(default=0)
+    pending_sent = models.IntegerField(default=0)
+    unseen = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.unseen}/{self.pending_received}'
+
+
+class Task(models.Model):
+    """Отложенная задача очереди ads.queue.
+
+    Выполненные задачи удаляются, поэтому таблица содержит только ожидающие,
+    выполняемые и окончательно упавшие (status='failed', с last_error).
+    """
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after', 'id'], name='ads_task_ready_idx')]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class SavedSearch(models.Model):
+    """Сохраненный поиск списка объявлений (см. ads.saved_searches).
+
+    query, category и condition хранятся нормализованными, как в
+    ads.cache.normalize_list_params. anchor — один обязательный ключ поиска
+    (префикс слова запроса или 'category:'/'condition:' с ключом
+    справочника), по нему новое объявление находит поиски-кандидаты.
+    """
+    user = models.ForeignKey(User, related_name='saved_searches', on_delete=models.CASCADE)
+    query = models.CharField(max_length=200, blank=True)
+    category = models.CharField(max_length=100, blank=True)
+    condition = models.CharField(max_length=50, blank=True)
+    anchor = models.CharField(max_length=120, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'query', 'category', 'condition'], name='ads_savedsearch_uniq'
+            ),
+        ]
+        indexes = [models.Index(fields=['anchor'], name='ads_savedsearch_anchor_idx')]
+
+    def __str__(self):
+        return ' / '.join(value for value in (self.query, self.category, self.condition) if value)
+
+    def list_params(self):
+        """Параметры ad_list_view для этого поиска."""
+        params = {'q': self.query, 'category': self.category, 'condition': self.condition}
+        return urlencode({name: value for name, value in params.items() if value})
+
+
+class FeedItem(models.Model):
+    """Объявление в ленте "Новое для вас", найденное сохраненным поиском."""
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    ad = models.ForeignKey(Ad, related_name='feed_items', on_delete=models.CASCADE)
+    saved_search = models.ForeignKey(SavedSearch, related_name='feed_items', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ad'], name='ads_feeditem_user_ad_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='ads_feeditem_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.ad_id}'
+
+
+class ChangeLogEntry(models.Model):
+    """Запись журнала изменений Ad и ExchangeProposal для внешних потребителей (см. ads.changelog).
+
+    Хранятся только модель, id и действие; данные строки читаются при
+    выдаче. id служит seq курсора (created_at, id).
+    """
+    ACTION_CHOICES = [
+        ('upsert', 'Изменение'),
+        ('delete', 'Удаление'),
+    ]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='ads_changelog_cursor_idx'),
+            models.Index(fields=['model', 'object_id', 'id'], name='ads_changelog_object_idx'),
+        ]
 
     def __str__(self):
-        return f"от {self.ad_sender.user.username} для {self.ad_receiver.title}"
\ No newline at end of file
+        return f'{self.model} #{self.object_id} {self.action}'
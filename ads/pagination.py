@@ -0,0 +1,179 @@
+"""Курсорная (keyset) пагинация.
+
+Вместо OFFSET страница выбирается условием по значениям полей сортировки
+последней показанной строки, поэтому стоимость запроса не зависит от
+глубины страницы, а COUNT(*) выполняется только по запросу.
+"""
+import base64
+import binascii
+import datetime
+import json
+from collections.abc import Sequence
+from functools import cached_property
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(values, backwards=False):
+    payload = [
+        {'dt': value.isoformat()} if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    data = json.dumps({'v': payload, 'b': int(backwards)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (values, backwards) или None для пустого/битого курсора."""
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values = [
+            datetime.datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in data['v']
+        ]
+        return values, bool(data['b'])
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+
+class CursorPage(Sequence):
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[0], backwards=True)
+
+
+class CursorPaginator:
+    """Пагинатор по упорядоченному queryset.
+
+    Порядок берется из queryset.order_by(); если последнее поле не
+    уникально, в конец добавляется id с тем же направлением.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering:
+            raise ValueError('CursorPaginator requires an ordered queryset.')
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    @cached_property
+    def count(self):
+        return self.queryset.count()
+
+    def cursor_for(self, obj, backwards=False):
+        # obj может быть и словарем из queryset.values().
+        if isinstance(obj, dict):
+            return encode_cursor([obj[name] for name, _ in self.ordering], backwards)
+        return encode_cursor([getattr(obj, name) for name, _ in self.ordering], backwards)
+
+    def _ordering_field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        model = self.queryset.model
+        *path, last = name.split('__')
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        return model._meta.pk if last == 'pk' else model._meta.get_field(last)
+
+    def _position_values(self, values):
+        """Значения курсора, приведенные к типам полей сортировки; None для подделанного курсора."""
+        if len(values) != len(self.ordering):
+            return None
+        converted = []
+        try:
+            for (name, _), value in zip(self.ordering, values):
+                value = self._ordering_field(name).to_python(value)
+                if value is None:
+                    return None
+                converted.append(value)
+        except (ValidationError, ValueError, TypeError):
+            return None
+        return converted
+
+    def _after(self, ordering, values):
+        condition = Q()
+        for index, (name, descending) in enumerate(ordering):
+            step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[index]})
+            for prev_index in range(index):
+                step &= Q(**{ordering[prev_index][0]: values[prev_index]})
+            condition |= step
+        # Избыточное условие по первому полю позволяет использовать индекс как диапазон.
+        name, descending = ordering[0]
+        return Q(**{f'{name}__{"lte" if descending else "gte"}': values[0]}) & condition
+
+    def _window(self, cursor):
+        position = decode_cursor(cursor)
+        if position:
+            values = self._position_values(position[0])
+            position = (values, position[1]) if values is not None else None
+        backwards = bool(position and position[1])
+        ordering = [(name, descending != backwards) for name, descending in self.ordering]
+
+        queryset = self.queryset
+        if position:
+            queryset = queryset.filter(self._after(ordering, position[0]))
+        queryset = queryset.order_by(
+            *[('-' if descending else '') + name for name, descending in ordering]
+        )
+        return queryset[:self.per_page + 1], position is not None, backwards
+
+    def _make_page(self, rows, has_position, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return CursorPage(rows, self, has_next=True, has_previous=has_more)
+        return CursorPage(rows, self, has_next=has_more, has_previous=has_position)
+
+    def get_page(self, cursor=None):
+        window, has_position, backwards = self._window(cursor)
+        return self._make_page(list(window), has_position, backwards)
+
+    async def aget_page(self, cursor=None):
+        window, has_position, backwards = self._window(cursor)
+        return self._make_page([obj async for obj in window], has_position, backwards)
+
+    async def acount(self):
+        if 'count' not in self.__dict__:
+            self.__dict__['count'] = await self.queryset.acount()
+        return self.count
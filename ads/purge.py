@@ -0,0 +1,79 @@
+"""Окончательное удаление объявлений, помеченных deleted_at.
+
+Model.delete() загружает все связанные строки через Collector и держит
+блокировку записи, пока удаляет их по одной с сигналами. Здесь строки
+удаляются сырыми DELETE ... WHERE id IN (SELECT ... LIMIT n): каждый
+оператор трогает не больше batch_size строк и выполняется в своей короткой
+транзакции, а между операторами делается пауза, чтобы запросы сайта
+успевали писать. Сигналы не нужны: индексы и счетчики освобождены еще при
+пометке (ads.services.soft_delete_ad).
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import Ad
+from .services import reject_pending_for_ads
+
+
+def cascade_columns():
+    """(модель, столбец) строк, ссылающихся на Ad с CASCADE; их нужно удалить раньше объявлений."""
+    return [
+        (relation.related_model, relation.field.column)
+        for relation in Ad._meta.related_objects
+        if relation.on_delete is models.CASCADE and relation.related_model._meta.managed
+    ]
+
+
+def _delete_chunks(model, column, ad_ids, batch_size, pause, stats):
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ad_ids))
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                f'SELECT id FROM {table} WHERE {connection.ops.quote_name(column)} IN ({placeholders}) LIMIT %s)',
+                [*ad_ids, batch_size],
+            )
+            deleted = cursor.rowcount
+        stats[model._meta.model_name] += deleted
+        stats['statements'] += 1
+        if pause:
+            time.sleep(pause)
+        if deleted < batch_size:
+            return
+
+
+def purge_deleted_ads(older_than, batch_size=1000, pause=0.0, max_ads=None):
+    """Удаляет объявления, помеченные раньше older_than секунд назад, со связанными строками.
+
+    Возвращает Counter: число удаленных строк по имени модели и число
+    операторов DELETE ('statements').
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    pending = Ad.all_objects.filter(deleted_at__lte=cutoff).order_by('deleted_at', 'id')
+    ad_table = connection.ops.quote_name(Ad._meta.db_table)
+    stats = Counter()
+    while max_ads is None or stats['ad'] < max_ads:
+        limit = batch_size if max_ads is None else min(batch_size, max_ads - stats['ad'])
+        ad_ids = list(pending.values_list('id', flat=True)[:limit])
+        if not ad_ids:
+            break
+        # Предложение, созданное в гонке с пометкой, иначе не вычтется из счетчиков.
+        with transaction.atomic():
+            reject_pending_for_ads(ad_ids)
+        for model, column in cascade_columns():
+            _delete_chunks(model, column, ad_ids, batch_size, pause, stats)
+        placeholders = ', '.join(['%s'] * len(ad_ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {ad_table} WHERE id IN ({placeholders}) AND deleted_at IS NOT NULL', ad_ids
+            )
+            stats['ad'] += cursor.rowcount
+        stats['statements'] += 1
+        if pause:
+            time.sleep(pause)
+    return stats
@@ -0,0 +1,157 @@
+"""Очередь фоновых задач в базе данных.
+
+Функция, помеченная @task, ставится в очередь вызовом .delay(**kwargs):
+строка Task вставляется в transaction.on_commit, поэтому задача не увидит
+незакоммиченных данных и не появится при откате. Аргументы должны
+сериализоваться в JSON. Команда run_tasks забирает готовые задачи одним
+UPDATE ... RETURNING (это и блокировка, и выборка), выполняет их в пуле
+потоков или процессов и записывает результат: успешные задачи удаляются,
+упавшие возвращаются в очередь с экспоненциальной задержкой, после
+max_attempts попыток остаются со статусом 'failed'.
+
+С ADS_TASKS_EAGER задачи выполняются сразу при .delay(), без очереди и
+без on_commit, — режим для тестов.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger('ads.tasks')
+
+registry = {}
+
+
+class TaskFunction:
+
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def delay(self, **kwargs):
+        if settings.ADS_TASKS_EAGER:
+            self.func(**kwargs)
+            return
+        transaction.on_commit(lambda: enqueue(self.name, kwargs, max_attempts=self.max_attempts))
+
+
+def task(name=None, max_attempts=5):
+    """Регистрирует функцию как задачу; имя по умолчанию — module.qualname."""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        if task_name in registry:
+            raise ValueError(f'Задача {task_name} уже зарегистрирована.')
+        registry[task_name] = TaskFunction(func, task_name, max_attempts)
+        return registry[task_name]
+    return decorator
+
+
+def enqueue(name, kwargs, max_attempts=5, run_after=None):
+    return Task.objects.create(
+        name=name, kwargs=kwargs, max_attempts=max_attempts, run_after=run_after or timezone.now()
+    )
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: база * 2^(attempts-1), не больше ADS_TASKS_MAX_RETRY_DELAY."""
+    return min(settings.ADS_TASKS_RETRY_DELAY * 2 ** (attempts - 1), settings.ADS_TASKS_MAX_RETRY_DELAY)
+
+
+def claim(limit):
+    """Забирает до limit готовых задач; возвращает (id, name, kwargs, attempts, max_attempts).
+
+    Задачи в статусе 'running' дольше ADS_TASKS_LEASE секунд считаются
+    брошенными упавшим воркером и забираются снова.
+
+    В SQLite писатели выполняются по одному, и подзапрос вместе с UPDATE не
+    пересекается с другим воркером. В базах со строчными блокировками
+    (PostgreSQL) два воркера могли бы выбрать одни и те же id, поэтому
+    подзапрос берет строки FOR UPDATE SKIP LOCKED: занятые строки
+    достаются другому воркеру.
+    """
+    now = timezone.now()
+    table = connection.ops.quote_name(Task._meta.db_table)
+    ops = connection.ops
+    lock = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET status = %s, locked_at = %s, attempts = attempts + 1 '
+            f'WHERE id IN (SELECT id FROM {table} '
+            f'WHERE (status = %s AND run_after <= %s) OR (status = %s AND locked_at < %s) '
+            f'ORDER BY run_after, id LIMIT %s{lock}) '
+            f'RETURNING id, name, kwargs, attempts, max_attempts',
+            [
+                'running', ops.adapt_datetimefield_value(now),
+                'queued', ops.adapt_datetimefield_value(now),
+                'running', ops.adapt_datetimefield_value(now - timedelta(seconds=settings.ADS_TASKS_LEASE)),
+                limit,
+            ],
+        )
+        kwargs_field = Task._meta.get_field('kwargs')
+        return [
+            (pk, name, kwargs_field.from_db_value(kwargs, None, connection), attempts, max_attempts)
+            for pk, name, kwargs, attempts, max_attempts in cursor.fetchall()
+        ]
+
+
+def execute(name, kwargs):
+    """Выполняет задачу; возвращает None или текст ошибки. Вызывается в потоке или процессе пула."""
+    try:
+        task_function = registry.get(name)
+        if task_function is None:
+            raise LookupError(f'Неизвестная задача {name}')
+        task_function(**kwargs)
+        return None
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        # Потоки и процессы пула живут долго: соединения закрываются по CONN_MAX_AGE.
+        close_old_connections()
+
+
+def complete(pk, attempts):
+    """Удаляет выполненную задачу; False, если аренду уже перехватил другой воркер.
+
+    Задача, которая выполнялась дольше ADS_TASKS_LEASE, забирается снова, и
+    claim увеличивает attempts: строка с другим attempts принадлежит новому
+    исполнителю, ее не трогаем.
+    """
+    if Task.objects.filter(pk=pk, attempts=attempts).delete()[0]:
+        return True
+    logger.warning('Задача #%s (попытка %s) выполнена после истечения аренды, результат не записан.', pk, attempts)
+    return False
+
+
+def fail(pk, attempts, max_attempts, error):
+    """Возвращает задачу в очередь с задержкой или помечает окончательно упавшей.
+
+    Как и complete, пишет только в строку с тем же attempts и возвращает False,
+    если аренда потеряна.
+    """
+    claimed = Task.objects.filter(pk=pk, attempts=attempts)
+    if attempts < max_attempts:
+        delay = retry_delay(attempts)
+        updated = claimed.update(
+            status='queued', run_after=timezone.now() + timedelta(seconds=delay), locked_at=None, last_error=error
+        )
+        if updated:
+            logger.warning('Задача #%s упала (попытка %s), повтор через %s с:\n%s', pk, attempts, delay, error)
+    else:
+        updated = claimed.update(status='failed', locked_at=None, last_error=error)
+        if updated:
+            logger.error('Задача #%s упала после %s попыток:\n%s', pk, attempts, error)
+    if not updated:
+        logger.warning('Задача #%s (попытка %s) упала после истечения аренды, результат не записан:\n%s', pk, attempts, error)
+    return bool(updated)
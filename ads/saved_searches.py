@@ -0,0 +1,156 @@
+"""Сохраненные поиски и лента "Новое для вас".
+
+Вместо того чтобы перезапускать каждый сохраненный поиск, новое объявление
+само ищет подходящие поиски (как перколятор): у каждого поиска есть один
+якорь — ключ, без которого объявление поиску точно не подходит. Для слов
+запроса это префикс слова (поиск по списку ищет слова запроса как
+префиксы, см. ads.search), без запроса — 'category:<ключ>' или
+'condition:<ключ>'. Из объявления строятся все его возможные якоря:
+префиксы слов заголовка и описания, категория и состояние. Кандидаты
+выбираются одним запросом по индексу якорей и проверяются целиком в
+Python, совпавшие объявления записываются в FeedItem.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Ad, FeedItem, SavedSearch, catalogue_key
+from .search import tokenize
+
+# Якорь запроса — начало самого длинного слова: длинные префиксы есть у
+# меньшего числа объявлений. Длина ограничена, чтобы объявление давало
+# не больше MAX_ANCHOR_LENGTH префиксов на слово.
+MAX_ANCHOR_LENGTH = 20
+MAX_SAVED_SEARCHES = 20
+LOOKUP_BATCH_SIZE = 500
+
+
+def search_anchor(query, category, condition):
+    tokens = tokenize(query)
+    if tokens:
+        return max(tokens, key=len)[:MAX_ANCHOR_LENGTH]
+    if category:
+        return f'category:{category}'
+    if condition:
+        return f'condition:{condition}'
+    return None
+
+
+def save_search(user, filters):
+    """Сохраняет поиск из нормализованных параметров списка.
+
+    Возвращает (поиск, создан); ValueError — если фильтров нет или
+    достигнут MAX_SAVED_SEARCHES.
+    """
+    fields = {
+        'query': filters.get('q', ''),
+        'category': filters.get('category', ''),
+        'condition': filters.get('condition', ''),
+    }
+    anchor = search_anchor(fields['query'], fields['category'], fields['condition'])
+    if anchor is None:
+        raise ValueError('Укажите запрос, категорию или состояние.')
+    existing = SavedSearch.objects.filter(user=user, **fields).first()
+    if existing is not None:
+        return existing, False
+    if SavedSearch.objects.filter(user=user).count() >= MAX_SAVED_SEARCHES:
+        raise ValueError(f'Можно сохранить не больше {MAX_SAVED_SEARCHES} поисков.')
+    try:
+        with transaction.atomic():
+            return SavedSearch.objects.create(user=user, anchor=anchor, **fields), True
+    except IntegrityError:
+        return SavedSearch.objects.get(user=user, **fields), False
+
+
+def ad_terms(ad):
+    """(слова, ключ категории, ключ состояния) объявления."""
+    return (
+        set(tokenize(ad.title)) | set(tokenize(ad.description)),
+        catalogue_key(ad.category),
+        catalogue_key(ad.condition),
+    )
+
+
+def ad_anchors(terms):
+    tokens, category, condition = terms
+    anchors = {
+        token[:length]
+        for token in tokens
+        for length in range(1, min(len(token), MAX_ANCHOR_LENGTH) + 1)
+    }
+    anchors.add(f'category:{category}')
+    anchors.add(f'condition:{condition}')
+    return anchors
+
+
+def matches(terms, anchors, query, category, condition):
+    """Подходит ли объявление поиску; anchors — ad_anchors(terms), в нем есть все короткие префиксы слов."""
+    tokens, ad_category, ad_condition = terms
+    return (
+        (not category or category == ad_category)
+        and (not condition or condition == ad_condition)
+        and all(
+            word in anchors if len(word) <= MAX_ANCHOR_LENGTH else any(token.startswith(word) for token in tokens)
+            for word in tokenize(query)
+        )
+    )
+
+
+def candidates(anchors):
+    """Поиски с якорем из anchors: {якорь: [(id, user_id, query, category, condition)]}."""
+    anchors = sorted(anchors)
+    found = {}
+    for start in range(0, len(anchors), LOOKUP_BATCH_SIZE):
+        rows = SavedSearch.objects.filter(anchor__in=anchors[start:start + LOOKUP_BATCH_SIZE]).values_list(
+            'anchor', 'id', 'user_id', 'query', 'category', 'condition'
+        )
+        for anchor, *search in rows:
+            found.setdefault(anchor, []).append(search)
+    return found
+
+
+def match_ads(ads):
+    """Добавляет объявления ads в ленты владельцев подходящих поисков; возвращает число записей."""
+    ads_terms = {ad.pk: ad_terms(ad) for ad in ads}
+    ads_anchors = {ad_id: ad_anchors(terms) for ad_id, terms in ads_terms.items()}
+    searches = candidates(set().union(*ads_anchors.values()))
+    items = {}
+    for ad in ads:
+        anchors = ads_anchors[ad.pk]
+        for anchor in anchors & searches.keys():
+            for search_id, user_id, query, category, condition in searches[anchor]:
+                if (
+                    user_id != ad.user_id and (user_id, ad.pk) not in items
+                    and matches(ads_terms[ad.pk], anchors, query, category, condition)
+                ):
+                    items[user_id, ad.pk] = search_id
+    _insert_items(items)
+    return len(items)
+
+
+def _insert_items(items):
+    # executemany без создания экземпляров: на одно объявление бывают сотни записей.
+    table = connection.ops.quote_name(FeedItem._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (user_id, ad_id, saved_search_id, created_at) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (user_id, ad_id) DO NOTHING',
+            [(user_id, ad_id, search_id, now) for (user_id, ad_id), search_id in items.items()],
+        )
+
+
+def match_ad_ids(ad_ids):
+    ads = Ad.objects.filter(pk__in=ad_ids, exchanged_at__isnull=True).only(
+        'user_id', 'title', 'description', 'category', 'condition'
+    )
+    return match_ads(list(ads))
+
+
+def feed_items(user):
+    return FeedItem.objects.filter(user=user).select_related('ad__user', 'saved_search').order_by(
+        '-created_at', '-id'
+    )
+
+
+def remove_ads(ad_ids):
+    FeedItem.objects.filter(ad_id__in=ad_ids).delete()
@@ -0,0 +1,179 @@
+"""Полнотекстовый поиск по объявлениям.
+
+Бэкенд выбирается настройкой ADS_SEARCH_BACKEND (путь к классу) или,
+если она не задана, по типу базы данных.
+"""
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import BooleanField, F, Field, Lookup, Q
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').casefold())
+
+
+class FTSDocumentField(Field):
+    """Скрытый столбец FTS5-таблицы с ее же именем, по нему делается MATCH."""
+
+    def db_type(self, connection):
+        return None
+
+
+@FTSDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class BaseSearchBackend:
+    """Бэкенд поиска.
+
+    search() возвращает queryset, отфильтрованный по запросу, с аннотацией
+    search_rank и сортировкой по релевантности.
+    """
+    ordering = ('-created_at', '-id')
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_ads(self, ads):
+        pass
+
+    def remove_ads(self, ad_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class IcontainsSearchBackend(BaseSearchBackend):
+    """Прежний поиск через icontains, без индекса."""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query)
+        ).order_by(*self.ordering)
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Поиск по виртуальной таблице FTS5 ads_ad_fts (rowid = Ad.id).
+
+    Таблица хранит собственную копию title/description (модель AdSearchEntry)
+    и обновляется сигналами post_save/post_delete модели Ad.
+    """
+    table = 'ads_ad_fts'
+    ordering = ('search_rank', '-created_at', '-id')
+
+    @staticmethod
+    def match_expression(query):
+        return ' '.join('"%s"*' % token for token in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            search_entry__document__match=match
+        ).annotate(
+            search_rank=F('search_entry__rank')
+        ).order_by(*self.ordering)
+
+    def index_ads(self, ads):
+        rows = [(ad.pk, ad.title, ad.description) for ad in ads]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)', rows
+            )
+
+    def remove_ads(self, ad_ids):
+        ad_ids = list(ad_ids)
+        if not ad_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [(ad_id,) for ad_id in ad_ids]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description) '
+                'SELECT id, title, description FROM ads_ad WHERE deleted_at IS NULL'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Поиск по tsvector с GIN-индексом по выражению ads_ad_search_idx.
+
+    Индекс строится самой базой, поэтому index_ads/remove_ads не нужны.
+    """
+    vector = "to_tsvector('simple', ads_ad.title || ' ' || ads_ad.description)"
+    ordering = ('-search_rank', '-created_at', '-id')
+
+    @staticmethod
+    def tsquery(query):
+        return ' & '.join('%s:*' % token for token in tokenize(query))
+
+    def search(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        return queryset.filter(
+            RawSQL(f"{self.vector} @@ to_tsquery('simple', %s)", (tsquery,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"ts_rank({self.vector}, to_tsquery('simple', %s))", (tsquery,))
+        ).order_by(*self.ordering)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX ads_ad_search_idx')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'ADS_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, IcontainsSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'ADS_SEARCH_BACKEND':
+        _backend = None
+
+
+def search_ads(queryset, query):
+    return get_backend().search(queryset, query)
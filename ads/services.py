@@ -0,0 +1,140 @@
+"""Изменение статусов предложений обмена одним условным UPDATE.
+
+Проверки "предложение ожидает решения" и "пользователь владеет объявлением-
+получателем" входят в WHERE, поэтому результат решает число измененных
+строк, а параллельные запросы не могут обработать одно предложение дважды.
+Так же устроено удаление объявления: пометка deleted_at и отклонение его
+ожидающих предложений, без загрузки связанных строк.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Ad, ExchangeProposal
+from .signals import ads_deleted, ads_exchanged, proposals_status_changed
+
+RESOLVED_STATUSES = ('accepted', 'rejected')
+
+
+def _tables():
+    quote = connection.ops.quote_name
+    return quote(ExchangeProposal._meta.db_table), quote(Ad._meta.db_table)
+
+
+def _now():
+    # auto_now не работает в сыром UPDATE.
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def _update_pending(user, proposal_ids, new_status):
+    """Возвращает (id, ad_sender_id, ad_receiver_id) измененных предложений."""
+    proposal_ids = [int(pk) for pk in proposal_ids]
+    if not proposal_ids:
+        return []
+    table, ad_table = _tables()
+    placeholders = ', '.join(['%s'] * len(proposal_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET status = %s, updated_at = %s '
+            f'WHERE id IN ({placeholders}) AND status = %s '
+            f'AND ad_receiver_id IN (SELECT id FROM {ad_table} WHERE user_id = %s) '
+            f'RETURNING id, ad_sender_id, ad_receiver_id',
+            [new_status, _now(), *proposal_ids, 'pending', user.pk],
+        )
+        return cursor.fetchall()
+
+
+def _reject_competing(ad_ids):
+    """Отклоняет все ожидающие предложения, где участвует любое из ad_ids."""
+    table, _ = _tables()
+    placeholders = ', '.join(['%s'] * len(ad_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET status = %s, updated_at = %s '
+            f'WHERE status = %s AND (ad_sender_id IN ({placeholders}) OR ad_receiver_id IN ({placeholders})) '
+            f'RETURNING id',
+            ['rejected', _now(), 'pending', *ad_ids, *ad_ids],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _accept(user, proposal_pk):
+    """Принимает предложение; возвращает его id из RETURNING или None."""
+    with transaction.atomic():
+        changed = _update_pending(user, [proposal_pk], 'accepted')
+        if not changed:
+            return None
+        proposal_id, sender_id, receiver_id = changed[0]
+        ad_ids = [sender_id, receiver_id]
+        now = timezone.now()
+        Ad.objects.filter(pk__in=ad_ids, exchanged_at__isnull=True).update(exchanged_at=now, updated_at=now)
+        rejected = _reject_competing(ad_ids)
+        ads_exchanged.send(sender=Ad, ad_ids=ad_ids)
+        proposals_status_changed.send(
+            sender=ExchangeProposal, proposal_ids=[proposal_id], status='accepted', user=user
+        )
+        if rejected:
+            proposals_status_changed.send(
+                sender=ExchangeProposal, proposal_ids=rejected, status='rejected', user=user
+            )
+    return proposal_id
+
+
+def accept_proposal(user, proposal_pk):
+    """Принимает предложение и закрывает обмен в одной транзакции.
+
+    Оба объявления помечаются обмененными, а остальные ожидающие предложения
+    с их участием отклоняются одним UPDATE, без цикла по строкам.
+    """
+    return _accept(user, proposal_pk) is not None
+
+
+def reject_pending_for_ads(ad_ids, user=None):
+    """Отклоняет ожидающие предложения с участием ad_ids и сообщает об этом сигналом."""
+    rejected = _reject_competing(ad_ids)
+    if rejected:
+        proposals_status_changed.send(
+            sender=ExchangeProposal, proposal_ids=rejected, status='rejected', user=user
+        )
+    return rejected
+
+
+def soft_delete_ad(user, ad):
+    """Помечает объявление пользователя удаленным; False, если оно уже удалено или чужое.
+
+    Число запросов не зависит от числа предложений: ожидающие отклоняются
+    одним UPDATE, а строки удаляет позже команда purge_deleted_ads.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not Ad.objects.filter(pk=ad.pk, user=user).update(deleted_at=now, updated_at=now):
+            return False
+        ad.deleted_at = ad.updated_at = now
+        reject_pending_for_ads([ad.pk], user)
+        ads_deleted.send(sender=Ad, ads=[ad])
+    return True
+
+
+def transition_proposals(user, proposal_ids, new_status):
+    """Переводит ожидающие предложения пользователя в new_status.
+
+    Возвращает id (int) действительно измененных предложений, как их вернул
+    RETURNING. Принятие идет по одному предложению: каждое следующее может
+    оказаться уже отклоненным как конкурирующее с предыдущим.
+    """
+    if new_status not in RESOLVED_STATUSES:
+        raise ValueError(f'Недопустимый статус: {new_status}')
+    proposal_ids = [int(pk) for pk in proposal_ids]
+    if new_status == 'accepted':
+        accepted = (_accept(user, pk) for pk in proposal_ids)
+        return [pk for pk in accepted if pk is not None]
+    with transaction.atomic():
+        changed = [row[0] for row in _update_pending(user, proposal_ids, new_status)]
+        if changed:
+            proposals_status_changed.send(
+                sender=ExchangeProposal, proposal_ids=changed, status=new_status, user=user
+            )
+    return changed
+
+
+def transition_proposal(user, proposal_pk, new_status):
+    return bool(transition_proposals(user, [proposal_pk], new_status))
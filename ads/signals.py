@@ -0,0 +1,220 @@
+from collections import Counter
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import changelog, inbox, saved_searches, similarity, tasks
+from .cache import bump_generation
+from .matching import release_proposals, shift_edges, user_pairs
+from .models import Ad, Category, Condition, ExchangeProposal
+from .search import get_backend
+
+# Отправляется после Ad.objects.bulk_create(), который не вызывает post_save.
+# Аргументы: ads — список сохраненных объявлений с pk.
+ads_created_in_bulk = Signal()
+
+# То же для ExchangeProposal.objects.bulk_create(). Аргументы: proposals.
+proposals_created_in_bulk = Signal()
+
+# Отправляется ads.services после условного UPDATE статуса, который тоже
+# обходит post_save. Аргументы: proposal_ids, status, user.
+proposals_status_changed = Signal()
+
+# Отправляется после пометки объявлений обмененными (QuerySet.update()).
+# Аргументы: ad_ids.
+ads_exchanged = Signal()
+
+# Отправляется ads.services после пометки объявлений удаленными (deleted_at)
+# и ads.archive перед переносом в архив: объявления уходят из выдачи, а
+# post_delete для них не придет. Аргументы: ads.
+ads_deleted = Signal()
+
+
+@receiver(post_save, sender=Ad)
+def index_ad(sender, instance, **kwargs):
+    get_backend().index_ads([instance])
+
+
+@receiver(post_delete, sender=Ad)
+def unindex_ad(sender, instance, **kwargs):
+    get_backend().remove_ads([instance.pk])
+
+
+@receiver(post_save, sender=Ad)
+def index_ad_similarity(sender, instance, **kwargs):
+    # Похожие объявления допускают задержку, поэтому индексация вне запроса.
+    tasks.index_ad_similarity.delay(ad_id=instance.pk)
+
+
+@receiver(post_save, sender=Ad)
+def match_saved_searches(sender, instance, created, **kwargs):
+    # Ленты тоже допускают задержку; сохраненных поисков может быть много.
+    if created:
+        tasks.match_saved_searches.delay(ad_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Ad)
+def unindex_ad_similarity(sender, instance, **kwargs):
+    similarity.remove_ads([instance.pk])
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+def invalidate_ad_list_cache(sender, **kwargs):
+    bump_generation()
+
+
+def _shift_count(model, pk, delta):
+    if pk is not None:
+        model.objects.filter(pk=pk).update(ad_count=F('ad_count') + delta)
+
+
+@receiver(post_save, sender=Ad)
+def update_catalogue_counts(sender, instance, created, **kwargs):
+    old_refs = (None, None) if created else getattr(instance, '_saved_refs', (None, None))
+    new_refs = (instance.category_ref_id, instance.condition_ref_id)
+    for model, old_id, new_id in zip((Category, Condition), old_refs, new_refs):
+        if old_id != new_id:
+            _shift_count(model, old_id, -1)
+            _shift_count(model, new_id, 1)
+    instance.remember_catalogue_refs()
+
+
+@receiver(post_delete, sender=Ad)
+def release_catalogue_counts(sender, instance, **kwargs):
+    # Помеченное удаленным уже вычтено в release_deleted_catalogue_counts.
+    if instance.deleted_at is None:
+        _shift_count(Category, instance.category_ref_id, -1)
+        _shift_count(Condition, instance.condition_ref_id, -1)
+
+
+@receiver(ads_created_in_bulk)
+def index_bulk_ads(sender, ads, **kwargs):
+    get_backend().index_ads(ads)
+
+
+@receiver(ads_created_in_bulk)
+def index_bulk_ads_similarity(sender, ads, **kwargs):
+    similarity.index_ads(ads)
+
+
+@receiver(ads_created_in_bulk)
+def match_bulk_saved_searches(sender, ads, **kwargs):
+    tasks.match_saved_searches.delay(ad_ids=[ad.pk for ad in ads])
+
+
+@receiver(ads_created_in_bulk)
+def count_bulk_ads(sender, ads, **kwargs):
+    for model, field in ((Category, 'category_ref_id'), (Condition, 'condition_ref_id')):
+        for pk, total in Counter(getattr(ad, field) for ad in ads).items():
+            _shift_count(model, pk, total)
+
+
+@receiver(ads_created_in_bulk)
+def invalidate_after_bulk(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(ads_exchanged)
+def invalidate_after_exchange(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(ads_deleted)
+def unindex_deleted_ads(sender, ads, **kwargs):
+    ad_ids = [ad.pk for ad in ads]
+    get_backend().remove_ads(ad_ids)
+    similarity.remove_ads(ad_ids)
+    saved_searches.remove_ads(ad_ids)
+
+
+@receiver(ads_deleted)
+def release_deleted_catalogue_counts(sender, ads, **kwargs):
+    for model, field in ((Category, 'category_ref_id'), (Condition, 'condition_ref_id')):
+        for pk, total in Counter(getattr(ad, field) for ad in ads).items():
+            _shift_count(model, pk, -total)
+
+
+@receiver(ads_deleted)
+def invalidate_after_delete(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def update_pending_aggregates(sender, instance, created, **kwargs):
+    """Ребра графа желаний и счетчики предложений при входе в "ожидает" и выходе из него."""
+    was_pending = not created and getattr(instance, '_saved_status', None) == 'pending'
+    is_pending = instance.status == 'pending'
+    if was_pending != is_pending:
+        pair = (instance.ad_sender.user_id, instance.ad_receiver.user_id)
+        sign = 1 if is_pending else -1
+        shift_edges(Counter({pair: sign}))
+        inbox.shift_counters(inbox.proposal_deltas([pair], sign))
+    instance.remember_status()
+
+
+@receiver(pre_delete, sender=ExchangeProposal)
+def release_pending_aggregates(sender, instance, **kwargs):
+    # pre_delete: при каскадном удалении объявления оно еще есть в базе.
+    if instance.status == 'pending':
+        release_proposals([instance.pk])
+        inbox.release_proposals([instance.pk])
+
+
+@receiver(proposals_created_in_bulk)
+def add_bulk_pending_aggregates(sender, proposals, **kwargs):
+    pairs = user_pairs(
+        (proposal.ad_sender_id, proposal.ad_receiver_id)
+        for proposal in proposals if proposal.status == 'pending'
+    )
+    shift_edges(pairs)
+    inbox.shift_counters(inbox.proposal_deltas(pairs.elements()))
+
+
+@receiver(proposals_status_changed)
+def release_resolved_aggregates(sender, proposal_ids, status, **kwargs):
+    # Условный UPDATE меняет только ожидающие предложения.
+    if status != 'pending':
+        release_proposals(proposal_ids)
+        inbox.release_proposals(proposal_ids)
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_save, sender=ExchangeProposal)
+def log_save(sender, instance, **kwargs):
+    changelog.record(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Ad)
+@receiver(post_delete, sender=ExchangeProposal)
+def log_delete(sender, instance, **kwargs):
+    changelog.record(sender, [instance.pk], 'delete')
+
+
+@receiver(ads_created_in_bulk)
+def log_bulk_ads(sender, ads, **kwargs):
+    changelog.record(Ad, [ad.pk for ad in ads])
+
+
+@receiver(proposals_created_in_bulk)
+def log_bulk_proposals(sender, proposals, **kwargs):
+    changelog.record(ExchangeProposal, [proposal.pk for proposal in proposals])
+
+
+@receiver(proposals_status_changed)
+def log_status_change(sender, proposal_ids, **kwargs):
+    changelog.record(ExchangeProposal, proposal_ids)
+
+
+@receiver(ads_exchanged)
+def log_exchange(sender, ad_ids, **kwargs):
+    changelog.record(Ad, ad_ids)
+
+
+@receiver(ads_deleted)
+def log_deleted_ads(sender, ads, **kwargs):
+    # Предложения помеченных объявлений скрыты из списков, для потребителя они тоже удалены.
+    ad_ids = [ad.pk for ad in ads]
+    changelog.record(Ad, ad_ids, 'delete')
+    changelog.record_ad_proposals(ad_ids)
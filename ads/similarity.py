@@ -0,0 +1,152 @@
+"""Индекс похожих объявлений: TF-IDF поверх инвертированного индекса в базе.
+
+Для каждого объявления хранятся постинги AdTerm (термин, вес в документе),
+для каждого термина — документная частота df в SimilarityTerm. Вес
+термина в документе (1 + ln tf) / sqrt(число терминов) не зависит от
+остальных документов, поэтому при сохранении объявления переписываются
+только его постинги и df его терминов. Похожесть считается в одном
+SQL-запросе суммой idf² · w_запроса · w_документа по постингам нескольких
+самых информативных терминов запроса.
+"""
+import math
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+
+from .models import Ad, AdTerm, SimilarityTerm, catalogue_key
+from .search import tokenize
+
+# Постинг этого термина есть у каждого проиндексированного объявления,
+# поэтому его df — общее число документов. tokenize() не выдает '#'.
+DOCUMENTS_TERM = '#documents'
+TITLE_WEIGHT = 2
+CATEGORY_WEIGHT = 3
+MAX_TERM_LENGTH = 100
+QUERY_TERMS = 12
+# Термины, встречающиеся чаще, почти не влияют на оценку, а их постинги длинные.
+# На маленьких индексах отсечение не применяется до MIN_DF_CUTOFF документов.
+MAX_DF_RATIO = 0.1
+MIN_DF_CUTOFF = 100
+
+
+def document_terms(title, description, category):
+    """Counter термин -> частота с учетом весов заголовка и категории."""
+    counts = Counter(tokenize(description))
+    for token in tokenize(title):
+        counts[token] += TITLE_WEIGHT
+    if category:
+        counts[f'category:{catalogue_key(category)}'] += CATEGORY_WEIGHT
+    return Counter({term[:MAX_TERM_LENGTH]: tf for term, tf in counts.items()})
+
+
+def document_vector(title, description, category):
+    counts = document_terms(title, description, category)
+    norm = math.sqrt(len(counts)) or 1.0
+    vector = {term: (1 + math.log(tf)) / norm for term, tf in counts.items()}
+    vector[DOCUMENTS_TERM] = 0.0
+    return vector
+
+
+def idf(df, documents):
+    return math.log(1 + documents / df) if df else 0.0
+
+
+def _shift_df(term_model, deltas):
+    table = connection.ops.quote_name(term_model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET df = df + %s WHERE id = %s',
+            [(delta, term_id) for term_id, delta in deltas.items() if delta],
+        )
+
+
+def _term_ids(term_model, texts):
+    term_model.objects.bulk_create([term_model(text=text) for text in texts], ignore_conflicts=True)
+    return dict(term_model.objects.filter(text__in=texts).values_list('text', 'pk'))
+
+
+def remove_ads(ad_ids, term_model=SimilarityTerm, posting_model=AdTerm):
+    postings = posting_model.objects.filter(ad_id__in=ad_ids)
+    counts = dict(postings.order_by().values('term_id').annotate(total=Count('id')).values_list('term_id', 'total'))
+    if counts:
+        postings.delete()
+        _shift_df(term_model, {term_id: -total for term_id, total in counts.items()})
+
+
+def index_ads(ads, term_model=SimilarityTerm, posting_model=AdTerm):
+    """Переписывает постинги объявлений ads и df их терминов."""
+    vectors = {ad.pk: document_vector(ad.title, ad.description, ad.category) for ad in ads}
+    if not vectors:
+        return
+    remove_ads(list(vectors), term_model, posting_model)
+    term_ids = _term_ids(term_model, {term for vector in vectors.values() for term in vector})
+    # executemany без создания экземпляров: постингов в десятки раз больше, чем объявлений.
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {connection.ops.quote_name(posting_model._meta.db_table)} '
+            f'(ad_id, term_id, weight) VALUES (%s, %s, %s)',
+            [
+                (ad_id, term_ids[term], weight)
+                for ad_id, vector in vectors.items()
+                for term, weight in vector.items()
+            ],
+        )
+    _shift_df(term_model, Counter(term_ids[term] for vector in vectors.values() for term in vector))
+
+
+def rebuild(ad_model=Ad, term_model=SimilarityTerm, posting_model=AdTerm, batch_size=2000):
+    """Строит индекс заново; модели передаются явно из миграции."""
+    posting_model.objects.all().delete()
+    term_model.objects.all().delete()
+    batch = []
+    for ad in ad_model.objects.only('title', 'description', 'category').iterator(chunk_size=batch_size):
+        batch.append(ad)
+        if len(batch) >= batch_size:
+            index_ads(batch, term_model, posting_model)
+            batch = []
+    index_ads(batch, term_model, posting_model)
+
+
+def query_weights(ad, max_terms=QUERY_TERMS):
+    """{term_id: idf² · w} для самых информативных терминов объявления, один запрос."""
+    postings = list(AdTerm.objects.filter(ad=ad).values_list('term_id', 'term__text', 'term__df', 'weight'))
+    documents = next((df for _, text, df, _ in postings if text == DOCUMENTS_TERM), 0)
+    # Термин с df = 1 есть только у самого объявления.
+    scored = [
+        (term_id, df, idf(df, documents) ** 2 * weight)
+        for term_id, text, df, weight in postings if text != DOCUMENTS_TERM and df > 1
+    ]
+    selective = [item for item in scored if item[1] <= max(MIN_DF_CUTOFF, MAX_DF_RATIO * documents)]
+    scored = sorted(selective or scored, key=lambda item: item[2], reverse=True)[:max_terms]
+    return {term_id: weight for term_id, _, weight in scored}
+
+
+def rank(weights, limit, condition=Q()):
+    """Top-limit объявлений по похожести на запрос weights.
+
+    condition — условие на AdTerm, поля объявления задаются через ad__.
+    Оценки суммируются по постингам терминов запроса с группировкой по
+    ad_id, полные строки объявлений читаются только для top-limit.
+    """
+    if not weights:
+        return Ad.objects.none()
+
+    def score(prefix):
+        return Sum(Case(
+            *[When(**{f'{prefix}term_id': term_id}, then=Value(weight)) for term_id, weight in weights.items()],
+            output_field=FloatField(),
+        ) * F(f'{prefix}weight'))
+
+    top = (
+        AdTerm.objects.filter(condition, term_id__in=list(weights)).values('ad_id')
+        .annotate(similarity=score('')).order_by('-similarity', '-ad_id')[:limit]
+    )
+    return (
+        Ad.objects.filter(pk__in=top.values('ad_id'), terms__term_id__in=list(weights))
+        .annotate(similarity=score('terms__')).order_by('-similarity', '-id')
+    )
+
+
+def similar_ads(ad, limit=5, condition=Q(), max_terms=QUERY_TERMS):
+    return rank(query_weights(ad, max_terms), limit, condition & ~Q(ad=ad))
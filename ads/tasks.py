@@ -0,0 +1,23 @@
+"""Фоновые задачи приложения (см. ads.queue)."""
+from django.db import transaction
+
+from . import saved_searches, similarity
+from .models import Ad
+from .queue import task
+
+
+@task()
+def index_ad_similarity(ad_id):
+    """Переиндексирует объявление для похожих; удаленное к моменту выполнения пропускается."""
+    # Одна транзакция: задачи одного объявления из разных воркеров не смешивают
+    # постинги и df; проигравшая блокировку задача повторится.
+    with transaction.atomic():
+        ad = Ad.objects.filter(pk=ad_id).only('title', 'description', 'category').first()
+        if ad is not None:
+            similarity.index_ads([ad])
+
+
+@task()
+def match_saved_searches(ad_ids):
+    """Добавляет новые объявления в ленты по сохраненным поискам."""
+    saved_searches.match_ad_ids(ad_ids)
@@ -0,0 +1,87 @@
+"""Помощники для тестов производительности представлений и баз данных."""
+import re
+import sqlite3
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+# SQLite до 3.36 пишет "SCAN TABLE ads_ad [AS T3]", новые версии — "SCAN ads_ad" или псевдоним.
+# Строки с USING INDEX — чтение по индексу, они не совпадают.
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS \S+)?$')
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def query_plan(sql, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql, using=DEFAULT_DB_ALIAS):
+    """Таблицы, которые план запроса SQLite читает целиком, без индекса."""
+    return [
+        match.group(1)
+        for match in map(FULL_SCAN_RE.match, query_plan(sql, using))
+        if match
+    ]
+
+
+@contextmanager
+def assert_no_full_scans(using=DEFAULT_DB_ALIAS):
+    """Проверяет планы всех запросов, выполненных внутри блока."""
+    connection = connections[using]
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if connection.vendor != 'sqlite':
+        return
+    problems = []
+    for query in context.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            continue
+        tables = full_scans(sql, using)
+        if tables:
+            problems.append(f'{", ".join(tables)}: {sql}')
+    if problems:
+        raise AssertionError('Запросы без индекса:\n' + '\n'.join(problems))
+
+
+@contextmanager
+def assert_max_queries(limit, using=DEFAULT_DB_ALIAS):
+    """Проверяет, что внутри блока выполнено не больше limit запросов."""
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > limit:
+        queries = '\n'.join(
+            f'{index}. {query["sql"]}' for index, query in enumerate(context.captured_queries, start=1)
+        )
+        raise AssertionError(f'{executed} запросов при бюджете {limit}:\n{queries}')
+
+
+def copy_database(path, using=DEFAULT_DB_ALIAS):
+    """Копирует SQLite-базу using в файл path через backup API (снимок для реплики)."""
+    connection = connections[using]
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+
+
+@contextmanager
+def sqlite_alias(alias, path):
+    """Временно направляет соединения alias (во всех потоках) на SQLite-файл path."""
+    original_settings = connections.settings[alias]
+    original_connection = connections[alias]
+    original_connection.close()
+    connections.settings[alias] = {**original_settings, 'NAME': path}
+    del connections[alias]
+    try:
+        yield connections[alias]
+    finally:
+        connections[alias].close()
+        connections.settings[alias] = original_settings
+        connections[alias] = original_connection
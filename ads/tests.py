@@ -1,9 +1,47 @@
-from django.test import TestCase, Client
-from django.urls import reverse
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.conf import settings
+from django.urls import resolve, reverse
 from django.contrib.auth.models import User
-from .models import Ad, ExchangeProposal
+from .models import (
+    Ad, AdTerm, ArchivedAd, ArchivedProposal, Category, ChangeLogEntry, Condition, ExchangeProposal, FeedItem,
+    InboxCounter, SavedSearch, SimilarityTerm, Task, WantEdge,
+)
 from .forms import AdForm, ExchangeProposalForm
+from .api import stream_ndjson
+from .bench import find_regressions, seed_users
+from .pagination import CursorPaginator
+from .matching import WantsGraph, rebuild_edges
+from .services import accept_proposal, soft_delete_ad, transition_proposal, transition_proposals
+from .signals import ads_created_in_bulk, proposals_created_in_bulk, proposals_status_changed
+from . import changelog
+from . import inbox
+from . import metrics
+from . import queue
+from . import saved_searches
+from . import similarity
+from .database import STICKY_COOKIE
+from .testing import FULL_SCAN_RE, assert_max_queries, assert_no_full_scans, copy_database, sqlite_alias
+from . import urls as ads_urls
+from . import cache as ads_cache
 from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.core.management import call_command
+from django.db import OperationalError, connection, models, transaction
+from django.core.cache import cache
+from django.template import engines
+from django.template.defaultfilters import truncatewords
+from django.template.loaders import cached
+from io import StringIO
+import base64
+import json
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.test.utils import CaptureQueriesContext
 
 class AdModelTest(TestCase):
 
@@ -188,6 +226,12 @@ class ExchangeProposalFormTest(TestCase):
         form = ExchangeProposalForm(data=form_data, user=self.proposing_user)
         self.assertTrue(form.is_valid(), msg=f"Форма не валидна, ошибки: {form.errors.as_json()}")
 
+    def test_exchange_proposal_form_rejects_foreign_ad_with_one_query(self):
+        form = ExchangeProposalForm(data={'ad_sender': self.ad_not_owned_by_proposer.pk}, user=self.proposing_user)
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertIn('ad_sender', form.errors)
+
 class AdCreateViewTest(TestCase):
 
     @classmethod
@@ -227,4 +271,2138 @@ class AdCreateViewTest(TestCase):
         self.client.logout()
         response = self.client.get(self.url)
         expected_redirect_url = f"{reverse('login')}?next={self.url}"
-        self.assertEqual(response.status_code, 302) 
\ No newline at end of file
+        self.assertEqual(response.status_code, 302) 
+
+class AdSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searchuser', password='password123')
+        cls.bike = Ad.objects.create(
+            user=cls.user,
+            title='Велосипед горный',
+            description='Горный велосипед, двадцать одна скорость.',
+            category='Спорт',
+            condition='Хорошее'
+        )
+        cls.lamp = Ad.objects.create(
+            user=cls.user,
+            title='Настольная лампа',
+            description='Лампа для велосипедистов и не только.',
+            category='Электроника',
+            condition='Новое'
+        )
+        cls.url = reverse('ads:ad_list')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_search_by_word_prefix(self):
+        response = self.client.get(self.url, {'q': 'ЛАМП'})
+        self.assertEqual(list(response.context['page_obj']), [self.lamp])
+
+    def test_search_results_ranked(self):
+        response = self.client.get(self.url, {'q': 'велосипед'})
+        self.assertEqual(list(response.context['page_obj']), [self.bike, self.lamp])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.lamp.title = 'Торшер'
+        self.lamp.description = 'Напольный.'
+        self.lamp.save()
+        response = self.client.get(self.url, {'q': 'торшер'})
+        self.assertEqual(list(response.context['page_obj']), [self.lamp])
+        response = self.client.get(self.url, {'q': 'лампа'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+        self.bike.delete()
+        response = self.client.get(self.url, {'q': 'велосипед'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+    def test_search_ignores_fts_syntax(self):
+        response = self.client.get(self.url, {'q': '"велосипед" (горн*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.bike, response.context['page_obj'])
+
+    def test_rebuild_search_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ads_ad_fts')
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(self.url, {'q': 'горный'})
+        self.assertEqual(list(response.context['page_obj']), [self.bike])
+
+
+class CursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pageuser', password='password123')
+        cls.ads = [
+            Ad.objects.create(
+                user=cls.user,
+                title=f'Объявление {i}',
+                description='Описание.',
+                category='Книги',
+                condition='Хорошее'
+            )
+            for i in range(12)
+        ]
+        cls.url = reverse('ads:ad_list')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(self.url, {'cursor': cursor} if cursor else {})
+            page = response.context['page_obj']
+            pages.append(list(page))
+            seen.extend(page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, list(reversed(self.ads)))
+        self.assertEqual([len(p) for p in pages], [5, 5, 2])
+
+        response = self.client.get(self.url, {'cursor': page.previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), pages[1])
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_ads_with_same_created_at(self):
+        Ad.objects.update(created_at=timezone.now())
+        paginator = CursorPaginator(Ad.objects.order_by('-created_at'), 5)
+        seen = []
+        page = paginator.get_page()
+        seen.extend(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(sorted(ad.pk for ad in seen), sorted(ad.pk for ad in self.ads))
+
+    # Корректный base64 JSON, но значения не подходят полям сортировки.
+    TAMPERED_CURSORS = [
+        {'v': [1, 2]},
+        {'v': [1, 2], 'b': 0},
+        {'v': ['x', 'y'], 'b': 0},
+        {'v': [None, None], 'b': 0},
+        {'v': [{'dt': '2026-01-01T00:00:00+00:00'}, 'abc'], 'b': 0},
+        {'v': [[1], {'a': 1}], 'b': 0},
+    ]
+
+    @staticmethod
+    def raw_cursor(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+    def test_invalid_cursor_returns_first_page(self):
+        for cursor in ['не-курсор', *map(self.raw_cursor, self.TAMPERED_CURSORS)]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['page_obj']), list(reversed(self.ads))[:5])
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_invalid_proposal_cursor_returns_first_page(self):
+        other = User.objects.create_user(username='pageother', password='password123')
+        other_ad = Ad.objects.create(
+            user=other, title='Велосипед', description='Описание.', category='Спорт', condition='Хорошее'
+        )
+        proposals = [ExchangeProposal.objects.create(ad_sender=other_ad, ad_receiver=ad) for ad in self.ads]
+        self.client.login(username='pageuser', password='password123')
+        for cursor in map(self.raw_cursor, self.TAMPERED_CURSORS):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    reverse('ads:exchange_proposal_list'), {'received_cursor': cursor, 'sent_cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['received_proposals']), list(reversed(proposals))[:10])
+
+    def test_filters_kept_in_pagination_links(self):
+        response = self.client.get(self.url, {'category': 'Книги'})
+        self.assertContains(response, '&category=%D0%BA%D0%BD%D0%B8%D0%B3%D0%B8')
+
+
+class QueryPlanTest(TestCase):
+    """Основные запросы представлений не должны читать таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='planowner', password='password123')
+        cls.other = User.objects.create_user(username='planother', password='password123')
+        cls.own_ad = Ad.objects.create(
+            user=cls.owner, title='Палатка', description='Туристическая палатка.',
+            category='Спорт', condition='Хорошее'
+        )
+        cls.other_ad = Ad.objects.create(
+            user=cls.other, title='Гитара', description='Акустическая гитара.',
+            category='Музыка', condition='Новое'
+        )
+        cls.proposal = ExchangeProposal.objects.create(ad_sender=cls.other_ad, ad_receiver=cls.own_ad)
+
+    def setUp(self):
+        self.client.login(username='planowner', password='password123')
+
+    def assertPlansUseIndexes(self, method, url, data=None):
+        with assert_no_full_scans():
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_ad_list_queries(self):
+        url = reverse('ads:ad_list')
+        response = self.assertPlansUseIndexes('get', url)
+        self.assertPlansUseIndexes('get', url, {'q': 'палатка'})
+        self.assertPlansUseIndexes('get', url, {'category': 'Спорт'})
+        self.assertPlansUseIndexes('get', url, {'condition': 'Новое'})
+        cursor = response.context['page_obj'].paginator.cursor_for(self.own_ad)
+        self.assertPlansUseIndexes('get', url, {'cursor': cursor})
+
+    def test_ad_edit_and_delete_queries(self):
+        self.assertPlansUseIndexes('get', reverse('ads:ad_create'))
+        self.assertPlansUseIndexes('get', reverse('ads:ad_update', args=[self.own_ad.pk]))
+        self.assertPlansUseIndexes('get', reverse('ads:ad_delete', args=[self.own_ad.pk]))
+
+    def test_proposal_queries(self):
+        self.assertPlansUseIndexes('get', reverse('ads:exchange_proposal_list'))
+        self.client.login(username='planother', password='password123')
+        self.assertPlansUseIndexes('get', reverse('ads:exchange_proposal_create', args=[self.own_ad.pk]))
+        self.assertPlansUseIndexes('get', reverse('ads:ad_autocomplete'), {'q': 'гит'})
+        self.client.login(username='planowner', password='password123')
+        self.assertPlansUseIndexes(
+            'post', reverse('ads:exchange_proposal_update_status', args=[self.proposal.pk, 'accepted'])
+        )
+
+    def test_saved_search_queries(self):
+        self.assertPlansUseIndexes('post', reverse('ads:saved_search_create'), {'q': 'гитара'})
+        self.assertPlansUseIndexes('get', reverse('ads:feed'))
+        with assert_no_full_scans():
+            saved_searches.match_ads([self.other_ad])
+
+    @override_settings(ADS_CHANGELOG_SETTLE=0)
+    def test_change_log_queries(self):
+        with assert_no_full_scans():
+            entries = changelog.entries_since(None, 2)
+            list(changelog.stream_ndjson(changelog.entries_since((entries[-1][1], entries[-1][0]))))
+            changelog.record_ad_proposals([self.own_ad.pk])
+            changelog.compact(0, 0)
+
+    def test_full_scan_pattern_matches_both_plan_spellings(self):
+        for line in ('SCAN ads_ad', 'SCAN TABLE ads_ad', 'SCAN TABLE ads_ad AS T3'):
+            with self.subTest(line=line):
+                self.assertEqual(FULL_SCAN_RE.match(line).group(1), 'ads_ad')
+        for line in (
+            'SEARCH ads_ad USING INDEX ads_ad_user_id (user_id=?)',
+            'SCAN TABLE ads_ad USING INDEX ads_ad_created_idx',
+            'SCAN ads_ad USING COVERING INDEX ads_ad_created_idx',
+            'SCAN CONSTANT ROW',
+        ):
+            with self.subTest(line=line):
+                self.assertIsNone(FULL_SCAN_RE.match(line))
+
+    def test_full_scan_detected(self):
+        with self.assertRaises(AssertionError):
+            with assert_no_full_scans():
+                list(Ad.objects.filter(description__icontains='палатка'))
+
+
+class QueryBudgetTest(TestCase):
+    """Каждый маршрут ads/urls.py укладывается в свой query_budget при любом объеме данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Персонал: маршруты только для персонала тоже выполняют свою работу, а не редирект.
+        cls.owner = User.objects.create_user(username='budgetowner', password='password123', is_staff=True)
+        cls.other = User.objects.create_user(username='budgetother', password='password123')
+        cls.own_ads = [
+            Ad.objects.create(
+                user=cls.owner, title=f'Мое {i}', description='Описание.',
+                category='Книги', condition='Хорошее'
+            )
+            for i in range(25)
+        ]
+        cls.other_ads = [
+            Ad.objects.create(
+                user=cls.other, title=f'Чужое {i}', description='Описание.',
+                category='Игры', condition='Новое'
+            )
+            for i in range(25)
+        ]
+        cls.proposals = [
+            ExchangeProposal.objects.create(ad_sender=other_ad, ad_receiver=own_ad)
+            for own_ad, other_ad in zip(cls.own_ads, cls.other_ads)
+        ] + [
+            ExchangeProposal.objects.create(ad_sender=own_ad, ad_receiver=other_ad)
+            for own_ad, other_ad in zip(cls.own_ads, cls.other_ads)
+        ]
+        cls.saved_search, _ = saved_searches.save_search(cls.owner, {'q': 'чужое'})
+
+    def setUp(self):
+        self.client.login(username='budgetowner', password='password123')
+
+    def route_requests(self):
+        """(method, kwargs, data) для каждого имени маршрута."""
+        return {
+            'ad_list': [('get', {}, {}), ('get', {}, {'q': 'мое', 'category': 'книги'})],
+            'ad_create': [('get', {}, {})],
+            'ad_update': [('get', {'pk': self.own_ads[0].pk}, {})],
+            'ad_delete': [('get', {'pk': self.own_ads[0].pk}, {}), ('post', {'pk': self.own_ads[1].pk}, {})],
+            'exchange_proposal_create': [('get', {'ad_receiver_pk': self.other_ads[0].pk}, {})],
+            'ad_autocomplete': [('get', {}, {}), ('get', {}, {'q': 'мое 1'})],
+            'exchange_proposal_list': [('get', {}, {}), ('get', {}, {'archived': '1'})],
+            'ad_list_async': [('get', {}, {}), ('get', {}, {'q': 'мое', 'category': 'книги'})],
+            'exchange_proposal_list_async': [('get', {}, {}), ('get', {}, {'archived': '1'})],
+            'exchange_proposal_update_status': [
+                ('post', {'proposal_pk': self.proposals[0].pk, 'new_status': 'accepted'}, {}),
+            ],
+            'exchange_proposal_bulk_update_status': [
+                ('post', {}, {'status': 'rejected', 'proposal_ids': [p.pk for p in self.proposals]}),
+            ],
+            'cache_stats': [('get', {}, {})],
+            'inbox_counter': [('get', {}, {})],
+            'ad_api_list': [('get', {}, {}), ('get', {}, {'q': 'мое', 'fields': 'id,title,user'})],
+            'ad_export': [('get', {}, {}), ('get', {}, {'category': 'игры', 'fields': 'id,user'})],
+            'barter_cycles': [('get', {}, {}), ('get', {}, {'length': 5})],
+            'saved_search_create': [('post', {}, {'q': 'мое', 'category': 'книги'}), ('post', {}, {'q': 'чужое'})],
+            'saved_search_delete': [('post', {'pk': self.saved_search.pk}, {})],
+            'feed': [('get', {}, {})],
+            'changes': [('get', {}, {}), ('get', {}, {'limit': 10})],
+        }
+
+    def test_every_route_within_budget(self):
+        requests = self.route_requests()
+        for pattern in ads_urls.urlpatterns:
+            with self.subTest(route=pattern.name):
+                self.assertIn(pattern.name, requests, 'Для маршрута не описан запрос в route_requests().')
+                budget = getattr(pattern.callback, 'query_budget', None)
+                self.assertIsNotNone(budget, 'Представление без @query_budget.')
+                url_name = f'{ads_urls.app_name}:{pattern.name}'
+                for method, kwargs, data in requests[pattern.name]:
+                    with assert_max_queries(budget):
+                        response = getattr(self.client, method)(reverse(url_name, kwargs=kwargs), data)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                    self.assertLess(response.status_code, 400)
+
+    def test_anonymous_ad_list_fixed_queries(self):
+        self.client.logout()
+        # Страница объявлений и два справочника для фильтров.
+        with assert_max_queries(3):
+            self.client.get(reverse('ads:ad_list'))
+
+
+class AdListCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cacheuser', password='password123')
+        cls.staff = User.objects.create_user(username='cachestaff', password='password123', is_staff=True)
+        cls.ad = Ad.objects.create(
+            user=cls.user, title='Самокат', description='Городской самокат.',
+            category='Спорт', condition='Хорошее'
+        )
+        cls.url = reverse('ads:ad_list')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_served_from_cache(self):
+        first = self.client.get(self.url, {'q': 'самокат'})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'q': ' самокат ', 'utm_source': 'mail'})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(ads_cache.stats()['hits'], 1)
+        self.assertEqual(ads_cache.stats()['misses'], 1)
+
+    def test_ad_changes_invalidate_cached_pages(self):
+        self.client.get(self.url)
+        generation = ads_cache.get_generation()
+        new_ad = Ad.objects.create(
+            user=self.user, title='Ролики', description='Роликовые коньки.',
+            category='Спорт', condition='Новое'
+        )
+        self.assertGreater(ads_cache.get_generation(), generation)
+        self.assertContains(self.client.get(self.url), 'Ролики')
+
+        new_ad.title = 'Скейт'
+        new_ad.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Скейт')
+        self.assertNotContains(response, 'Ролики')
+
+        new_ad.delete()
+        self.assertNotContains(self.client.get(self.url), 'Скейт')
+
+    def test_authenticated_pages_not_cached(self):
+        self.client.login(username='cacheuser', password='password123')
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(ads_cache.stats()['hits'], 0)
+        self.assertEqual(ads_cache.stats()['misses'], 0)
+
+    def test_cache_stats_view_for_staff_only(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.client.login(username='cacheuser', password='password123')
+        self.assertEqual(self.client.get(reverse('ads:cache_stats')).status_code, 302)
+        self.client.login(username='cachestaff', password='password123')
+        response = self.client.get(reverse('ads:cache_stats'))
+        self.assertEqual(response.json()['hits'], 1)
+        self.assertEqual(response.json()['misses'], 1)
+
+
+
+class TemplateRenderingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='renderowner', password='password123')
+        cls.other = User.objects.create_user(username='renderother', password='password123')
+        cls.ad = Ad.objects.create(
+            user=cls.owner, title='Байдарка', description=' '.join(f'слово{i}' for i in range(40)),
+            category='Спорт', condition='Хорошее'
+        )
+        cls.other_ad = Ad.objects.create(
+            user=cls.other, title='Палатка', description='Трехместная палатка.',
+            category='Спорт', condition='Б/У'
+        )
+        cls.proposal = ExchangeProposal.objects.create(ad_sender=cls.other_ad, ad_receiver=cls.ad)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_loader_returns_instrumented_templates(self):
+        backend = engines.all()[0]
+        self.assertIsInstance(backend, metrics.InstrumentedDjangoTemplates)
+        self.assertIsInstance(backend.engine.template_loaders[0], cached.Loader)
+        first = backend.get_template('ads/ad_list.html')
+        self.assertIsInstance(first, metrics.InstrumentedTemplate)
+        # Скомпилированный шаблон движка один и тот же, оборачивается только бэкенд.
+        self.assertIs(first.template.template, backend.get_template('ads/ad_list.html').template.template)
+
+    def test_excerpt_matches_truncatewords_and_follows_description(self):
+        self.assertEqual(self.ad.excerpt, truncatewords(self.ad.description, 30))
+        self.ad.description = 'Легкая байдарка.'
+        self.ad.save()
+        self.assertEqual(Ad.objects.get(pk=self.ad.pk).excerpt, 'Легкая байдарка.')
+
+    def test_ad_fragments_keyed_on_updated_at_and_owner(self):
+        self.client.login(username='renderowner', password='password123')
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, self.ad.excerpt)
+        self.assertContains(response, reverse('ads:ad_update', kwargs={'pk': self.ad.pk}))
+
+        self.client.login(username='renderother', password='password123')
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertNotContains(response, reverse('ads:ad_update', kwargs={'pk': self.ad.pk}))
+        self.assertContains(response, reverse('ads:exchange_proposal_create', kwargs={'ad_receiver_pk': self.ad.pk}))
+
+        # Блок берется из кэша, пока не изменится updated_at.
+        Ad.objects.filter(pk=self.ad.pk).update(title='Каяк')
+        self.assertContains(self.client.get(reverse('ads:ad_list')), 'Байдарка')
+        ad = Ad.objects.get(pk=self.ad.pk)
+        ad.save()
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, 'Каяк')
+        self.assertNotContains(response, 'Байдарка')
+
+    def test_proposal_rows_cached_without_csrf_tokens(self):
+        self.client.login(username='renderowner', password='password123')
+        url = reverse('ads:exchange_proposal_list')
+        response = self.client.get(url)
+        self.assertContains(response, 'Ожидает вашего решения')
+        self.assertContains(response, 'csrfmiddlewaretoken', count=1)
+
+        self.client.post(reverse(
+            'ads:exchange_proposal_update_status', kwargs={'proposal_pk': self.proposal.pk, 'new_status': 'accepted'}
+        ))
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Ожидает вашего решения')
+        self.assertContains(response, 'Принята')
+
+    def test_fragments_follow_author_renames_and_counterpart_edits(self):
+        self.client.login(username='renderowner', password='password123')
+        self.client.get(reverse('ads:ad_list'))
+        self.client.get(reverse('ads:exchange_proposal_list'))
+
+        # Имя меняется без правки объявлений: ключ все равно другой.
+        User.objects.filter(pk=self.other.pk).update(username='renamed')
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, 'Автор: renamed')
+        self.assertNotContains(response, 'renderother')
+        response = self.client.get(reverse('ads:exchange_proposal_list'))
+        self.assertContains(response, 'Предложение от: renamed')
+
+        self.other_ad.title = 'Шатер'
+        self.other_ad.save()
+        response = self.client.get(reverse('ads:exchange_proposal_list'))
+        self.assertContains(response, '"Шатер"')
+        self.assertNotContains(response, 'Палатка')
+
+class CatalogueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='catalogueuser', password='password123')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_ad(self, category, condition='Хорошее'):
+        return Ad.objects.create(
+            user=self.user, title='Вещь', description='Описание.',
+            category=category, condition=condition
+        )
+
+    def test_ads_share_normalized_entry(self):
+        first = self.create_ad('Электроника')
+        second = self.create_ad('  электроника ')
+        self.assertEqual(first.category_ref, second.category_ref)
+        self.assertEqual(first.category_ref.name, 'Электроника')
+        self.assertEqual(Category.objects.get(key='электроника').ad_count, 2)
+
+    def test_counts_follow_update_and_delete(self):
+        ad = self.create_ad('Книги')
+        other = self.create_ad('Книги')
+        ad.category = 'Игры'
+        ad.save()
+        self.assertEqual(Category.objects.get(key='книги').ad_count, 1)
+        self.assertEqual(Category.objects.get(key='игры').ad_count, 1)
+        ad.title = 'Новое название'
+        ad.save()
+        self.assertEqual(Category.objects.get(key='игры').ad_count, 1)
+        other.delete()
+        ad.delete()
+        self.assertEqual(Category.objects.get(key='книги').ad_count, 0)
+        self.assertEqual(Category.objects.get(key='игры').ad_count, 0)
+        self.assertEqual(Condition.objects.get(key='хорошее').ad_count, 0)
+
+    def test_ad_list_filters_and_facets(self):
+        book = self.create_ad('Книги', 'Новое')
+        self.create_ad('Игры', 'Б/У')
+        response = self.client.get(reverse('ads:ad_list'), {'category': 'КНИГИ'})
+        self.assertEqual(list(response.context['page_obj']), [book])
+        self.assertEqual(
+            [(c.name, c.ad_count) for c in response.context['categories']],
+            [('Игры', 1), ('Книги', 1)]
+        )
+        response = self.client.get(reverse('ads:ad_list'), {'condition': 'б/у', 'category': 'книги'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+class ImportCommandTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='password123')
+        cls.bob = User.objects.create_user(username='bob', password='password123')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def ads_jsonl(self, rows):
+        return self.write_file('ads.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+
+    def ad_row(self, external_id, username='alice', **extra):
+        row = {
+            'external_id': external_id, 'username': username, 'title': f'Лодка {external_id}',
+            'description': 'Надувная лодка.', 'category': 'Спорт', 'condition': 'Б/У',
+        }
+        row.update(extra)
+        return row
+
+    def run_import(self, command, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command(command, path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_ads_in_batches(self):
+        path = self.ads_jsonl([
+            self.ad_row('a1'), self.ad_row('a2'), self.ad_row('a3', title=''),
+            self.ad_row('a4', username='nobody'), self.ad_row('a5', username='bob'),
+        ])
+        out, err = self.run_import('import_ads', path, '--batch-size', '2')
+        self.assertIn('создано 3', out)
+        self.assertIn('строка 3: title', err)
+        self.assertIn('строка 4', err)
+        self.assertEqual(Ad.objects.filter(external_id__isnull=False).count(), 3)
+        self.assertEqual(Category.objects.get(key='спорт').ad_count, 3)
+        self.assertEqual(
+            set(Ad.objects.filter(external_id__isnull=False).values_list('excerpt', flat=True)), {'Надувная лодка.'}
+        )
+        response = self.client.get(reverse('ads:ad_list'), {'q': 'надувная'})
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_dry_run_writes_nothing(self):
+        path = self.ads_jsonl([self.ad_row('a1'), self.ad_row('a2')])
+        out, _ = self.run_import('import_ads', path, '--dry-run')
+        self.assertIn('Проверка завершена', out)
+        self.assertFalse(Ad.objects.exists())
+        self.assertFalse(Category.objects.exists())
+
+    def test_resume_from_checkpoint_and_skip_existing(self):
+        checkpoint = os.path.join(self.tmpdir.name, 'ads.checkpoint')
+        path = self.ads_jsonl([self.ad_row('a1'), self.ad_row('a2')])
+        self.run_import('import_ads', path, '--checkpoint', checkpoint)
+        path = self.ads_jsonl([self.ad_row('a1'), self.ad_row('a2'), self.ad_row('a3')])
+        with CaptureQueriesContext(connection) as queries:
+            out, _ = self.run_import('import_ads', path, '--checkpoint', checkpoint)
+        self.assertIn('обработано 1, создано 1', out)
+        self.assertFalse(any('"a1"' in query['sql'] for query in queries.captured_queries))
+        out, _ = self.run_import('import_ads', path)
+        self.assertIn('создано 0, пропущено 3', out)
+        self.assertEqual(Ad.objects.count(), 3)
+
+    def test_numeric_external_ids_skip_duplicates(self):
+        path = self.ads_jsonl([self.ad_row(123), self.ad_row(' 124 ')])
+        out, _ = self.run_import('import_ads', path)
+        self.assertIn('создано 2', out)
+        self.assertEqual(
+            sorted(Ad.objects.filter(external_id__isnull=False).values_list('external_id', flat=True)), ['123', '124']
+        )
+        path = self.ads_jsonl([self.ad_row(123), self.ad_row('124'), self.ad_row(123, username='bob')])
+        out, _ = self.run_import('import_ads', path)
+        self.assertIn('создано 0, пропущено 3', out)
+
+        path = self.write_file('proposals.jsonl', json.dumps({'external_id': 7, 'ad_sender': 123, 'ad_receiver': 124}))
+        Ad.objects.filter(external_id='124').update(user=self.bob)
+        out, _ = self.run_import('import_proposals', path)
+        self.assertIn('создано 1', out)
+        self.assertTrue(ExchangeProposal.objects.filter(external_id='7').exists())
+
+    def test_import_proposals_csv(self):
+        self.run_import('import_ads', self.ads_jsonl([
+            self.ad_row('a1'), self.ad_row('b1', username='bob'), self.ad_row('b2', username='bob'),
+        ]))
+        path = self.write_file('proposals.csv', (
+            'external_id,ad_sender,ad_receiver,comment,status\n'
+            'p1,b1,a1,Меняю,pending\n'
+            'p2,b2,b1,,pending\n'
+            'p3,b2,zz,,pending\n'
+            'p4,b2,a1,,unknown\n'
+        ))
+        out, err = self.run_import('import_proposals', path)
+        self.assertIn('создано 1', out)
+        self.assertEqual(err.count('строка'), 3)
+        proposal = ExchangeProposal.objects.get(external_id='p1')
+        self.assertEqual(proposal.ad_sender.external_id, 'b1')
+        self.assertEqual(proposal.comment, 'Меняю')
+
+
+class ProposalStatusTransitionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.receiver = User.objects.create_user(username='statusreceiver', password='password123')
+        cls.sender = User.objects.create_user(username='statussender', password='password123')
+        cls.receiver_ad = Ad.objects.create(
+            user=cls.receiver, title='Мяч', description='Футбольный мяч.',
+            category='Спорт', condition='Новое'
+        )
+        cls.sender_ads = [
+            Ad.objects.create(
+                user=cls.sender, title=f'Предмет {i}', description='Описание.',
+                category='Разное', condition='Б/У'
+            )
+            for i in range(3)
+        ]
+        cls.proposals = [
+            ExchangeProposal.objects.create(ad_sender=ad, ad_receiver=cls.receiver_ad)
+            for ad in cls.sender_ads
+        ]
+
+    def status_url(self, proposal, status):
+        return reverse('ads:exchange_proposal_update_status', args=[proposal.pk, status])
+
+    def test_receiver_accepts_in_one_update(self):
+        self.client.login(username='statusreceiver', password='password123')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.status_url(self.proposals[0], 'accepted'))
+        transitions = [q['sql'] for q in queries.captured_queries if 'WHERE id IN' in q['sql']]
+        self.assertEqual(len(transitions), 1)
+        self.assertNotIn('SELECT "ads_exchangeproposal"', ' '.join(q['sql'] for q in queries.captured_queries))
+        self.proposals[0].refresh_from_db()
+        self.assertEqual(self.proposals[0].status, 'accepted')
+
+    def test_only_pending_proposals_of_owner_change(self):
+        self.client.login(username='statussender', password='password123')
+        self.client.post(self.status_url(self.proposals[0], 'accepted'))
+        self.proposals[0].refresh_from_db()
+        self.assertEqual(self.proposals[0].status, 'pending')
+
+        self.assertTrue(transition_proposal(self.receiver, self.proposals[0].pk, 'rejected'))
+        self.assertFalse(transition_proposal(self.receiver, self.proposals[0].pk, 'accepted'))
+        self.proposals[0].refresh_from_db()
+        self.assertEqual(self.proposals[0].status, 'rejected')
+
+    def test_get_and_invalid_status_do_not_change(self):
+        self.client.login(username='statusreceiver', password='password123')
+        self.client.get(self.status_url(self.proposals[0], 'accepted'))
+        self.assertEqual(self.client.post(self.status_url(self.proposals[0], 'pending')).status_code, 404)
+        self.proposals[0].refresh_from_db()
+        self.assertEqual(self.proposals[0].status, 'pending')
+
+    def test_bulk_reject(self):
+        transition_proposal(self.receiver, self.proposals[0].pk, 'rejected')
+        self.client.login(username='statusreceiver', password='password123')
+        response = self.client.post(
+            reverse('ads:exchange_proposal_bulk_update_status'),
+            {'status': 'rejected', 'proposal_ids': [p.pk for p in self.proposals]},
+            follow=True,
+        )
+        self.assertContains(response, 'Обработано предложений: 2.')
+        self.assertEqual(
+            list(ExchangeProposal.objects.order_by('pk').values_list('status', flat=True)),
+            ['rejected', 'rejected', 'rejected'],
+        )
+
+
+class ConcurrentProposalTransitionTest(TransactionTestCase):
+
+    def setUp(self):
+        self.receiver = User.objects.create_user(username='racereceiver', password='password123')
+        sender = User.objects.create_user(username='racesender', password='password123')
+        receiver_ad = Ad.objects.create(
+            user=self.receiver, title='Часы', description='Наручные часы.',
+            category='Аксессуары', condition='Хорошее'
+        )
+        sender_ad = Ad.objects.create(
+            user=sender, title='Компас', description='Туристический компас.',
+            category='Спорт', condition='Хорошее'
+        )
+        self.proposal = ExchangeProposal.objects.create(ad_sender=sender_ad, ad_receiver=receiver_ad)
+
+    def test_parallel_transitions_apply_once(self):
+        workers = 8
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def transition(status):
+            barrier.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        results.append((status, transition_proposal(self.receiver, self.proposal.pk, status)))
+                        return
+                    except OperationalError:
+                        # Общая in-memory база SQLite блокирует таблицу целиком.
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=transition, args=('accepted' if i % 2 else 'rejected',))
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), workers)
+        winners = [status for status, changed in results if changed]
+        self.assertEqual(len(winners), 1)
+        self.proposal.refresh_from_db()
+        self.assertEqual(self.proposal.status, winners[0])
+
+
+class AcceptProposalWorkflowTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.receiver = User.objects.create_user(username='acceptreceiver', password='password123')
+        cls.sender = User.objects.create_user(username='acceptsender', password='password123')
+        cls.third = User.objects.create_user(username='acceptthird', password='password123')
+        cls.receiver_ad = Ad.objects.create(
+            user=cls.receiver, title='Фотоаппарат', description='Пленочный фотоаппарат.',
+            category='Электроника', condition='Хорошее'
+        )
+        cls.spare_ad = Ad.objects.create(
+            user=cls.receiver, title='Штатив', description='Легкий штатив.',
+            category='Электроника', condition='Хорошее'
+        )
+        cls.sender_ad = Ad.objects.create(
+            user=cls.sender, title='Объектив', description='Светосильный объектив.',
+            category='Электроника', condition='Отличное'
+        )
+        cls.third_ads = Ad.objects.bulk_create([
+            Ad(user=cls.third, title=f'Вещь {i}', description='Описание.', category='Разное', condition='Б/У')
+            for i in range(2000)
+        ])
+        cls.accepted = ExchangeProposal.objects.create(ad_sender=cls.sender_ad, ad_receiver=cls.receiver_ad)
+        # Тысячи конкурирующих предложений к обоим объявлениям обмена.
+        ExchangeProposal.objects.bulk_create(
+            [ExchangeProposal(ad_sender=ad, ad_receiver=cls.receiver_ad) for ad in cls.third_ads[:1500]]
+            + [ExchangeProposal(ad_sender=ad, ad_receiver=cls.sender_ad) for ad in cls.third_ads[1500:]]
+        )
+        cls.sender_offer = ExchangeProposal.objects.create(ad_sender=cls.sender_ad, ad_receiver=cls.spare_ad)
+        cls.unrelated = ExchangeProposal.objects.create(ad_sender=cls.third_ads[0], ad_receiver=cls.spare_ad)
+
+    def test_accept_resolves_competitors_with_fixed_queries(self):
+        # Пять запросов обмена, три на граф желаний: вычитание принятого (ребро
+        # остается за счет sender_offer), вычитание отклоненных и удаление пустых
+        # ребер, два на счетчики предложений: для принятого и для отклоненных, и три
+        # на журнал изменений: объявления, принятое и отклоненные.
+        with self.assertNumQueries(13):
+            self.assertTrue(accept_proposal(self.receiver, self.accepted.pk))
+        statuses = dict(
+            ExchangeProposal.objects.values_list('status').annotate(total=models.Count('id'))
+        )
+        self.assertEqual(statuses, {'accepted': 1, 'rejected': 2001, 'pending': 1})
+        self.unrelated.refresh_from_db()
+        self.assertEqual(self.unrelated.status, 'pending')
+        self.assertEqual(
+            set(Ad.objects.filter(exchanged_at__isnull=False).values_list('pk', flat=True)),
+            {self.receiver_ad.pk, self.sender_ad.pk},
+        )
+
+    def test_competing_proposal_cannot_be_accepted_afterwards(self):
+        competitor = ExchangeProposal.objects.filter(ad_receiver=self.receiver_ad, status='pending').exclude(
+            pk=self.accepted.pk
+        ).first()
+        self.assertTrue(accept_proposal(self.receiver, self.accepted.pk))
+        self.assertFalse(accept_proposal(self.receiver, competitor.pk))
+
+    def test_bulk_accept_skips_resolved_competitors(self):
+        self.client.login(username='acceptreceiver', password='password123')
+        self.client.post(
+            reverse('ads:exchange_proposal_bulk_update_status'),
+            {'status': 'accepted', 'proposal_ids': [self.accepted.pk, self.unrelated.pk, self.sender_offer.pk]},
+        )
+        self.assertEqual(
+            ExchangeProposal.objects.filter(status='accepted').count(), 2
+        )
+        self.sender_offer.refresh_from_db()
+        self.assertEqual(self.sender_offer.status, 'rejected')
+
+    def test_transition_returns_ids_from_returning(self):
+        sent = []
+
+        def record(sender, proposal_ids, status, **kwargs):
+            sent.append((status, proposal_ids))
+
+        proposals_status_changed.connect(record)
+        self.addCleanup(proposals_status_changed.disconnect, record)
+        changed = transition_proposals(self.receiver, [str(self.accepted.pk), str(self.unrelated.pk)], 'accepted')
+        self.assertEqual(changed, [self.accepted.pk, self.unrelated.pk])
+        self.assertIn(('accepted', [self.accepted.pk]), sent)
+
+    def test_exchanged_ad_not_offered_or_proposable(self):
+        accept_proposal(self.receiver, self.accepted.pk)
+        form = ExchangeProposalForm(user=self.sender)
+        self.assertNotIn(self.sender_ad, form.fields['ad_sender'].queryset)
+        self.client.login(username='acceptthird', password='password123')
+        response = self.client.get(reverse('ads:exchange_proposal_create', args=[self.receiver_ad.pk]))
+        self.assertRedirects(response, reverse('ads:ad_list'))
+
+
+class AsyncReadViewsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='asyncowner', password='password123')
+        cls.other = User.objects.create_user(username='asyncother', password='password123')
+        cls.own_ads = [
+            Ad.objects.create(
+                user=cls.owner, title=f'Пластинка {i}', description='Виниловая пластинка.',
+                category='Музыка', condition='Хорошее'
+            )
+            for i in range(7)
+        ]
+        cls.other_ad = Ad.objects.create(
+            user=cls.other, title='Проигрыватель', description='Проигрыватель винила.',
+            category='Музыка', condition='Б/У'
+        )
+        ExchangeProposal.objects.create(ad_sender=cls.own_ads[0], ad_receiver=cls.other_ad)
+        ExchangeProposal.objects.create(ad_sender=cls.other_ad, ad_receiver=cls.own_ads[1])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_async_ad_list_matches_sync(self):
+        self.client.login(username='asyncother', password='password123')
+        for params in ({}, {'q': 'винил'}, {'category': 'музыка'}):
+            sync_page = self.client.get(reverse('ads:ad_list'), params).context['page_obj']
+            async_page = self.client.get(reverse('ads:ad_list_async'), params).context['page_obj']
+            self.assertEqual(list(async_page), list(sync_page))
+            self.assertEqual(async_page.next_cursor, sync_page.next_cursor)
+
+    async def test_async_ad_list_pages_for_authenticated_user(self):
+        await self.async_client.alogin(username='asyncowner', password='password123')
+        response = await self.async_client.get(reverse('ads:ad_list_async'))
+        self.assertContains(response, 'Редактировать')
+        cursor = response.context['page_obj'].next_cursor
+        response = await self.async_client.get(reverse('ads:ad_list_async'), {'cursor': cursor})
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    async def test_async_proposal_list_requires_login(self):
+        response = await self.async_client.get(reverse('ads:exchange_proposal_list_async'))
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.alogin(username='asyncowner', password='password123')
+        response = await self.async_client.get(reverse('ads:exchange_proposal_list_async'))
+        self.assertEqual(len(response.context['sent_proposals']), 1)
+        self.assertEqual(len(response.context['received_proposals']), 1)
+        self.assertContains(response, 'asyncother')
+
+    async def test_async_paginator_count(self):
+        paginator = CursorPaginator(Ad.objects.order_by('-created_at'), 5)
+        self.assertEqual(await paginator.acount(), 8)
+
+
+class AdApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='apiuser', password='password123')
+        cls.ads = [
+            Ad.objects.create(
+                user=cls.user, title=f'Пластинка {i}', description='Виниловая пластинка.',
+                category='Музыка' if i % 2 else 'Книги', condition='Хорошее'
+            )
+            for i in range(12)
+        ]
+
+    def test_api_pages_cover_all_ads(self):
+        seen = []
+        params = {'per_page': 5}
+        while True:
+            data = self.client.get(reverse('ads:ad_api_list'), params).json()
+            seen += [row['id'] for row in data['results']]
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(seen, [ad.pk for ad in reversed(self.ads)])
+
+    def test_api_field_projection(self):
+        data = self.client.get(reverse('ads:ad_api_list'), {'fields': 'title,user', 'q': 'пластинка'}).json()
+        self.assertEqual(data['results'][0], {'title': 'Пластинка 11', 'user': 'apiuser'})
+
+    def test_api_rejects_unknown_fields(self):
+        response = self.client.get(reverse('ads:ad_api_list'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('ads:ad_export'), {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_filtered_ndjson(self):
+        with assert_max_queries(1):
+            response = self.client.get(reverse('ads:ad_export'), {'category': 'музыка'})
+            self.assertTrue(response.streaming)
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row['category'] for row in rows}, {'Музыка'})
+        self.assertEqual(set(rows[0]), {
+            'id', 'title', 'description', 'image_url', 'category', 'condition',
+            'user', 'created_at', 'exchanged_at',
+        })
+
+    def test_export_chunks(self):
+        chunks = list(stream_ndjson(Ad.objects.order_by('id'), ['id'], chunk_size=5))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [5, 5, 2])
+
+
+class BarterCycleTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'cycle{i}', password='password123') for i in range(4)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Вещь {user.username}', description='Описание.',
+                category='Разное', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        # Циклы 0 -> 1 -> 2 -> 0, 0 -> 1 -> 2 -> 3 -> 0 и прямой обмен 0 <-> 3.
+        cls.proposals = {
+            (i, j): ExchangeProposal.objects.create(ad_sender=cls.ads[i], ad_receiver=cls.ads[j])
+            for i, j in [(0, 1), (1, 2), (2, 0), (0, 3), (3, 0), (2, 3)]
+        }
+
+    def edges(self):
+        return set(WantEdge.objects.values_list('from_user_id', 'to_user_id', 'proposal_count'))
+
+    def assertEdgesMatchRebuild(self):
+        incremental = self.edges()
+        rebuild_edges()
+        self.assertEqual(incremental, self.edges())
+
+    def user_cycle(self, *indexes):
+        return tuple(self.users[i].pk for i in indexes)
+
+    def test_edges_follow_proposal_lifecycle(self):
+        self.assertEqual(len(self.edges()), 6)
+        transition_proposal(self.users[0], self.proposals[(2, 0)].pk, 'rejected')
+        self.assertNotIn(self.user_cycle(2, 0), {edge[:2] for edge in self.edges()})
+        self.assertEdgesMatchRebuild()
+
+        proposal = self.proposals[(1, 2)]
+        proposal.status = 'accepted'
+        proposal.save()
+        self.ads[3].delete()
+        self.assertEdgesMatchRebuild()
+        self.assertEqual(len(self.edges()), 1)
+
+    def test_accept_releases_competing_edges(self):
+        accept_proposal(self.users[1], self.proposals[(0, 1)].pk)
+        # Объявления 0 и 1 обменены: остается только 2 -> 3.
+        self.assertEqual({edge[:2] for edge in self.edges()}, {self.user_cycle(2, 3)})
+        self.assertEdgesMatchRebuild()
+
+    def test_bulk_import_adds_edges(self):
+        extra = Ad.objects.create(
+            user=self.users[3], title='Еще вещь', description='Описание.', category='Разное', condition='Б/У'
+        )
+        ExchangeProposal.objects.bulk_create([ExchangeProposal(ad_sender=self.ads[1], ad_receiver=extra)])
+        proposals_created_in_bulk.send(
+            sender=ExchangeProposal, proposals=ExchangeProposal.objects.filter(ad_receiver=extra)
+        )
+        self.assertEdgesMatchRebuild()
+
+    def test_cycles_in_graph(self):
+        graph = WantsGraph.load()
+        self.assertEqual(set(graph.cycles(3)), {self.user_cycle(0, 1, 2)})
+        self.assertEqual(
+            set(graph.cycles(4, min_length=2)),
+            {self.user_cycle(0, 1, 2), self.user_cycle(0, 1, 2, 3), self.user_cycle(0, 3)},
+        )
+        around = WantsGraph.load_around(self.users[2].pk, 3)
+        self.assertEqual(list(around.cycles_from(self.users[2].pk, 3)), [self.user_cycle(2, 0, 1)])
+
+    def test_cycles_match_brute_force(self):
+        rng = random.Random(1)
+        edges = {(rng.randrange(12), rng.randrange(12)) for _ in range(45)}
+        edges = {(u, v) for u, v in edges if u != v}
+        graph = WantsGraph(edges)
+        expected = set()
+        for length in range(3, 6):
+            for nodes in itertools.permutations(range(12), length):
+                if nodes[0] == min(nodes) and all(
+                    (nodes[i], nodes[(i + 1) % length]) in edges for i in range(length)
+                ):
+                    expected.add(nodes)
+        found = list(graph.cycles(5))
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), expected)
+        for user in range(12):
+            self.assertEqual(
+                {cycle for cycle in expected if user in cycle},
+                {
+                    cycle for cycle in expected
+                    if any(cycle[i:] + cycle[:i] == found_cycle
+                           for found_cycle in graph.cycles_from(user, 5) for i in range(len(cycle)))
+                },
+            )
+
+    def test_cycles_view(self):
+        self.client.login(username='cycle1', password='password123')
+        # cycle0 просит у cycle1 не ту вещь, что cycle1 предлагал cycle2.
+        bike = Ad.objects.create(
+            user=self.users[1], title='Велосипед', description='Описание.', category='Разное', condition='Б/У'
+        )
+        ExchangeProposal.objects.create(ad_sender=self.ads[0], ad_receiver=bike)
+        response = self.client.get(reverse('ads:barter_cycles'), {'length': 3})
+        self.assertEqual(len(response.context['cycles']), 1)
+        self.assertContains(response, 'cycle1 получает "Вещь cycle2" от cycle2 и отдает "Велосипед" участнику cycle0')
+        self.assertContains(response, 'cycle0 получает "Велосипед" от cycle1 и отдает "Вещь cycle0" участнику cycle2')
+
+    def test_find_cycles_command(self):
+        out = StringIO()
+        call_command('find_barter_cycles', '--min-length', '2', '--rebuild', stdout=out)
+        self.assertIn('cycle0 -> cycle1 -> cycle2 -> cycle0', out.getvalue())
+        self.assertIn('Найдено цепочек: 3 (длина 2: 1, длина 3: 1, длина 4: 1)', out.getvalue())
+        out = StringIO()
+        call_command('find_barter_cycles', '--user', 'cycle3', '--max-length', '3', stdout=out)
+        self.assertIn('Найдено цепочек: 0', out.getvalue())
+
+
+@override_settings(ADS_TASKS_EAGER=True)
+class SimilarAdsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='similaruser', password='password123')
+        cls.other = User.objects.create_user(username='similarother', password='password123')
+
+        def ad(user, title, description, category):
+            return Ad.objects.create(
+                user=user, title=title, description=description, category=category, condition='Хорошее'
+            )
+
+        cls.guitar = ad(cls.other, 'Акустическая гитара', 'Гитара с чехлом и запасными струнами.', 'Музыка')
+        cls.ukulele = ad(cls.other, 'Укулеле', 'Маленькая гитара, четыре струны, чехол.', 'Музыка')
+        cls.strings = ad(cls.user, 'Струны для гитары', 'Комплект струн для акустической гитары.', 'Музыка')
+        cls.kettle = ad(cls.user, 'Чайник', 'Электрический чайник, почти новый.', 'Техника')
+        cls.drill = ad(cls.other, 'Дрель', 'Ударная дрель с набором сверл.', 'Инструменты')
+
+    def test_similar_ads_ranked_by_shared_terms(self):
+        similar = list(similarity.similar_ads(self.guitar, 2))
+        self.assertEqual(set(similar), {self.strings, self.ukulele})
+        self.assertNotIn(self.guitar, similar)
+        self.assertGreater(similar[0].similarity, similar[-1].similarity)
+
+    def test_document_frequencies_follow_saves_and_deletes(self):
+        def df(text):
+            return SimilarityTerm.objects.filter(text=text).values_list('df', flat=True).first()
+
+        self.assertEqual(df('гитара'), 2)
+        self.assertEqual(df(similarity.DOCUMENTS_TERM), 5)
+        self.ukulele.description = 'Маленький инструмент, четыре струны.'
+        self.ukulele.save()
+        self.assertEqual(df('гитара'), 1)
+        self.kettle.delete()
+        self.assertEqual(df('чайник'), 0)
+        self.assertEqual(df(similarity.DOCUMENTS_TERM), 4)
+        incremental = set(AdTerm.objects.values_list('ad_id', 'term__text', 'weight'))
+        similarity.rebuild()
+        self.assertEqual(incremental, set(AdTerm.objects.values_list('ad_id', 'term__text', 'weight')))
+
+    def test_bulk_created_ads_are_indexed(self):
+        ads = Ad.objects.bulk_create([
+            Ad(user=self.user, title='Электрогитара', description='Гитара и комбоусилитель.',
+               category='Музыка', condition='Б/У'),
+        ])
+        ads_created_in_bulk.send(sender=Ad, ads=ads)
+        self.assertIn(ads[0], similarity.similar_ads(self.guitar, 5))
+
+    def test_proposal_form_suggests_similar_ads(self):
+        self.client.login(username='similaruser', password='password123')
+        response = self.client.get(reverse('ads:exchange_proposal_create', args=[self.guitar.pk]))
+        self.assertEqual(list(response.context['suggested_ads']), [self.strings])
+        self.assertEqual(list(response.context['similar_ads'])[0], self.ukulele)
+        self.assertNotIn(self.guitar, response.context['similar_ads'])
+
+    def test_rebuild_command(self):
+        AdTerm.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_similarity_index', stdout=out)
+        self.assertIn('Индекс перестроен', out.getvalue())
+        self.assertEqual(set(similarity.similar_ads(self.guitar, 2)), {self.strings, self.ukulele})
+
+
+class PerformanceMetricsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='metricsuser', password='password123')
+        Ad.objects.create(
+            user=cls.user, title='Лампа', description='Настольная лампа.', category='Техника', condition='Хорошее'
+        )
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def scrape(self):
+        with self.settings(ADS_METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_route_queries_and_templates(self):
+        self.client.get(reverse('ads:ad_list'))
+        self.client.get(reverse('ads:ad_list'), {'q': 'лампа'})
+        body = self.scrape()
+        self.assertIn('ads_request_duration_seconds_count{route="ads:ad_list"} 2', body)
+        self.assertIn('ads_request_duration_seconds_bucket{route="ads:ad_list",le="+Inf"} 2', body)
+        stats = metrics.registry.routes['ads:ad_list']
+        self.assertGreaterEqual(stats.queries.total, 4)
+        self.assertGreater(stats.sql_time, 0)
+        self.assertGreater(stats.template_time, 0)
+
+    def test_async_view_is_measured(self):
+        self.client.get(reverse('ads:ad_list_async'))
+        self.assertGreater(metrics.registry.routes['ads:ad_list_async'].queries.total, 0)
+
+    def test_unsampled_requests_only_count_duration(self):
+        with self.settings(ADS_METRICS_SAMPLE_RATE=0):
+            self.client.get(reverse('ads:ad_list'))
+        stats = metrics.registry.routes['ads:ad_list']
+        self.assertEqual(stats.duration.count, 1)
+        self.assertEqual(stats.queries.count, 0)
+        self.assertEqual(stats.sql_time, 0)
+
+    def test_unresolved_route(self):
+        self.client.get('/нет-такой-страницы/')
+        self.assertIn(metrics.UNRESOLVED_ROUTE, metrics.registry.routes)
+
+    def test_slow_queries_logged_normalized(self):
+        with self.settings(ADS_SLOW_QUERY_MS=0), self.assertLogs('ads.performance', 'WARNING') as logs:
+            self.client.get(reverse('ads:ad_list'), {'category': 'техника'})
+        self.assertTrue(any("WHERE" in line and "'техника'" not in line for line in logs.output))
+        self.assertGreater(metrics.registry.routes['ads:ad_list'].slow_queries, 0)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            metrics.normalize_sql("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s) AND c > 10.5"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ?',
+        )
+        self.assertEqual(
+            metrics.normalize_sql('INSERT INTO "t2" (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO "t2" (a, b) VALUES (...)',
+        )
+
+    def test_metrics_token(self):
+        with self.settings(ADS_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='metricsstaff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.client.logout()
+        with self.settings(ADS_METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class BenchmarkSuiteTest(TestCase):
+
+    def test_seed_barter_creates_consistent_data(self):
+        out = StringIO()
+        call_command('seed_barter', '--users', '10', '--ads', '60', '--proposals', '80', '--prefix', 'seed', stdout=out)
+        self.assertIn('объявлений 60', out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 10)
+        self.assertEqual(Ad.objects.filter(category_ref__isnull=True).count(), 0)
+        self.assertEqual(Ad.objects.filter(search_entry__isnull=True).count(), 0)
+        proposals = ExchangeProposal.objects.select_related('ad_sender', 'ad_receiver')
+        self.assertEqual(proposals.count(), 80)
+        self.assertFalse(any(p.ad_sender.user_id == p.ad_receiver.user_id for p in proposals))
+        # Счетчики справочника и граф желаний ведутся сигналами, как для импорта.
+        for category in Category.objects.all():
+            self.assertEqual(category.ad_count, category.ads.count())
+        edges = sorted(WantEdge.objects.values_list('from_user', 'to_user', 'proposal_count'))
+        rebuild_edges()
+        self.assertEqual(edges, sorted(WantEdge.objects.values_list('from_user', 'to_user', 'proposal_count')))
+
+    def test_seed_users_returns_only_new_users(self):
+        existing = User.objects.create_user(username='benchmark', password='password123')
+        user_ids = seed_users(3)
+        self.assertEqual(len(user_ids), 3)
+        self.assertNotIn(existing.pk, user_ids)
+        self.assertEqual(
+            list(User.objects.filter(pk__in=user_ids).order_by('pk').values_list('username', flat=True)),
+            ['bench0', 'bench1', 'bench2'],
+        )
+
+    # Без задержки журнал изменений выдает одно и то же в обоих прогонах.
+    @override_settings(ADS_CHANGELOG_SETTLE=0)
+    def test_bench_routes_covers_every_route_and_compares_baseline(self):
+        call_command('seed_barter', '--users', '5', '--ads', '30', '--proposals', '60', stdout=StringIO())
+
+        def bench(*args):
+            # POST-маршруты меняют данные; оба прогона должны видеть одни и те же.
+            cache.clear()
+            out = StringIO()
+            with transaction.atomic():
+                call_command('bench_routes', '--current-db', '--repeat', '2', *args, stdout=out)
+                transaction.set_rollback(True)
+            return out.getvalue()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            bench('--save-baseline', path)
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+            self.assertEqual(set(baseline), {pattern.name for pattern in ads_urls.urlpatterns})
+            out = bench('--compare', path, '--tolerance', '1000', '--fail-on-regression')
+        self.assertNotIn('РЕГРЕССИЯ', out)
+
+    def test_find_regressions(self):
+        baseline = {'a': {'p95': 10.0, 'queries': 3}, 'b': {'p95': 10.0, 'queries': 3}}
+        results = {
+            'a': {'p95': 12.0, 'queries': 3},
+            'b': {'p95': 13.0, 'queries': 4},
+            'new': {'p95': 100.0, 'queries': 50},
+        }
+        self.assertEqual(
+            [route for route, _ in find_regressions(baseline, results, tolerance=0.25)], ['b', 'b']
+        )
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """Основная база — тестовая default, реплика — снимок в отдельном файле."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.replica_path = os.path.join(directory, 'replica.sqlite3')
+        cls.replica = cls.enterClassContext(sqlite_alias('replica', cls.replica_path))
+        super().setUpClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='replicauser', password='password123')
+        Ad.objects.create(
+            user=self.user, title='Старое объявление', description='Есть на реплике.',
+            category='Книги', condition='Хорошее',
+        )
+        copy_database(self.replica_path)
+        # Появилось после снимка: реплика "отстает".
+        Ad.objects.create(
+            user=self.user, title='Свежее объявление', description='Только в основной базе.',
+            category='Книги', condition='Хорошее',
+        )
+        self.enterContext(override_settings(ADS_READ_DATABASE='replica', ADS_LIST_CACHE_TIMEOUT=0))
+
+    def test_list_reads_from_replica(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, 'Старое объявление')
+        self.assertNotContains(response, 'Свежее объявление')
+        self.assertEqual(Ad.objects.using('replica').count(), 1)
+        # Сессии на реплике еще нет: она читается из default.
+        self.assertContains(response, reverse('ads:feed'))
+        # ETag построен на поколении основной базы и не должен закреплять версию с реплики.
+        self.assertNotIn('ETag', response)
+
+    def test_anonymous_page_cache_fills_from_primary(self):
+        with override_settings(ADS_LIST_CACHE_TIMEOUT=60):
+            for name in ('ads:ad_list', 'ads:ad_list_async'):
+                response = self.client.get(reverse(name))
+                self.assertContains(response, 'Свежее объявление')
+
+    def test_inbox_counters_cached_from_primary(self):
+        other = User.objects.create_user(username='replicaother', password='password123')
+        ad = Ad.objects.create(
+            user=other, title='Чужое', description='-', category='Книги', condition='Хорошее',
+        )
+        ExchangeProposal.objects.create(ad_sender=ad, ad_receiver=Ad.objects.get(title='Свежее объявление'))
+        ads_cache.get_cache().clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('ads:ad_list'))
+        self.assertEqual(inbox.get_counters(self.user)['pending_received'], 1)
+
+    def test_post_sticks_reads_to_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('ads:ad_create'), {
+            'title': 'Мое новое', 'description': 'Создано в тесте.',
+            'category': 'Книги', 'condition': 'Новое',
+        })
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertTrue(Ad.objects.filter(title='Мое новое').exists())
+        self.assertFalse(Ad.objects.using('replica').filter(title='Мое новое').exists())
+        response = self.client.get(reverse('ads:ad_list'))
+        self.assertContains(response, 'Свежее объявление')
+        self.assertContains(response, 'Мое новое')
+
+    def test_without_replica_everything_uses_default(self):
+        with override_settings(ADS_READ_DATABASE=None):
+            response = self.client.get(reverse('ads:ad_list'))
+            self.assertContains(response, 'Свежее объявление')
+            self.client.force_login(self.user)
+            response = self.client.post(reverse('ads:ad_create'), {
+                'title': 'Без реплики', 'description': '-', 'category': 'Книги', 'condition': 'Новое',
+            })
+            self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_instances_read_from_replica_are_saved_to_primary(self):
+        ad = Ad.objects.using('replica').get(title='Старое объявление')
+        ad.title = 'Исправленное'
+        ad.save()
+        self.assertTrue(Ad.objects.filter(title='Исправленное').exists())
+        self.assertFalse(Ad.objects.using('replica').filter(title='Исправленное').exists())
+
+    def test_sqlite_pragmas_applied_to_primary_only(self):
+        # Тестовая default в памяти: journal_mode там всегда memory.
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], settings.ADS_SQLITE_PRAGMAS['cache_size'])
+        with self.replica.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 2)
+            cursor.execute('PRAGMA cache_size')
+            self.assertNotEqual(cursor.fetchone()[0], settings.ADS_SQLITE_PRAGMAS['cache_size'])
+
+    def test_replica_does_not_take_write_lock(self):
+        self.assertEqual(settings.DATABASES['default']['OPTIONS'], {'transaction_mode': 'IMMEDIATE'})
+        self.assertNotIn('transaction_mode', settings.DATABASES['replica']['OPTIONS'])
+
+
+class InboxCounterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'inbox{i}', password='password123') for i in range(3)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Вещь {user.username}', description='Описание.',
+                category='Разное', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        cls.proposals = [
+            ExchangeProposal.objects.create(ad_sender=cls.ads[i], ad_receiver=cls.ads[j])
+            for i, j in [(0, 1), (2, 1), (1, 0)]
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def counters(self):
+        return {
+            counter.user_id: (counter.pending_received, counter.pending_sent, counter.unseen)
+            for counter in InboxCounter.objects.all()
+        }
+
+    def assertCountersMatchRebuild(self):
+        incremental = {user_id: values[:2] for user_id, values in self.counters().items() if any(values)}
+        inbox.rebuild()
+        self.assertEqual(incremental, {user_id: values[:2] for user_id, values in self.counters().items()})
+
+    def test_counters_follow_proposal_lifecycle(self):
+        user0, user1, user2 = (user.pk for user in self.users)
+        self.assertEqual(self.counters(), {user0: (1, 1, 1), user1: (2, 1, 2), user2: (0, 1, 0)})
+        transition_proposal(self.users[1], self.proposals[1].pk, 'rejected')
+        self.assertEqual(self.counters()[user1], (1, 1, 1))
+        self.assertEqual(self.counters()[user2], (0, 0, 0))
+
+        ExchangeProposal.objects.bulk_create([ExchangeProposal(ad_sender=self.ads[2], ad_receiver=self.ads[0])])
+        proposals_created_in_bulk.send(
+            sender=ExchangeProposal, proposals=list(ExchangeProposal.objects.filter(ad_sender=self.ads[2], status='pending'))
+        )
+        self.assertEqual(self.counters()[user0], (2, 1, 2))
+        self.ads[2].delete()
+        self.assertEqual(self.counters()[user0], (1, 1, 1))
+        self.assertCountersMatchRebuild()
+
+    def test_accept_resolves_competitors(self):
+        accept_proposal(self.users[1], self.proposals[0].pk)
+        # Принято 0 -> 1, отклонены конкурирующие 2 -> 1 и 1 -> 0.
+        self.assertFalse(any(values[:2] != (0, 0) for values in self.counters().values()))
+        self.assertTrue(all(values[2] == 0 for values in self.counters().values()))
+
+    def test_list_marks_seen_and_badge_is_cached(self):
+        self.client.force_login(self.users[1])
+        url = reverse('ads:inbox_counter')
+        self.assertEqual(self.client.get(url).json(), {'pending_received': 2, 'pending_sent': 1, 'unseen': 2})
+        self.assertContains(self.client.get(reverse('ads:ad_list')), 'новых: 2')
+        # Сессия, пользователь; счетчик уже в кэше.
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        self.client.get(reverse('ads:exchange_proposal_list'))
+        self.assertEqual(self.client.get(url).json()['unseen'], 0)
+        self.assertNotContains(self.client.get(reverse('ads:ad_list')), 'новых:')
+
+        # Новое предложение сбрасывает кэш значка.
+        ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1])
+        self.assertEqual(self.client.get(url).json(), {'pending_received': 3, 'pending_sent': 1, 'unseen': 1})
+
+    def test_rebuild_command(self):
+        InboxCounter.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_inbox_counters', stdout=out)
+        self.assertIn('пользователей 3', out.getvalue())
+        self.assertEqual(self.counters()[self.users[1].pk], (2, 1, 0))
+
+
+class ConditionalListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'etag{i}', password='password123') for i in range(3)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Вещь {user.username}', description='Описание.',
+                category='Разное', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        cls.proposal = ExchangeProposal.objects.create(ad_sender=cls.ads[0], ad_receiver=cls.ads[1])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.users[1])
+
+    def etag(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertNotModified(self, url, etag, **params):
+        response = self.client.get(url, params, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_ad_list_not_modified_without_main_query(self):
+        url = reverse('ads:ad_list')
+        etag = self.etag(url, category='разное')
+        # Сессия и пользователь; поколение и счетчики в кэше.
+        with self.assertNumQueries(2):
+            self.assertNotModified(url, etag, category='разное')
+        self.assertNotEqual(self.etag(url), etag)
+
+        self.client.logout()
+        self.assertNotEqual(self.etag(url, category='разное'), etag)
+
+    def test_ad_writes_change_list_etag(self):
+        url = reverse('ads:ad_list')
+        etag = self.etag(url)
+        self.ads[2].title = 'Новое название'
+        self.ads[2].save()
+        edited = self.etag(url)
+        self.assertNotEqual(edited, etag)
+        self.assertNotModified(url, edited)
+        self.ads[2].delete()
+        self.assertNotEqual(self.etag(url), edited)
+
+    def test_new_proposal_changes_ad_list_etag(self):
+        url = reverse('ads:ad_list')
+        etag = self.etag(url)
+        # Значок непросмотренных предложений — часть страницы.
+        ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1])
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_proposal_list_not_modified_with_one_query(self):
+        url = reverse('ads:exchange_proposal_list')
+        etag = self.etag(url)
+        # Сессия, пользователь и сводка предложений.
+        with self.assertNumQueries(3):
+            self.assertNotModified(url, etag)
+        self.assertNotEqual(self.etag(url, received_cursor='abc'), etag)
+
+    def test_async_lists_not_modified(self):
+        for name in ('ads:ad_list_async', 'ads:exchange_proposal_list_async'):
+            with self.subTest(name=name):
+                url = reverse(name)
+                etag = self.etag(url)
+                self.assertEqual(etag, self.etag(reverse(name.removesuffix('_async'))))
+                self.assertNotModified(url, etag)
+                ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1])
+                self.assertNotEqual(self.etag(url), etag)
+
+    def test_proposal_writes_change_proposal_list_etag(self):
+        url = reverse('ads:exchange_proposal_list')
+        etags = [self.etag(url)]
+        ExchangeProposal.objects.create(ad_sender=self.ads[2], ad_receiver=self.ads[1])
+        etags.append(self.etag(url))
+        self.ads[0].title = 'Переименовано'
+        self.ads[0].save()
+        etags.append(self.etag(url))
+        transition_proposal(self.users[1], self.proposal.pk, 'rejected')
+        etags.append(self.etag(url))
+        self.ads[2].delete()
+        etags.append(self.etag(url))
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_rotated_csrf_token_changes_etag(self):
+        for url in (reverse('ads:ad_list'), reverse('ads:exchange_proposal_list')):
+            with self.subTest(url=url):
+                self.etag(url, q='вещь')
+                etag = self.etag(url, q='вещь')
+                self.assertNotModified(url, etag, q='вещь')
+                # Вход заново выдает новый секрет CSRF; страница со старым токеном устарела.
+                self.client.logout()
+                self.client.force_login(self.users[1])
+                self.client.cookies[settings.CSRF_COOKIE_NAME] = get_random_string(32)
+                response = self.client.get(url, {'q': 'вещь'}, headers={'if-none-match': etag})
+                self.assertEqual(response.status_code, 200)
+
+    def test_pending_messages_skip_validation(self):
+        url = reverse('ads:exchange_proposal_list')
+        transition_proposal(self.users[1], self.proposal.pk, 'rejected')
+        etag = self.etag(url)
+        self.client.post(reverse('ads:exchange_proposal_update_status', args=[self.proposal.pk, 'accepted']))
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertContains(response, 'уже обработано')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class AdAutocompleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='powerseller', password='password123')
+        cls.buyer = User.objects.create_user(username='buyer', password='password123')
+        cls.seller_ads = [
+            Ad.objects.create(
+                user=cls.seller, title=f'Лот {i}', description='Описание.', category='Разное', condition='Б/У'
+            )
+            for i in range(45)
+        ]
+        cls.buyer_ad = Ad.objects.create(
+            user=cls.buyer, title='Лот покупателя', description='Описание.', category='Разное', condition='Б/У'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.seller)
+
+    def test_pages_cover_only_own_offerable_ads(self):
+        Ad.objects.filter(pk=self.seller_ads[0].pk).update(exchanged_at=timezone.now())
+        url = reverse('ads:ad_autocomplete')
+        seen, cursor = [], None
+        while True:
+            data = self.client.get(url, {'cursor': cursor} if cursor else {}).json()
+            self.assertLessEqual(len(data['results']), 20)
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, [ad.pk for ad in reversed(self.seller_ads[1:])])
+
+    def test_search_by_title(self):
+        data = self.client.get(reverse('ads:ad_autocomplete'), {'q': '  лот 4 '}).json()
+        self.assertEqual(
+            {row['title'] for row in data['results']}, {'Лот 4', 'Лот 40', 'Лот 41', 'Лот 42', 'Лот 43', 'Лот 44'}
+        )
+        self.client.force_login(self.buyer)
+        data = self.client.get(reverse('ads:ad_autocomplete'), {'q': 'лот'}).json()
+        self.assertEqual([row['id'] for row in data['results']], [self.buyer_ad.pk])
+
+    def test_form_renders_first_page_and_selected_ad(self):
+        oldest = self.seller_ads[0]
+        form = ExchangeProposalForm(data={'ad_sender': oldest.pk}, user=self.seller)
+        html = str(form['ad_sender'])
+        # Пустой вариант, первая страница и выбранное объявление не с нее.
+        self.assertEqual(html.count('<option'), 22)
+        self.assertIn(f'<option value="{oldest.pk}" selected>', html)
+        self.assertIn(f'data-autocomplete-url="{reverse("ads:ad_autocomplete")}"', html)
+
+        response = self.client.post(
+            reverse('ads:exchange_proposal_create', args=[self.buyer_ad.pk]), {'ad_sender': oldest.pk}
+        )
+        self.assertRedirects(response, reverse('ads:ad_list'))
+        self.assertTrue(ExchangeProposal.objects.filter(ad_sender=oldest, ad_receiver=self.buyer_ad).exists())
+
+    def test_create_view_without_offerable_ads_redirects(self):
+        self.client.force_login(self.buyer)
+        Ad.objects.filter(pk=self.buyer_ad.pk).update(exchanged_at=timezone.now())
+        response = self.client.get(reverse('ads:exchange_proposal_create', args=[self.seller_ads[0].pk]))
+        self.assertRedirects(response, reverse('ads:ad_create'))
+
+
+class SoftDeleteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'soft{i}', password='password123') for i in range(3)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Велосипед {user.username}', description='Горный велосипед.',
+                category='Спорт', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        cls.popular = cls.ads[0]
+        cls.proposals = [
+            ExchangeProposal.objects.create(ad_sender=cls.ads[1], ad_receiver=cls.popular),
+            ExchangeProposal.objects.create(ad_sender=cls.ads[2], ad_receiver=cls.popular, status='rejected'),
+            ExchangeProposal.objects.create(ad_sender=cls.popular, ad_receiver=cls.ads[2]),
+            ExchangeProposal.objects.create(ad_sender=cls.ads[1], ad_receiver=cls.ads[2]),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.users[0])
+
+    def delete_popular(self):
+        response = self.client.post(reverse('ads:ad_delete', args=[self.popular.pk]))
+        self.assertRedirects(response, reverse('ads:ad_list'))
+
+    def test_delete_marks_ad_and_resolves_proposals(self):
+        self.delete_popular()
+        self.assertFalse(Ad.objects.filter(pk=self.popular.pk).exists())
+        self.assertIsNotNone(Ad.all_objects.get(pk=self.popular.pk).deleted_at)
+        self.assertEqual(
+            list(ExchangeProposal.objects.filter(status='pending').values_list('pk', flat=True)),
+            [self.proposals[3].pk],
+        )
+        self.assertEqual(Category.objects.get(key='спорт').ad_count, 2)
+        self.assertNotContains(self.client.get(reverse('ads:ad_list'), {'q': 'велосипед'}), 'soft0')
+        self.assertFalse(AdTerm.objects.filter(ad_id=self.popular.pk).exists())
+        edges = sorted(WantEdge.objects.values_list('from_user', 'to_user', 'proposal_count'))
+        rebuild_edges()
+        self.assertEqual(edges, sorted(WantEdge.objects.values_list('from_user', 'to_user', 'proposal_count')))
+
+        # Повторное удаление, правка и предложения на удаленное объявление недоступны.
+        self.assertEqual(self.client.post(reverse('ads:ad_delete', args=[self.popular.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('ads:ad_update', args=[self.popular.pk])).status_code, 404)
+        self.client.force_login(self.users[1])
+        response = self.client.get(reverse('ads:exchange_proposal_create', args=[self.popular.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('ads:exchange_proposal_list'))
+        self.assertEqual(len(response.context['sent_proposals']), 1)
+
+    @override_settings(ADS_TASKS_EAGER=True)
+    def test_delete_queries_do_not_depend_on_proposals(self):
+        self.popular.save()
+        ExchangeProposal.objects.bulk_create([
+            ExchangeProposal(ad_sender=self.ads[1], ad_receiver=self.popular) for _ in range(50)
+        ])
+        url = reverse('ads:ad_delete', args=[self.popular.pk])
+        with assert_max_queries(resolve(url).func.query_budget):
+            self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertFalse(ExchangeProposal.objects.filter(status='pending', ad_receiver=self.popular).exists())
+
+    def test_purge_removes_old_marks_in_batches(self):
+        self.delete_popular()
+        out = StringIO()
+        call_command('purge_deleted_ads', '--older-than', '3600', '--pause', '0', stdout=out)
+        self.assertIn('ничего', out.getvalue())
+        self.assertTrue(Ad.all_objects.filter(pk=self.popular.pk).exists())
+
+        out = StringIO()
+        call_command('purge_deleted_ads', '--older-than', '0', '--batch-size', '2', '--pause', '0', stdout=out)
+        self.assertFalse(Ad.all_objects.filter(pk=self.popular.pk).exists())
+        self.assertEqual(ExchangeProposal.objects.count(), 1)
+        # По два за DELETE: отправленное, полученные (2 и пустой), термины похожих, лента и объявление.
+        self.assertIn('exchangeproposal 3', out.getvalue())
+        self.assertIn('операторов DELETE: 6', out.getvalue())
+        self.assertEqual(Category.objects.get(key='спорт').ad_count, 2)
+
+    def test_hard_delete_of_marked_ad_keeps_counts(self):
+        self.delete_popular()
+        Ad.all_objects.get(pk=self.popular.pk).delete()
+        self.assertEqual(Category.objects.get(key='спорт').ad_count, 2)
+
+
+class ArchiveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'archive{i}', password='password123') for i in range(3)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Лодка {user.username}', description='Надувная лодка.',
+                category='Спорт', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        cls.accepted = ExchangeProposal.objects.create(ad_sender=cls.ads[1], ad_receiver=cls.ads[0])
+        cls.competitor = ExchangeProposal.objects.create(ad_sender=cls.ads[2], ad_receiver=cls.ads[0])
+        accept_proposal(cls.users[0], cls.accepted.pk)
+        cls.pending = ExchangeProposal.objects.create(ad_sender=cls.ads[2], ad_receiver=cls.ads[1])
+        # Обмен ads[0] и ads[1] был год назад; ads[1] еще ждет решения по pending.
+        old = timezone.now() - timezone.timedelta(days=365)
+        Ad.objects.filter(exchanged_at__isnull=False).update(exchanged_at=old, updated_at=old)
+        ExchangeProposal.objects.exclude(status='pending').update(updated_at=old)
+
+    def setUp(self):
+        cache.clear()
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_barter', '--older-than', str(30 * 24 * 3600), '--pause', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_resolved_proposals_and_idle_exchanged_ads(self):
+        out = self.archive('--chunk-size', '1')
+        self.assertIn('предложений 2, объявлений 1', out)
+        self.assertEqual(list(ExchangeProposal.objects.values_list('pk', flat=True)), [self.pending.pk])
+        self.assertEqual(
+            sorted(ArchivedProposal.objects.values_list('pk', 'status', 'sender_user', 'receiver_title')),
+            [
+                (self.accepted.pk, 'accepted', self.users[1].pk, 'Лодка archive0'),
+                (self.competitor.pk, 'rejected', self.users[2].pk, 'Лодка archive0'),
+            ],
+        )
+        # ads[1] не переносится, пока по нему есть ожидающее предложение.
+        self.assertEqual(list(ArchivedAd.objects.values_list('pk', flat=True)), [self.ads[0].pk])
+        self.assertFalse(Ad.all_objects.filter(pk=self.ads[0].pk).exists())
+        self.assertEqual(Category.objects.get(key='спорт').ad_count, 2)
+        self.assertNotContains(self.client.get(reverse('ads:ad_list'), {'q': 'лодка'}), 'archive0')
+        self.assertIn('предложений 0, объявлений 0', self.archive())
+
+    def test_recent_rows_stay_hot(self):
+        ExchangeProposal.objects.update(updated_at=timezone.now())
+        Ad.objects.update(exchanged_at=timezone.now())
+        self.assertIn('предложений 0, объявлений 0', self.archive())
+
+    def test_archive_is_shown_on_demand(self):
+        self.archive()
+        self.client.force_login(self.users[2])
+        url = reverse('ads:exchange_proposal_list')
+        response = self.client.get(url)
+        self.assertNotIn('archived_sent', response.context)
+        self.assertContains(response, '?archived=1')
+        etag = response['ETag']
+
+        response = self.client.get(url, {'archived': '1'})
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([proposal.pk for proposal in response.context['archived_sent']], [self.competitor.pk])
+        self.assertEqual(len(response.context['archived_received']), 0)
+        self.assertContains(response, 'Отклонена')
+
+
+@override_settings(ADS_TASKS_EAGER=True)
+class SavedSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='searcher', password='password123')
+        cls.seller = User.objects.create_user(username='seller', password='password123')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def save(self, **filters):
+        return saved_searches.save_search(self.owner, filters)[0]
+
+    def create_ad(self, title, category='Спорт', condition='Новое', user=None):
+        return Ad.objects.create(
+            user=user or self.seller, title=title, description='Почти не использовалась.',
+            category=category, condition=condition,
+        )
+
+    def feed(self):
+        return [(item.ad.title, item.saved_search_id) for item in saved_searches.feed_items(self.owner)]
+
+    def test_anchor_is_longest_word_or_catalogue_key(self):
+        self.assertEqual(saved_searches.search_anchor('красная лодка', '', ''), 'красная')
+        self.assertEqual(saved_searches.search_anchor('', 'спорт', 'новое'), 'category:спорт')
+        self.assertEqual(saved_searches.search_anchor('', '', 'новое'), 'condition:новое')
+        self.assertIsNone(saved_searches.search_anchor('', '', ''))
+
+    def test_new_ads_match_like_list_search(self):
+        boats = self.save(q='лод крас')
+        sport = self.save(category='спорт', condition='б/у')
+        self.create_ad('Красная лодка')
+        self.create_ad('Синяя лодка')
+        self.create_ad('Красный мяч', condition='Б/У')
+        self.create_ad('Красная лодка автора', user=self.owner)
+        self.assertEqual(self.feed(), [('Красный мяч', sport.pk), ('Красная лодка', boats.pk)])
+        for title, _ in self.feed():
+            response = self.client.get(reverse('ads:ad_list'), {'q': 'лод крас'})
+            self.assertEqual(title in [ad.title for ad in response.context['page_obj']], title == 'Красная лодка')
+
+    def test_one_feed_item_per_ad(self):
+        self.save(q='лодка')
+        self.save(category='спорт')
+        ad = self.create_ad('Лодка')
+        self.assertEqual(FeedItem.objects.filter(user=self.owner, ad=ad).count(), 1)
+
+    def test_candidates_come_from_index(self):
+        self.save(q='лодка')
+        SavedSearch.objects.bulk_create([
+            SavedSearch(user=self.seller, query=f'слово{i}', anchor=f'слово{i}') for i in range(200)
+        ])
+        ad = self.create_ad('Лодка')
+        terms = saved_searches.ad_terms(ad)
+        found = saved_searches.candidates(saved_searches.ad_anchors(terms))
+        self.assertEqual(list(found), ['лодка'])
+        with CaptureQueriesContext(connection) as captured:
+            saved_searches.match_ads([ad])
+        self.assertEqual(len(captured), 2)
+
+    def test_bulk_created_ads_are_matched(self):
+        self.save(q='лодка')
+        ads = Ad.objects.bulk_create([
+            Ad(user=self.seller, title=f'Лодка {i}', description='.', category='Спорт', condition='Новое')
+            for i in range(3)
+        ])
+        ads_created_in_bulk.send(sender=Ad, ads=ads)
+        self.assertEqual(len(self.feed()), 3)
+
+    def test_deleted_ads_leave_feed(self):
+        self.save(q='лодка')
+        ad = self.create_ad('Лодка')
+        self.client.force_login(self.seller)
+        self.client.post(reverse('ads:ad_delete', kwargs={'pk': ad.pk}))
+        self.assertEqual(self.feed(), [])
+
+    def test_save_and_delete_views(self):
+        response = self.client.post(reverse('ads:saved_search_create'), {'q': '  Лодка ', 'category': 'Спорт'})
+        self.assertRedirects(response, reverse('ads:feed'))
+        search = SavedSearch.objects.get(user=self.owner)
+        self.assertEqual((search.query, search.category, search.anchor), ('Лодка', 'спорт', 'лодка'))
+        self.client.post(reverse('ads:saved_search_create'), {'q': 'Лодка', 'category': 'спорт'})
+        self.assertEqual(SavedSearch.objects.filter(user=self.owner).count(), 1)
+
+        response = self.client.post(reverse('ads:saved_search_create'), {'cursor': 'x'}, follow=True)
+        self.assertContains(response, 'Укажите запрос')
+        self.assertEqual(SavedSearch.objects.filter(user=self.owner).count(), 1)
+
+        self.create_ad('Лодка')
+        response = self.client.get(reverse('ads:feed'))
+        self.assertContains(response, 'Лодка / спорт')
+        self.assertContains(response, 'По поиску')
+        self.client.post(reverse('ads:saved_search_delete', kwargs={'pk': search.pk}))
+        self.assertFalse(FeedItem.objects.exists())
+
+    def test_saved_search_limit(self):
+        for i in range(saved_searches.MAX_SAVED_SEARCHES):
+            self.save(q=f'слово{i}')
+        with self.assertRaises(ValueError):
+            self.save(q='лишнее')
+
+
+@override_settings(ADS_CHANGELOG_SETTLE=0, ADS_CHANGELOG_TOKEN='secret')
+class ChangeLogTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='changestaff', password='password123', is_staff=True)
+        cls.users = [
+            User.objects.create_user(username=f'changes{i}', password='password123') for i in range(2)
+        ]
+        cls.ads = [
+            Ad.objects.create(
+                user=user, title=f'Велосипед {user.username}', description='Горный велосипед.',
+                category='Спорт', condition='Б/У'
+            )
+            for user in cls.users
+        ]
+        cls.proposal = ExchangeProposal.objects.create(ad_sender=cls.ads[1], ad_receiver=cls.ads[0])
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def fetch(self, **params):
+        response = self.client.get(reverse('ads:changes'), params)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return lines, response
+
+    def log(self):
+        return list(ChangeLogEntry.objects.order_by('id').values_list('model', 'object_id', 'action'))
+
+    def test_saves_status_changes_and_deletes_are_logged(self):
+        ChangeLogEntry.objects.all().delete()
+        accept_proposal(self.users[0], self.proposal.pk)
+        self.assertEqual(self.log(), [
+            ('ad', self.ads[1].pk, 'upsert'),
+            ('ad', self.ads[0].pk, 'upsert'),
+            ('exchangeproposal', self.proposal.pk, 'upsert'),
+        ])
+        ChangeLogEntry.objects.all().delete()
+        soft_delete_ad(self.users[1], self.ads[1])
+        self.assertEqual(self.log(), [
+            ('ad', self.ads[1].pk, 'delete'),
+            ('exchangeproposal', self.proposal.pk, 'delete'),
+        ])
+
+    def test_feed_pages_by_cursor_with_current_state(self):
+        lines, response = self.fetch()
+        self.assertEqual(
+            [(line['model'], line['id'], line['action']) for line in lines],
+            [('ad', self.ads[0].pk, 'upsert'), ('ad', self.ads[1].pk, 'upsert'),
+             ('exchangeproposal', self.proposal.pk, 'upsert')],
+        )
+        self.assertEqual(lines[2]['data']['status'], 'pending')
+        self.assertEqual(response['X-Has-More'], '0')
+        cursor = response['X-Next-Cursor']
+
+        accept_proposal(self.users[0], self.proposal.pk)
+        Ad.objects.get(pk=self.ads[0].pk).delete()
+        lines, response = self.fetch(cursor=cursor, limit=2)
+        self.assertEqual(response['X-Has-More'], '1')
+        # Текущее состояние: объявление уже удалено, поэтому и его upsert выдается как удаление.
+        self.assertEqual([(line['id'], line['action']) for line in lines], [
+            (self.ads[1].pk, 'upsert'), (self.ads[0].pk, 'delete'),
+        ])
+        self.assertIsNotNone(lines[0]['data']['exchanged_at'])
+        self.assertIsNone(lines[1]['data'])
+        lines, response = self.fetch(cursor=response['X-Next-Cursor'])
+        self.assertEqual([(line['model'], line['action']) for line in lines], [
+            ('exchangeproposal', 'delete'), ('exchangeproposal', 'delete'), ('ad', 'delete'),
+        ])
+        self.assertEqual(self.fetch(cursor=response['X-Next-Cursor'])[0], [])
+
+    def test_access_and_cursor_errors(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('ads:changes')).status_code, 403)
+        response = self.client.get(reverse('ads:changes'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('ads:changes'), {'cursor': 'x'}, headers={
+            'Authorization': 'Bearer secret'
+        }).status_code, 400)
+        expired = changelog.make_cursor((1, timezone.now() - timezone.timedelta(days=365)))
+        self.assertEqual(self.client.get(reverse('ads:changes'), {'cursor': expired}, headers={
+            'Authorization': 'Bearer secret'
+        }).status_code, 410)
+
+    @override_settings(ADS_CHANGELOG_SETTLE=60)
+    def test_fresh_entries_wait_for_settle(self):
+        self.assertEqual(self.fetch()[0], [])
+
+    def test_entry_committed_after_settle_lands_behind_cursor(self):
+        # Предел, описанный в entries_since: created_at ставится при записи, а не при коммите.
+        entries = changelog.entries_since(None)
+        position = (entries[-1][1], entries[-1][0])
+        late = ChangeLogEntry.objects.create(
+            model='ad', object_id=self.ads[0].pk, action='upsert',
+            created_at=position[0] - timezone.timedelta(seconds=1),
+        )
+        self.assertNotIn(late.pk, [entry[0] for entry in changelog.entries_since(position)])
+        self.assertIn(late.pk, [entry[0] for entry in changelog.entries_since(None)])
+
+    def test_export_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_changes', '--batch-size', '2', stdout=out, stderr=err)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        self.assertIn('Изменений: 3, страниц: 2', err.getvalue())
+        cursor = err.getvalue().split('Следующий курсор: ')[1].strip()
+        Ad.objects.filter(pk=self.ads[0].pk).first().save()
+        out = StringIO()
+        call_command('export_changes', '--cursor', cursor, stdout=out, stderr=StringIO())
+        self.assertEqual(json.loads(out.getvalue())['id'], self.ads[0].pk)
+
+    def test_compaction_keeps_latest_entry_per_object(self):
+        for _ in range(3):
+            Ad.objects.get(pk=self.ads[0].pk).save()
+        Ad.objects.get(pk=self.ads[1].pk).delete()
+        ChangeLogEntry.objects.update(created_at=timezone.now() - timezone.timedelta(days=10))
+        out = StringIO()
+        call_command('compact_changelog', '--pause', '0', '--batch-size', '2', stdout=out)
+        self.assertIn('перекрытых 5, удалений 0', out.getvalue())
+        self.assertEqual(self.log(), [
+            ('ad', self.ads[0].pk, 'upsert'),
+            ('exchangeproposal', self.proposal.pk, 'delete'),
+            ('ad', self.ads[1].pk, 'delete'),
+        ])
+        call_command('compact_changelog', '--pause', '0', '--tombstones-older-than', '0', stdout=out)
+        self.assertEqual(self.log(), [('ad', self.ads[0].pk, 'upsert')])
+
+
+task_calls = []
+
+
+@queue.task(name='ads.tests.record_call')
+def record_call(value, fail_times=0):
+    task_calls.append(value)
+    if task_calls.count(value) <= fail_times:
+        raise RuntimeError(f'сбой {value}')
+
+
+class TaskQueueTest(TestCase):
+
+    def setUp(self):
+        task_calls.clear()
+
+    def test_claim_skips_locked_rows_where_supported(self):
+        queue.enqueue('ads.tests.record_call', {'value': 1})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(queue.claim(5)), 1)
+        self.assertNotIn('SKIP LOCKED', queries.captured_queries[-1]['sql'])
+        # SQLite такой синтаксис не знает: проверяется только текст запроса.
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True), \
+                CaptureQueriesContext(connection) as queries, self.assertRaises(OperationalError), \
+                transaction.atomic():
+            queue.claim(5)
+        self.assertTrue(any('LIMIT 5 FOR UPDATE SKIP LOCKED)' in query['sql'] for query in queries.captured_queries))
+
+    def test_delay_enqueues_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_call.delay(value='a')
+            self.assertFalse(Task.objects.exists())
+        for callback in callbacks:
+            callback()
+        task = Task.objects.get()
+        self.assertEqual((task.name, task.kwargs, task.status), ('ads.tests.record_call', {'value': 'a'}, 'queued'))
+        self.assertEqual(task_calls, [])
+
+    @override_settings(ADS_TASKS_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        record_call.delay(value='b')
+        self.assertEqual(task_calls, ['b'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_duplicate_name_rejected(self):
+        with self.assertRaises(ValueError):
+            queue.task(name='ads.tests.record_call')(lambda: None)
+
+    @override_settings(ADS_TASKS_RETRY_DELAY=10, ADS_TASKS_MAX_RETRY_DELAY=30)
+    def test_failures_retry_with_backoff_then_fail(self):
+        task = queue.enqueue('ads.tests.record_call', {'value': 'c', 'fail_times': 5}, max_attempts=3)
+        delays = []
+        logs = self.enterContext(self.assertLogs('ads.tasks', 'WARNING'))
+        for attempt in range(1, 4):
+            [(pk, name, kwargs, attempts, max_attempts)] = queue.claim(10)
+            self.assertEqual(attempts, attempt)
+            self.assertEqual(queue.claim(10), [], 'Выполняемая задача не должна забираться повторно.')
+            started = timezone.now()
+            queue.fail(pk, attempts, max_attempts, queue.execute(name, kwargs))
+            task.refresh_from_db()
+            if task.status == 'queued':
+                delays.append(round((task.run_after - started).total_seconds()))
+                Task.objects.filter(pk=pk).update(run_after=timezone.now())
+        self.assertEqual(delays, [10, 20])
+        self.assertEqual(task.status, 'failed')
+        self.assertIn('RuntimeError: сбой c', task.last_error)
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'WARNING', 'ERROR'])
+
+    @override_settings(ADS_TASKS_LEASE=60)
+    def test_abandoned_running_task_is_reclaimed(self):
+        task = queue.enqueue('ads.tests.record_call', {'value': 'd'})
+        queue.claim(1)
+        self.assertEqual(queue.claim(1), [])
+        Task.objects.filter(pk=task.pk).update(locked_at=timezone.now() - timezone.timedelta(seconds=120))
+        self.assertEqual([row[0] for row in queue.claim(1)], [task.pk])
+
+    @override_settings(ADS_TASKS_LEASE=60)
+    def test_results_after_lost_lease_are_dropped(self):
+        task = queue.enqueue('ads.tests.record_call', {'value': 'e'})
+        [(pk, name, kwargs, attempts, max_attempts)] = queue.claim(1)
+        Task.objects.filter(pk=pk).update(locked_at=timezone.now() - timezone.timedelta(seconds=120))
+        [(_, _, _, reclaimed, _)] = queue.claim(1)
+        self.assertEqual(reclaimed, attempts + 1)
+        with self.assertLogs('ads.tasks', 'WARNING') as logs:
+            self.assertFalse(queue.complete(pk, attempts))
+            self.assertFalse(queue.fail(pk, attempts, max_attempts, 'сбой'))
+        self.assertEqual(len(logs.records), 2)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.last_error), ('running', ''))
+        # Результат нового исполнителя записывается.
+        self.assertTrue(queue.complete(pk, reclaimed))
+        self.assertFalse(Task.objects.exists())
+
+    def test_ad_save_defers_similarity_indexing(self):
+        user = User.objects.create_user(username='taskuser', password='password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            ad = Ad.objects.create(
+                user=user, title='Гитара', description='Гитара с чехлом.', category='Музыка', condition='Б/У'
+            )
+        self.assertFalse(AdTerm.objects.filter(ad=ad).exists())
+        self.assertEqual(Task.objects.get(name='ads.tasks.index_ad_similarity').kwargs, {'ad_id': ad.pk})
+
+
+class TaskWorkerTest(TransactionTestCase):
+
+    def setUp(self):
+        task_calls.clear()
+
+    def test_thread_pool_drains_queue_with_retries(self):
+        for value in range(5):
+            queue.enqueue('ads.tests.record_call', {'value': value, 'fail_times': 1 if value == 0 else 0})
+        out = StringIO()
+        with override_settings(ADS_TASKS_RETRY_DELAY=0), self.assertLogs('ads.tasks', 'WARNING'):
+            call_command('run_tasks', '--once', '--workers', '3', stdout=out)
+        self.assertIn('Выполнено задач: 5, с ошибкой: 1.', out.getvalue())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(sorted(task_calls), [0, 0, 1, 2, 3, 4])
+
+    def test_worker_indexes_saved_ads(self):
+        user = User.objects.create_user(username='workeruser', password='password123')
+        ad = Ad.objects.create(
+            user=user, title='Гитара', description='Гитара с чехлом.', category='Музыка', condition='Б/У'
+        )
+        self.assertFalse(AdTerm.objects.filter(ad=ad).exists())
+        call_command('run_tasks', '--once', '--workers', '1', stdout=StringIO())
+        self.assertTrue(AdTerm.objects.filter(ad=ad).exists())
+        self.assertFalse(Task.objects.exists())
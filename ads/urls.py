@@ -1,11 +1,24 @@
 from django.urls import path
 from .views import (ad_list_view, 
+                    ad_list_async_view,
                     ad_create_view, 
                     ad_update_view, 
                     ad_delete_view, 
                     exchange_proposal_create_view,
+                    ad_autocomplete_view,
                     exchange_proposal_list_view,
-                    update_exchange_proposal_status_view,)
+                    exchange_proposal_list_async_view,
+                    update_exchange_proposal_status_view,
+                    bulk_update_exchange_proposal_status_view,
+                    cache_stats_view,
+                    inbox_counter_view,
+                    saved_search_create_view,
+                    saved_search_delete_view,
+                    feed_view,
+                    ad_api_list_view,
+                    ad_export_view,
+                    changes_view,
+                    barter_cycles_view,)
 
 app_name = 'ads'
 
@@ -15,6 +28,19 @@ urlpatterns = [
     path('ad/<int:pk>/edit/', ad_update_view, name='ad_update'),
     path('ad/<int:pk>/delete/', ad_delete_view, name='ad_delete'),
     path('ad/<int:ad_receiver_pk>/propose/', exchange_proposal_create_view, name='exchange_proposal_create'),
+    path('ad/autocomplete/', ad_autocomplete_view, name='ad_autocomplete'),
     path('proposals/', exchange_proposal_list_view, name='exchange_proposal_list'),
     path('proposals/<int:proposal_pk>/status/<str:new_status>/', update_exchange_proposal_status_view, name='exchange_proposal_update_status'),
+    path('async/', ad_list_async_view, name='ad_list_async'),
+    path('async/proposals/', exchange_proposal_list_async_view, name='exchange_proposal_list_async'),
+    path('proposals/status/bulk/', bulk_update_exchange_proposal_status_view, name='exchange_proposal_bulk_update_status'),
+    path('cache/stats/', cache_stats_view, name='cache_stats'),
+    path('inbox/counter/', inbox_counter_view, name='inbox_counter'),
+    path('api/ads/', ad_api_list_view, name='ad_api_list'),
+    path('api/ads/export.ndjson', ad_export_view, name='ad_export'),
+    path('api/changes.ndjson', changes_view, name='changes'),
+    path('proposals/cycles/', barter_cycles_view, name='barter_cycles'),
+    path('searches/save/', saved_search_create_view, name='saved_search_create'),
+    path('searches/<int:pk>/delete/', saved_search_delete_view, name='saved_search_delete'),
+    path('feed/', feed_view, name='feed'),
 ]
\ No newline at end of file
@@ -1,42 +1,120 @@
+from itertools import islice
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404 
-from django.http import HttpResponseForbidden, Http404 
+from django.http import HttpResponse, HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_POST
 from django.contrib import messages
-from .models import Ad, ExchangeProposal
-from .forms import AdForm, ExchangeProposalForm
-from django.core.paginator import Paginator
 from django.db.models import Q
+from .models import Ad, ArchivedProposal, Category, Condition, ExchangeProposal
+from .forms import AUTOCOMPLETE_PAGE_SIZE, AdForm, ExchangeProposalForm, offerable_ads
+from .search import search_ads
+from .pagination import CursorPaginator
+from .decorators import query_budget
+from .database import read_from_primary, replica_reads
+from .etags import ad_list_etag, async_condition, proposal_list_etag
+from . import api
+from . import changelog
+from . import inbox
+from . import matching
+from . import metrics
+from . import saved_searches
+from . import similarity
+from . import cache as ads_cache
+from .services import RESOLVED_STATUSES, soft_delete_ad, transition_proposal, transition_proposals
 
-def ad_list_view(request):
-    ads_list = Ad.objects.all().order_by('-created_at')
-    query = request.GET.get('q')
-    category_filter = request.GET.get('category')
-    condition_filter = request.GET.get('condition')
-    if query:
-        ads_list = ads_list.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
-
+def filtered_ads(filters):
+    ads_list = Ad.objects.select_related('user').order_by('-created_at', '-id')
+    query = filters.get('q')
+    category_filter = filters.get('category')
+    condition_filter = filters.get('condition')
     if category_filter:
-        ads_list = ads_list.filter(category__icontains=category_filter)
+        ads_list = ads_list.filter(category_ref__key=category_filter)
 
     if condition_filter:
-        ads_list = ads_list.filter(condition__icontains=condition_filter)
+        ads_list = ads_list.filter(condition_ref__key=condition_filter)
 
-    paginator = Paginator(ads_list, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    query_params = request.GET.copy()
-    if 'page' in query_params:
-        del query_params['page']
-    current_query_params_encoded = query_params.urlencode()
+    if query:
+        ads_list = search_ads(ads_list, query)
+    return ads_list
 
-    context = {
+def ad_list_context(filters, page_obj, categories, conditions):
+    current_query_params_encoded = urlencode(
+        {name: value for name, value in filters.items() if name != 'cursor'}
+    )
+    return {
         'page_obj': page_obj,
-        'current_query_params': current_query_params_encoded
+        'current_query_params': current_query_params_encoded,
+        'filters': filters,
+        'categories': categories,
+        'conditions': conditions,
     }
-    return render(request, 'ads/ad_list.html', context)
 
+@query_budget(6)
+@replica_reads
+@condition(etag_func=ad_list_etag)
+def ad_list_view(request):
+    filters = ads_cache.normalize_list_params(request.GET)
+    cache_key = None
+    if not request.user.is_authenticated:
+        cache_key = ads_cache.ad_list_cache_key(filters)
+        content = ads_cache.get_page(cache_key)
+        if content is not None:
+            return HttpResponse(content)
+        # Страница ляжет в кэш под текущим поколением и уйдет с ETag этого поколения:
+        # отстающая реплика закрепила бы в них версию до записи.
+        read_from_primary()
+
+    # Список показывает ad.excerpt: полное описание не читается.
+    page_obj = CursorPaginator(filtered_ads(filters).defer('description'), 5).get_page(filters.get('cursor'))
+    context = ad_list_context(
+        filters,
+        page_obj,
+        Category.objects.filter(ad_count__gt=0),
+        Condition.objects.filter(ad_count__gt=0),
+    )
+    if request.user.is_authenticated:
+        context['inbox'] = inbox.get_counters(request.user)
+    response = render(request, 'ads/ad_list.html', context)
+    if cache_key:
+        ads_cache.set_page(cache_key, response.content)
+    return response
+
+@query_budget(6)
+@replica_reads
+@async_condition(ad_list_etag)
+async def ad_list_async_view(request):
+    # request.user после auser() уже загружен и не обращается к базе синхронно.
+    request.user = await request.auser()
+    filters = ads_cache.normalize_list_params(request.GET)
+    cache_key = None
+    if not request.user.is_authenticated:
+        cache_key = await ads_cache.aad_list_cache_key(filters)
+        content = await ads_cache.aget_page(cache_key)
+        if content is not None:
+            return HttpResponse(content)
+        # Страница ляжет в кэш под текущим поколением и уйдет с ETag этого поколения:
+        # отстающая реплика закрепила бы в них версию до записи.
+        read_from_primary()
+
+    page_obj = await CursorPaginator(filtered_ads(filters).defer('description'), 5).aget_page(filters.get('cursor'))
+    context = ad_list_context(
+        filters,
+        page_obj,
+        [category async for category in Category.objects.filter(ad_count__gt=0)],
+        [condition async for condition in Condition.objects.filter(ad_count__gt=0)],
+    )
+    if request.user.is_authenticated:
+        context['inbox'] = await inbox.aget_counters(request.user)
+    response = render(request, 'ads/ad_list.html', context)
+    if cache_key:
+        await ads_cache.aset_page(cache_key, response.content)
+    return response
+
+@query_budget(3)
 @login_required
 def ad_create_view(request):
     if request.method == 'POST':
@@ -50,10 +128,11 @@ def ad_create_view(request):
         form = AdForm()
     return render(request, 'ads/ad_form.html', {'form': form})
 
+@query_budget(3)
 @login_required
 def ad_update_view(request, pk):
     ad = get_object_or_404(Ad, pk=pk)
-    if ad.user != request.user:
+    if ad.user_id != request.user.pk:
         return HttpResponseForbidden("Вы не можете редактировать это объявление.")
     if request.method == 'POST':
         form = AdForm(request.POST, request.FILES or None, instance=ad)
@@ -70,15 +149,16 @@ def ad_update_view(request, pk):
         }
     return render(request, 'ads/ad_form.html', context)
 
+@query_budget(20)
 @login_required
 def ad_delete_view(request, pk):
-    ad = get_object_or_404(Ad, pk=pk)
+    ad = get_object_or_404(Ad.objects.select_related('user'), pk=pk)
     if ad.user != request.user:
         return HttpResponseForbidden("Вы не можете удалить это объявление.")
     
     if request.method == 'POST':
         ad_title = ad.title
-        ad.delete()
+        soft_delete_ad(request.user, ad)
         messages.success(request, f'Объявление "{ad_title}" успешно удалено.')
         return redirect('ads:ad_list')
     context = {
@@ -87,16 +167,16 @@ def ad_delete_view(request, pk):
     }
     return render(request, 'ads/ad_confirm_delete.html', context)
 
+@query_budget(8)
 @login_required
 def exchange_proposal_create_view(request, ad_receiver_pk):
-    ad_receiver = get_object_or_404(Ad, pk=ad_receiver_pk)
+    ad_receiver = get_object_or_404(Ad.objects.select_related('user'), pk=ad_receiver_pk)
     if ad_receiver.user == request.user:
         messages.error(request, "Вы не можете сделать предложение обмена для своего собственного объявления.")
         return redirect('ads:ad_list')
-    user_ads_count = Ad.objects.filter(user=request.user).count()
-    if user_ads_count == 0:
-        messages.warning(request, "У вас нет объявлений, которые можно предложить для обмена. Сначала создайте объявление.")
-        return redirect('ads:ad_create')
+    if ad_receiver.exchanged_at:
+        messages.error(request, "Это объявление уже обменено.")
+        return redirect('ads:ad_list')
     if request.method == 'POST':
         form = ExchangeProposalForm(request.POST, user=request.user)
         if form.is_valid():
@@ -107,41 +187,253 @@ def exchange_proposal_create_view(request, ad_receiver_pk):
             return redirect('ads:ad_list') 
     else:
             form = ExchangeProposalForm(user=request.user)
+    # Первая страница выбора нужна форме в любом случае; отдельный COUNT не нужен.
+    if not form.preview_ads:
+        messages.warning(request, "У вас нет объявлений, которые можно предложить для обмена. Сначала создайте объявление.")
+        return redirect('ads:ad_create')
 
+    weights = similarity.query_weights(ad_receiver)
+    available = Q(ad__exchanged_at__isnull=True)
     context = {
     'form': form,
     'ad_receiver': ad_receiver,
+    'suggested_ads': similarity.rank(weights, 3, available & Q(ad__user=request.user)),
+    'similar_ads': similarity.rank(
+        weights, 5, available & ~Q(ad__user=request.user) & ~Q(ad=ad_receiver)
+    ).select_related('user'),
     }
     return render(request, 'ads/exchange_proposal_form.html', context)
 
+@query_budget(3)
+@login_required
+@replica_reads
+def ad_autocomplete_view(request):
+    """Страница необмененных объявлений пользователя для выбора в ExchangeProposalForm."""
+    ads_list = offerable_ads(request.user)
+    query = ' '.join(request.GET.get('q', '').split())
+    if query:
+        ads_list = search_ads(ads_list, query)
+    page_obj = CursorPaginator(
+        ads_list.only('id', 'title', 'created_at'), AUTOCOMPLETE_PAGE_SIZE
+    ).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [{'id': ad.pk, 'title': ad.title} for ad in page_obj],
+        'next': page_obj.next_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+def user_proposals(user):
+    proposals = ExchangeProposal.objects.select_related('ad_sender__user', 'ad_receiver__user').filter(
+        ad_sender__deleted_at__isnull=True, ad_receiver__deleted_at__isnull=True
+    )
+    sent_proposals = proposals.filter(ad_sender__user=user).order_by('-created_at', '-id')
+    received_proposals = proposals.filter(ad_receiver__user=user).order_by('-created_at', '-id')
+    return sent_proposals, received_proposals
+
+def user_archived_proposals(user):
+    archived = ArchivedProposal.objects.select_related('sender_user', 'receiver_user')
+    sent_proposals = archived.filter(sender_user=user).order_by('-created_at', '-id')
+    received_proposals = archived.filter(receiver_user=user).order_by('-created_at', '-id')
+    return sent_proposals, received_proposals
+
+def show_archived(request):
+    # Архив читается только по запросу: обычный список не трогает архивные таблицы.
+    return request.GET.get('archived') == '1'
+
+@query_budget(8)
 @login_required
+@replica_reads
+@condition(etag_func=proposal_list_etag)
 def exchange_proposal_list_view(request):
-    user = request.user
-    sent_proposals = ExchangeProposal.objects.filter(ad_sender__user=user).order_by('-created_at')
-    received_proposals = ExchangeProposal.objects.filter(ad_receiver__user=user).order_by('-created_at')
+    inbox.mark_seen(request.user)
+    sent_proposals, received_proposals = user_proposals(request.user)
+    sent_page = CursorPaginator(sent_proposals, 10).get_page(request.GET.get('sent_cursor'))
+    received_page = CursorPaginator(received_proposals, 10).get_page(request.GET.get('received_cursor'))
+    context = {
+        'sent_proposals': sent_page,
+        'received_proposals': received_page,
+    }
+    if show_archived(request):
+        archived_sent, archived_received = user_archived_proposals(request.user)
+        context['archived_sent'] = CursorPaginator(archived_sent, 10).get_page(request.GET.get('archived_sent_cursor'))
+        context['archived_received'] = CursorPaginator(archived_received, 10).get_page(
+            request.GET.get('archived_received_cursor')
+        )
+    return render(request, 'ads/exchange_proposal_list.html', context)
+
+@query_budget(8)
+@login_required
+@replica_reads
+@async_condition(proposal_list_etag)
+async def exchange_proposal_list_async_view(request):
+    request.user = await request.auser()
+    await inbox.amark_seen(request.user)
+    sent_proposals, received_proposals = user_proposals(request.user)
+    sent_page = await CursorPaginator(sent_proposals, 10).aget_page(request.GET.get('sent_cursor'))
+    received_page = await CursorPaginator(received_proposals, 10).aget_page(request.GET.get('received_cursor'))
     context = {
-        'sent_proposals': sent_proposals,
-        'received_proposals': received_proposals,
+        'sent_proposals': sent_page,
+        'received_proposals': received_page,
     }
+    if show_archived(request):
+        archived_sent, archived_received = user_archived_proposals(request.user)
+        context['archived_sent'] = await CursorPaginator(archived_sent, 10).aget_page(
+            request.GET.get('archived_sent_cursor')
+        )
+        context['archived_received'] = await CursorPaginator(archived_received, 10).aget_page(
+            request.GET.get('archived_received_cursor')
+        )
     return render(request, 'ads/exchange_proposal_list.html', context)
 
+@query_budget(14)
 @login_required
 def update_exchange_proposal_status_view(request, proposal_pk, new_status):
-    proposal = get_object_or_404(ExchangeProposal, pk=proposal_pk)
+    if new_status not in RESOLVED_STATUSES:
+        raise Http404("Недопустимый статус")
 
-    if proposal.ad_receiver.user != request.user:
-        return redirect('ads:exchange_proposal_list')
-    
-    if proposal.status != 'pending':
-        return redirect('ads:exchange_proposal_list')
-    
-    valid_new_statuses = ['accepted', 'rejected']
-    if new_status not in valid_new_statuses:
-        raise Http404("Недопустимый статус") 
-    
     if request.method == 'POST':
-        proposal.status = new_status
-        proposal.save()
-        return redirect('ads:exchange_proposal_list')
+        if not transition_proposal(request.user, proposal_pk, new_status):
+            messages.warning(request, "Предложение уже обработано или недоступно.")
+    return redirect('ads:exchange_proposal_list')
+
+@query_budget(9)
+@login_required
+@require_POST
+def bulk_update_exchange_proposal_status_view(request):
+    new_status = request.POST.get('status')
+    if new_status not in RESOLVED_STATUSES:
+        raise Http404("Недопустимый статус")
+    proposal_ids = [pk for pk in request.POST.getlist('proposal_ids') if pk.isdigit()]
+    changed = transition_proposals(request.user, proposal_ids, new_status)
+    messages.success(request, f"Обработано предложений: {len(changed)}.")
+    return redirect('ads:exchange_proposal_list')
+
+@query_budget(7)
+@login_required
+@require_POST
+def saved_search_create_view(request):
+    filters = ads_cache.normalize_list_params(request.POST)
+    filters.pop('cursor', None)
+    try:
+        _, created = saved_searches.save_search(request.user, filters)
+    except ValueError as exc:
+        messages.error(request, str(exc))
     else:
-        return redirect('ads:exchange_proposal_list')
\ No newline at end of file
+        if created:
+            messages.success(request, "Поиск сохранен: новые объявления по нему появятся в ленте.")
+        else:
+            messages.info(request, "Этот поиск уже сохранен.")
+    return redirect('ads:feed')
+
+@query_budget(5)
+@login_required
+@require_POST
+def saved_search_delete_view(request, pk):
+    # Записи ленты по этому поиску удаляются каскадом.
+    request.user.saved_searches.filter(pk=pk).delete()
+    return redirect('ads:feed')
+
+@query_budget(4)
+@login_required
+@replica_reads
+def feed_view(request):
+    """Лента "Новое для вас": объявления, найденные сохраненными поисками."""
+    context = {
+        'saved_searches': request.user.saved_searches.order_by('-created_at', '-id'),
+        'page_obj': CursorPaginator(saved_searches.feed_items(request.user), 10).get_page(request.GET.get('cursor')),
+    }
+    return render(request, 'ads/feed.html', context)
+
+@query_budget(3)
+@login_required
+def inbox_counter_view(request):
+    """Счетчики для значка: одна строка InboxCounter или кэш."""
+    return JsonResponse(inbox.get_counters(request.user))
+
+@query_budget(2)
+@staff_member_required
+def cache_stats_view(request):
+    return JsonResponse(ads_cache.stats())
+
+@query_budget(3 + matching.MAX_CYCLE_LENGTH)
+@login_required
+def barter_cycles_view(request):
+    try:
+        max_length = int(request.GET.get('length', matching.DEFAULT_CYCLE_LENGTH))
+    except ValueError:
+        max_length = matching.DEFAULT_CYCLE_LENGTH
+    max_length = max(matching.MIN_CYCLE_LENGTH, min(max_length, matching.MAX_CYCLE_LENGTH))
+    graph = matching.WantsGraph.load_around(request.user.pk, max_length)
+    cycles = sorted(islice(graph.cycles_from(request.user.pk, max_length), 20), key=len)
+    # Шаг цепочки — предложение участника следующему и предложение предыдущего ему:
+    # участник отдает объявление, о котором просил предыдущий.
+    context = {
+        'cycles': [
+            list(zip(proposals, proposals[-1:] + proposals[:-1]))
+            for proposals in matching.cycle_proposals(cycles)
+        ],
+        'max_length': max_length,
+        'lengths': range(matching.MIN_CYCLE_LENGTH, matching.MAX_CYCLE_LENGTH + 1),
+    }
+    return render(request, 'ads/barter_cycles.html', context)
+
+@query_budget(2)
+def ad_api_list_view(request):
+    filters = ads_cache.normalize_list_params(request.GET)
+    try:
+        fields = api.parse_fields(request.GET.get('fields'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    page_obj = CursorPaginator(
+        api.project(filtered_ads(filters), fields), api.parse_page_size(request.GET.get('per_page'))
+    ).get_page(filters.get('cursor'))
+    return JsonResponse({
+        'results': [api.serialize_row(row, fields) for row in page_obj],
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+@query_budget(2)
+def ad_export_view(request):
+    filters = ads_cache.normalize_list_params(request.GET)
+    try:
+        fields = api.parse_fields(request.GET.get('fields'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    response = StreamingHttpResponse(
+        api.stream_ndjson(filtered_ads(filters), fields), content_type='application/x-ndjson'
+    )
+    response['Content-Disposition'] = 'attachment; filename="ads.ndjson"'
+    return response
+
+def has_bearer_token(request, token):
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+def has_changes_access(request):
+    return has_bearer_token(request, settings.ADS_CHANGELOG_TOKEN) or request.user.is_staff
+
+@query_budget(5)
+def changes_view(request):
+    """Журнал изменений после курсора в NDJSON; следующий курсор — в заголовке X-Next-Cursor."""
+    if not has_changes_access(request):
+        return HttpResponseForbidden()
+    try:
+        position = changelog.parse_cursor(request.GET.get('cursor'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if changelog.cursor_expired(position):
+        return JsonResponse({'error': 'Курсор старше срока хранения журнала, нужна полная синхронизация.'}, status=410)
+    limit = changelog.parse_page_size(request.GET.get('limit'))
+    entries = changelog.entries_since(position, limit)
+    response = StreamingHttpResponse(changelog.stream_ndjson(entries), content_type='application/x-ndjson')
+    response['X-Next-Cursor'] = changelog.make_cursor(entries[-1]) if entries else request.GET.get('cursor', '')
+    response['X-Has-More'] = '1' if len(entries) == limit else '0'
+    return response
+
+@query_budget(2)
+def metrics_view(request):
+    # Задержки и число запросов по маршрутам — внутренние данные: открыты только по явной настройке.
+    if not (
+        settings.ADS_METRICS_PUBLIC or has_bearer_token(request, settings.ADS_METRICS_TOKEN) or request.user.is_staff
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ads.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,21 +50,29 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ads.database.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'base.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'ads.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Скомпилированные шаблоны хранятся в памяти процесса и при DEBUG;
+            # автоперезагрузчик сбрасывает их при изменении файлов шаблонов.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -73,10 +83,66 @@ WSGI_APPLICATION = 'base.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds so the PRAGMAs from
+# ADS_SQLITE_PRAGMAS run once per connection rather than once per request.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # Write lock at BEGIN: concurrent transactions wait for the busy timeout
+        # instead of failing when a deferred read transaction upgrades to write.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    }
+}
+
+# Optional read replica: a copy of the database kept up to date externally
+# (e.g. Litestream or LiteFS), path taken from ADS_REPLICA_DB. Views marked
+# with ads.database.replica_reads read from it, everything else uses default.
+# After a POST the user reads from default for ADS_REPLICA_STICKY_SECONDS.
+# Without ADS_REPLICA_DB the alias points at the primary file and is unused.
+
+ADS_REPLICA_DB = os.environ.get('ADS_REPLICA_DB')
+
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': ADS_REPLICA_DB or DATABASES['default']['NAME'],
+    'TEST': {'MIRROR': 'default'},
+    # Only read from: no write lock at BEGIN, and ADS_SQLITE_PRAGMAS are left
+    # to whatever keeps the replica file in sync.
+    'OPTIONS': {},
+}
+
+DATABASE_ROUTERS = ['ads.database.ReplicaRouter']
+
+ADS_READ_DATABASE = 'replica' if ADS_REPLICA_DB else None
+
+ADS_REPLICA_STICKY_SECONDS = 10
+
+# PRAGMAs applied to every new connection to the default SQLite database,
+# see ads/database.py. WAL
+# lets readers proceed while a writer holds the lock; NORMAL sync is durable
+# across application crashes in WAL mode. cache_size is in KiB when negative.
+
+ADS_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem is enough for development and tests; in production point this at
+# Redis (django.core.cache.backends.redis.RedisCache) or memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -121,3 +187,82 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Ads full-text search backend (dotted path to a class from ads.search).
+# None picks a backend matching the database vendor.
+
+ADS_SEARCH_BACKEND = None
+
+# Cache alias and timeout (seconds) for rendered ad list pages, see ads/cache.py.
+
+ADS_CACHE_ALIAS = 'default'
+
+ADS_LIST_CACHE_TIMEOUT = 300
+
+# Request metrics exposed at /metrics, see ads/metrics.py. SQL and template
+# timing is collected for ADS_METRICS_SAMPLE_RATE of requests; queries slower
+# than ADS_SLOW_QUERY_MS are logged to the 'ads.performance' logger. /metrics
+# is served to staff users and, when ADS_METRICS_TOKEN is set, to requests with
+# "Authorization: Bearer <token>"; ADS_METRICS_PUBLIC opens it to everyone.
+
+ADS_METRICS_SAMPLE_RATE = 1.0
+
+ADS_SLOW_QUERY_MS = 200
+
+ADS_METRICS_TOKEN = None
+
+ADS_METRICS_PUBLIC = False
+
+# Background tasks, see ads/queue.py; workers run with `manage.py run_tasks`.
+# ADS_TASKS_EAGER executes tasks inline at .delay() (for tests). A failed task
+# is retried after ADS_TASKS_RETRY_DELAY * 2^(attempt - 1) seconds, capped at
+# ADS_TASKS_MAX_RETRY_DELAY; a task running longer than ADS_TASKS_LEASE
+# seconds is assumed abandoned by a dead worker and claimed again.
+
+ADS_TASKS_EAGER = False
+
+ADS_TASKS_RETRY_DELAY = 10
+
+ADS_TASKS_MAX_RETRY_DELAY = 3600
+
+ADS_TASKS_LEASE = 600
+
+# Deleted ads are only marked with deleted_at; `manage.py purge_deleted_ads`
+# (run from cron) removes rows marked more than ADS_PURGE_DELETED_AFTER seconds
+# ago, ADS_PURGE_BATCH_SIZE rows per DELETE with ADS_PURGE_PAUSE seconds between.
+
+ADS_PURGE_DELETED_AFTER = 7 * 24 * 3600
+
+ADS_PURGE_BATCH_SIZE = 1000
+
+ADS_PURGE_PAUSE = 0.05
+
+# `manage.py archive_barter` moves proposals resolved and ads exchanged more
+# than ADS_ARCHIVE_AFTER seconds ago to the archive tables (see ads/archive.py),
+# ADS_ARCHIVE_CHUNK_SIZE rows per transaction with ADS_ARCHIVE_PAUSE seconds between.
+
+ADS_ARCHIVE_AFTER = 180 * 24 * 3600
+
+ADS_ARCHIVE_CHUNK_SIZE = 1000
+
+ADS_ARCHIVE_PAUSE = 0.05
+
+# Change log of Ad and ExchangeProposal for downstream consumers (see
+# ads/changelog.py), read from /api/changes.ndjson or `manage.py export_changes`.
+# The endpoint requires a staff session or "Authorization: Bearer
+# <ADS_CHANGELOG_TOKEN>". Entries younger than ADS_CHANGELOG_SETTLE seconds are
+# not returned yet, so transactions still open cannot commit behind a cursor.
+# An entry is stamped when written, not at commit: with concurrent writers
+# (not SQLite) the window must outlast the longest writing transaction.
+# `manage.py compact_changelog` drops entries older than
+# ADS_CHANGELOG_COMPACT_AFTER seconds that a newer entry for the same object
+# supersedes, and deletions older than ADS_CHANGELOG_TOMBSTONE_RETENTION seconds;
+# cursors older than that are rejected and the consumer must resync in full.
+
+ADS_CHANGELOG_TOKEN = None
+
+ADS_CHANGELOG_SETTLE = 2
+
+ADS_CHANGELOG_COMPACT_AFTER = 7 * 24 * 3600
+
+ADS_CHANGELOG_TOMBSTONE_RETENTION = 30 * 24 * 3600